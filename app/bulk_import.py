@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Массовый импорт твитов, лайков и подписок из NDJSON.
+
+Каждая строка — объект с полем "type" ("tweet", "like" или "follow");
+для выгрузок из app.export тип можно не указывать, а задать параметром kind.
+Записи проверяются моделями из app/schemas.py и вставляются пачками
+многострочными INSERT. Если пачка нарушает ограничения БД, она повторяется
+построчно в savepoint-ах, чтобы сообщить об ошибке конкретной строки.
+Твиты должны идти в потоке раньше лайков, которые на них ссылаются.
+
+Запуск: python -m app.bulk_import data.ndjson [--kind tweets]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+from collections import Counter, defaultdict
+from typing import AsyncIterator
+
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import Table, func, insert, select
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .database import SessionLocal
+from .export import ExportKind
+from .invalidation import publish
+from .like_counters import add_like_counts
+from .models import Follower, Like, Tweet
+from .schemas import ImportRecord
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "5000"))
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "1000"))
+IMPORT_READ_SIZE = 1024 * 1024
+
+# Порядок вставки внутри пачки учитывает внешние ключи
+IMPORT_TABLES: dict[str, Table] = {
+    "tweet": Tweet.__table__,
+    "follow": Follower.__table__,
+    "like": Like.__table__,
+}
+# Какие кэши сбрасывать после вставки записей каждого типа
+IMPORT_TOPICS = {"tweet": "feed", "follow": "user", "like": "tweet"}
+KIND_TYPES = {
+    ExportKind.tweets: "tweet",
+    ExportKind.likes: "like",
+    ExportKind.follows: "follow",
+}
+
+record_adapter: TypeAdapter = TypeAdapter(ImportRecord)
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """
+    Разбиение потока байт на строки
+    :param chunks: Асинхронный итератор блоков байт
+    :return: Асинхронный итератор строк без перевода строки
+    """
+    tail = b""
+    async for chunk in chunks:
+        lines = (tail + chunk).split(b"\n")
+        tail = lines.pop()
+        for line in lines:
+            yield line
+    if tail:
+        yield tail
+
+
+class BulkImporter:
+    """
+    Накопление, проверка и пакетная вставка импортируемых записей
+    """
+
+    def __init__(
+        self,
+        db: AsyncSession,
+        default_type: str | None = None,
+        batch_size: int = IMPORT_BATCH_SIZE,
+    ):
+        self.db = db
+        self.default_type = default_type
+        self.batch_size = batch_size
+        self.imported: Counter = Counter()
+        self.errors: list[dict] = []
+        self.error_count = 0
+        self._batch: dict[str, list[tuple[int, dict]]] = defaultdict(list)
+        self._batch_len = 0
+        self._explicit_ids: set[str] = set()
+
+    def _error(self, line_no: int, message: str):
+        self.error_count += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append({"line": line_no, "error": message})
+
+    async def add_line(self, line_no: int, line: bytes):
+        """
+        Проверка строки и добавление записи в текущую пачку
+        :param line_no: Номер строки (для отчета об ошибках)
+        :param line: Строка NDJSON
+        :return: Ничего не возвращает
+        """
+        if not line.strip():
+            return
+        try:
+            data = json.loads(line)
+            if self.default_type and isinstance(data, dict):
+                data.setdefault("type", self.default_type)
+            record = record_adapter.validate_python(data)
+        except (ValueError, ValidationError) as exc:
+            self._error(line_no, str(exc))
+            return
+
+        row = record.model_dump(exclude={"type"}, exclude_none=True)
+        if "id" in row:
+            self._explicit_ids.add(record.type)
+        self._batch[record.type].append((line_no, row))
+        self._batch_len += 1
+
+        if self._batch_len >= self.batch_size:
+            await self.flush()
+
+    async def _count_likes(self, record_type: str, rows: list[dict]):
+        if record_type == "like":
+            await add_like_counts(self.db, Counter(row["tweet_id"] for row in rows))
+
+    async def _insert_rows(self, record_type: str, rows: list[tuple[int, dict]]):
+        table = IMPORT_TABLES[record_type]
+        # executemany требует одинакового набора колонок
+        groups: dict[tuple, list[tuple[int, dict]]] = defaultdict(list)
+        for line_no, row in rows:
+            groups[tuple(sorted(row))].append((line_no, row))
+
+        for group in groups.values():
+            try:
+                async with self.db.begin_nested():
+                    await self.db.execute(insert(table), [row for _, row in group])
+                    await self._count_likes(record_type, [row for _, row in group])
+                self.imported[record_type] += len(group)
+                continue
+            except DBAPIError:
+                pass
+
+            # Пачка не прошла: повторяем построчно, чтобы найти ошибочные строки
+            for line_no, row in group:
+                try:
+                    async with self.db.begin_nested():
+                        await self.db.execute(insert(table), [row])
+                        await self._count_likes(record_type, [row])
+                    self.imported[record_type] += 1
+                except DBAPIError as exc:
+                    self._error(line_no, str(exc.orig))
+
+    async def flush(self):
+        """
+        Вставка накопленной пачки и фиксация транзакции
+        :return: Ничего не возвращает
+        """
+        if not self._batch_len:
+            return
+        for record_type in IMPORT_TABLES:
+            rows = self._batch.pop(record_type, None)
+            if rows:
+                await self._insert_rows(record_type, rows)
+                publish(self.db, IMPORT_TOPICS[record_type])
+        await self.db.commit()
+
+        self._batch_len = 0
+        logging.info(
+            "Импорт: загружено %s, ошибок %s", dict(self.imported), self.error_count
+        )
+
+    async def finish(self) -> dict:
+        """
+        Завершение импорта: вставка остатка и сдвиг последовательностей id
+        :return: Отчет об импорте
+        """
+        await self.flush()
+
+        # Записи с явными id не продвигают последовательности
+        for record_type in self._explicit_ids:
+            table = IMPORT_TABLES[record_type]
+            await self.db.execute(
+                select(
+                    func.setval(
+                        func.pg_get_serial_sequence(table.name, "id"),
+                        select(
+                            func.coalesce(func.max(table.c.id), 1)
+                        ).scalar_subquery(),
+                    )
+                )
+            )
+        await self.db.commit()
+
+        return {
+            "imported": dict(self.imported),
+            "error_count": self.error_count,
+            "errors": self.errors,
+        }
+
+
+async def import_ndjson(
+    chunks: AsyncIterator[bytes], db: AsyncSession, default_type: str | None = None
+) -> dict:
+    """
+    Импорт потока NDJSON
+    :param chunks: Асинхронный итератор блоков байт
+    :param db: Асинхронная сессия базы данных
+    :param default_type: Тип записей, у которых не указано поле "type"
+    :return: Отчет об импорте
+    """
+    importer = BulkImporter(db, default_type)
+    line_no = 0
+    async for line in iter_lines(chunks):
+        line_no += 1
+        await importer.add_line(line_no, line)
+    return await importer.finish()
+
+
+async def read_file(file) -> AsyncIterator[bytes]:
+    while chunk := file.read(IMPORT_READ_SIZE):
+        yield chunk
+
+
+async def import_file(file, default_type: str | None) -> dict:
+    async with SessionLocal() as db:
+        return await import_ndjson(read_file(file), db, default_type)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Массовый импорт из NDJSON")
+    parser.add_argument("input", nargs="?", help="Файл; по умолчанию — stdin")
+    parser.add_argument(
+        "--kind",
+        choices=[kind.value for kind in ExportKind],
+        help="Тип записей без поля type (формат app.export)",
+    )
+    args = parser.parse_args()
+
+    default_type = KIND_TYPES[ExportKind(args.kind)] if args.kind else None
+    if args.input:
+        with open(args.input, "rb") as input_file:
+            report = asyncio.run(import_file(input_file, default_type))
+    else:
+        report = asyncio.run(import_file(sys.stdin.buffer, default_type))
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
@@ -0,0 +1,338 @@
+"""
+Внутрипроцессные кэши с ограничением размера, однократной загрузкой ключа
+(single-flight) и счетчиками для мониторинга.
+"""
+
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Hashable,
+    Iterable,
+    Iterator,
+    Protocol,
+)
+
+
+class Cache(Protocol):
+    """
+    Общий интерфейс кэшей реестра (AsyncLRUCache, TimelineCache)
+    """
+
+    name: str
+    ttl: float | None
+    snapshot: "SnapshotSection | None"
+
+    def __len__(self) -> int: ...
+
+    def clear(self) -> None: ...
+
+    def on_invalidation(self, keys: list[str] | None) -> None: ...
+
+    def snapshot_items(self) -> Iterator[tuple[Hashable, bytes]]: ...
+
+    def attach_snapshot(self, buffer: memoryview, entries: dict) -> None: ...
+
+    def stats(self) -> dict: ...
+
+
+# Все созданные кэши по имени — для эндпоинта статистики и снимка
+caches: dict[str, Cache] = {}
+
+
+def _load_json(view: memoryview) -> Any:
+    return json.loads(bytes(view))
+
+
+class SnapshotSection:
+    """
+    Записи одного кэша в снимке на диске (см. cache_snapshot.py).
+    Значение декодируется из буфера (mmap) только при первом обращении
+    к ключу и после этого удаляется из секции
+    """
+
+    def __init__(
+        self,
+        buffer: memoryview,
+        entries: dict[Hashable, tuple[int, int]],
+        decode: Callable[[memoryview], Any],
+    ):
+        self._buffer = buffer
+        self._entries = entries
+        self._decode = decode
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def pop(self, key: Hashable) -> Any | None:
+        position = self._entries.pop(key, None)
+        if position is None:
+            return None
+        offset, length = position
+        return self._decode(self._buffer[offset : offset + length])
+
+    def discard(self, key: Hashable):
+        self._entries.pop(key, None)
+
+    def raw_items(self) -> Iterator[tuple[Hashable, bytes]]:
+        for key, (offset, length) in self._entries.items():
+            yield key, bytes(self._buffer[offset : offset + length])
+
+
+class _LeaderCancelled(Exception):
+    """Загрузка, на которую ожидали другие запросы, была отменена"""
+
+
+class AsyncLRUCache:
+    """
+    Ограниченный LRU-кэш с read-through загрузкой.
+    Параллельные промахи по одному ключу выполняют загрузку один раз,
+    остальные запросы ждут ее результат. С ttl значения устаревают
+    через ttl секунд после записи
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_size: int,
+        key_type: Callable = str,
+        ttl: float | None = None,
+    ):
+        self.name = name
+        self.max_size = max_size
+        self.key_type = key_type
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        # Ключ -> момент устаревания (только при заданном ttl)
+        self._expires: dict[Hashable, float] = {}
+        self._inflight: dict[Hashable, asyncio.Future] = {}
+        # Ключи, инвалидированные во время загрузки: результат нельзя сохранять
+        self._stale: set[Hashable] = set()
+        # Ключ -> число идущих пакетных загрузок (get_many_or_load) и ключи,
+        # инвалидированные во время них
+        self._batch_loading: dict[Hashable, int] = {}
+        self._batch_stale: set[Hashable] = set()
+        # Еще не прочитанные записи снимка, загруженного при старте
+        self.snapshot: SnapshotSection | None = None
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0
+        self.evictions = 0
+        self.restored = 0
+        caches[name] = self
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _contains(self, key: Hashable) -> bool:
+        if key not in self._data:
+            return self._restore(key)
+        if self.ttl is not None and self._expires[key] <= time.monotonic():
+            del self._data[key]
+            del self._expires[key]
+            return False
+        return True
+
+    def _restore(self, key: Hashable) -> bool:
+        if self.snapshot is None:
+            return False
+        value = self.snapshot.pop(key)
+        if value is None:
+            return False
+        self.set(key, value)
+        self.restored += 1
+        return True
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        if self._contains(key):
+            self._data.move_to_end(key)
+            return self._data[key]
+        return default
+
+    def set(self, key: Hashable, value: Any):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if self.ttl is not None:
+            self._expires[key] = time.monotonic() + self.ttl
+        while len(self._data) > self.max_size:
+            evicted, _ = self._data.popitem(last=False)
+            self._expires.pop(evicted, None)
+            self.evictions += 1
+
+    async def get_or_load(
+        self, key: Hashable, loader: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """
+        Получение значения из кэша или его загрузка при промахе
+        :param key: Ключ
+        :param loader: Корутина-функция, загружающая значение
+        :return: Значение
+        """
+        while True:
+            if self._contains(key):
+                self.hits += 1
+                self._data.move_to_end(key)
+                return self._data[key]
+
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                break
+
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(inflight)
+            except _LeaderCancelled:
+                # Загружавший запрос отменен — пробуем загрузить сами
+                continue
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await loader()
+        except BaseException as exc:
+            if isinstance(exc, asyncio.CancelledError):
+                future.set_exception(_LeaderCancelled())
+            else:
+                future.set_exception(exc)
+            # Исключение уже передано ожидающим; помечаем его как полученное
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+            stale = key in self._stale
+            self._stale.discard(key)
+
+        if not stale:
+            self.set(key, value)
+        future.set_result(value)
+        return value
+
+    async def get_many_or_load(
+        self,
+        keys: Iterable[Hashable],
+        loader: Callable[[list], Awaitable[dict]],
+    ) -> dict:
+        """
+        Получение значений по списку ключей; промахи загружаются одним
+        вызовом loader. Значение ключа, инвалидированного во время загрузки,
+        возвращается, но не сохраняется; остальные ключи пакета сохраняются
+        :param keys: Ключи
+        :param loader: Корутина-функция: список ключей -> словарь ключ -> значение
+        :return: Словарь ключ -> значение (ключи, которых нет, отсутствуют)
+        """
+        found = {}
+        missing = []
+        for key in keys:
+            if self._contains(key):
+                self._data.move_to_end(key)
+                found[key] = self._data[key]
+            else:
+                missing.append(key)
+        self.hits += len(found)
+        if not missing:
+            return found
+
+        self.misses += len(missing)
+        for key in missing:
+            self._batch_loading[key] = self._batch_loading.get(key, 0) + 1
+        stale = set()
+        try:
+            loaded = await loader(missing)
+        finally:
+            for key in missing:
+                if key in self._batch_stale:
+                    stale.add(key)
+                remaining = self._batch_loading[key] - 1
+                if remaining:
+                    self._batch_loading[key] = remaining
+                else:
+                    del self._batch_loading[key]
+                    self._batch_stale.discard(key)
+
+        for key, value in loaded.items():
+            if key not in stale:
+                self.set(key, value)
+        found.update(loaded)
+        return found
+
+    def invalidate(self, key: Hashable):
+        self.invalidations += 1
+        self._data.pop(key, None)
+        self._expires.pop(key, None)
+        if self.snapshot is not None:
+            self.snapshot.discard(key)
+        if key in self._inflight:
+            self._stale.add(key)
+        if key in self._batch_loading:
+            self._batch_stale.add(key)
+
+    def invalidate_many(self, keys: Iterable[Hashable]):
+        for key in keys:
+            self.invalidate(key)
+
+    def clear(self):
+        self.invalidations += 1
+        self._data.clear()
+        self._expires.clear()
+        self.snapshot = None
+        self._stale.update(self._inflight)
+        self._batch_stale.update(self._batch_loading)
+
+    def on_invalidation(self, keys: list[str] | None):
+        """
+        Обработчик событий шины инвалидации
+        :param keys: Строковые ключи или None для полного сброса
+        :return: Ничего не возвращает
+        """
+        if keys is None:
+            self.clear()
+        else:
+            self.invalidate_many(self.key_type(key) for key in keys)
+
+    def snapshot_items(self) -> Iterator[tuple[Hashable, bytes]]:
+        """
+        Записи для снимка на диске: ключ и значение в JSON, от давно
+        не читавшихся к последним; включает не прочитанные записи
+        загруженного снимка
+        :return: Итератор пар (ключ, байты)
+        """
+        if self.snapshot is not None:
+            yield from self.snapshot.raw_items()
+        for key in list(self._data):
+            if self._contains(key):
+                yield key, json.dumps(self._data[key]).encode()
+
+    def attach_snapshot(self, buffer: memoryview, entries: dict):
+        """
+        Подключение записей снимка (ключи — строки из заголовка снимка)
+        :param buffer: Буфер с данными снимка
+        :param entries: Ключ -> (смещение, длина)
+        :return: Ничего не возвращает
+        """
+        self.snapshot = SnapshotSection(
+            buffer,
+            {self.key_type(key): position for key, position in entries.items()},
+            _load_json,
+        )
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "invalidations": self.invalidations,
+            "evictions": self.evictions,
+            "restored": self.restored,
+            "snapshot": len(self.snapshot) if self.snapshot is not None else 0,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+        }
@@ -0,0 +1,253 @@
+"""
+Снимок горячих кэшей на диске для быстрого старта после перезапуска.
+
+При штатной остановке воркер записывает профили, тела твитов и ленты в
+файл CACHE_SNAPSHOT_PATH: заголовок (версии формата, момент снимка по
+часам БД, эпоха базы, ключи и смещения записей) и данные. Момент снимка
+берется до остановки слушателя шины инвалидации. Файл заменяется
+атомарно; при нескольких воркерах остается снимок последнего
+остановленного.
+
+При старте файл отображается в память (mmap), и записи подключаются к
+кэшам без чтения значений: значение декодируется при первом обращении
+к ключу. Затем по журналу cache_invalidations досылаются события,
+произошедшие с момента снимка (с запасом CACHE_SNAPSHOT_GRACE секунд на
+транзакции, не зафиксированные к моменту снимка), поэтому устаревшие
+записи снимка не отдаются. Снимок старше срока хранения журнала
+не используется. Не используется и снимок другой эпохи базы: init_db.py
+пересоздает таблицы (вместе с журналом) при каждом старте контейнера,
+и id начинаются заново.
+
+Кэша аутентифицированных пользователей в приложении нет (пользователь
+загружается на каждый запрос через RequestLoaders), поэтому в снимок
+он не входит; счетчики лайков с TTL в несколько секунд тоже не пишутся.
+"""
+
+import asyncio
+import json
+import logging
+import mmap
+import os
+import struct
+from datetime import datetime, timedelta
+from typing import NamedTuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .cache import caches
+from .database import SessionLocal
+from .invalidation import INVALIDATION_LOG_RETENTION, replay_invalidations
+
+# Пустое значение отключает снимок
+CACHE_SNAPSHOT_PATH = os.getenv("CACHE_SNAPSHOT_PATH", "/tmp/tweet-clone-caches.bin")
+CACHE_SNAPSHOT_GRACE = float(os.getenv("CACHE_SNAPSHOT_GRACE", "30"))
+# Кэши, попадающие в снимок
+SNAPSHOT_CACHES = ("profiles", "tweet_bodies", "timelines")
+
+SNAPSHOT_MAGIC = b"TWCACHE\0"
+SNAPSHOT_VERSION = 2
+# Увеличивать при изменении формата значений кэшей (format_tweet,
+# format_user_profile_response): снимок прошлой версии не загружается
+CACHE_PAYLOAD_VERSION = 2
+
+_HEADER = struct.Struct("<HI")  # версия формата, длина заголовка
+
+# Момент снимка и эпоха базы. Эпоха — oid базы и таблицы журнала
+# инвалидации: меняется, когда таблицы пересоздаются (init_db.py)
+_SNAPSHOT_STATE = text(
+    """
+    SELECT
+        clock_timestamp() AS watermark,
+        concat_ws(
+            ':',
+            (SELECT oid FROM pg_database WHERE datname = current_database()),
+            to_regclass('cache_invalidations')::oid
+        ) AS epoch
+    """
+)
+
+# Отображенный в память снимок; живет до конца процесса
+_mapped: mmap.mmap | None = None
+
+
+class SnapshotState(NamedTuple):
+    watermark: datetime
+    epoch: str
+
+
+async def read_snapshot_state(db: AsyncSession) -> SnapshotState:
+    """
+    Момент снимка по часам БД и эпоха базы
+    :param db: Асинхронная сессия базы данных
+    :return: Состояние для заголовка снимка
+    """
+    row = (await db.execute(_SNAPSHOT_STATE)).one()
+    return SnapshotState(row.watermark, row.epoch)
+
+
+def write_snapshot(path: str, state: SnapshotState, entries: dict) -> int:
+    """
+    Запись снимка в файл (атомарная замена)
+    :param path: Путь к файлу снимка
+    :param state: Момент снимка по часам БД и эпоха базы
+    :param entries: Имя кэша -> список пар (ключ, байты значения)
+    :return: Количество записей
+    """
+    sections: dict[str, dict[str, list[int]]] = {}
+    chunks = []
+    offset = 0
+    for name, items in entries.items():
+        section = sections[name] = {}
+        for key, data in items:
+            section[str(key)] = [offset, len(data)]
+            chunks.append(data)
+            offset += len(data)
+
+    header = json.dumps(
+        {
+            "payload_version": CACHE_PAYLOAD_VERSION,
+            "watermark": state.watermark.isoformat(),
+            "epoch": state.epoch,
+            "caches": sections,
+        }
+    ).encode()
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as snapshot_file:
+        snapshot_file.write(SNAPSHOT_MAGIC)
+        snapshot_file.write(_HEADER.pack(SNAPSHOT_VERSION, len(header)))
+        snapshot_file.write(header)
+        snapshot_file.writelines(chunks)
+    os.replace(tmp_path, path)
+    return sum(len(section) for section in sections.values())
+
+
+def open_snapshot(path: str) -> tuple[dict, mmap.mmap, memoryview] | None:
+    """
+    Отображение снимка в память и разбор заголовка
+    :param path: Путь к файлу снимка
+    :return: Заголовок, mmap и буфер данных или None, если снимка нет
+        или он другой версии
+    """
+    try:
+        with open(path, "rb") as snapshot_file:
+            mapped = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (FileNotFoundError, ValueError):
+        # ValueError — пустой файл
+        return None
+
+    start = len(SNAPSHOT_MAGIC) + _HEADER.size
+    if mapped[: len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+        mapped.close()
+        return None
+    version, header_size = _HEADER.unpack_from(mapped, len(SNAPSHOT_MAGIC))
+    if version != SNAPSHOT_VERSION:
+        mapped.close()
+        return None
+    header = json.loads(mapped[start : start + header_size])
+    if header["payload_version"] != CACHE_PAYLOAD_VERSION:
+        mapped.close()
+        return None
+    return header, mapped, memoryview(mapped)[start + header_size :]
+
+
+async def save_cache_snapshot(
+    state: SnapshotState, path: str = CACHE_SNAPSHOT_PATH
+) -> int:
+    """
+    Запись кэшей в снимок (при остановке воркера)
+    :param state: Момент снимка и эпоха базы (read_snapshot_state), прочитанные
+        до остановки слушателя шины инвалидации
+    :param path: Путь к файлу снимка
+    :return: Количество записей
+    """
+    # Значения собираются синхронно: между ключами кэш не меняется.
+    # Кэши с TTL (тела твитов с подписанными ссылками) не сохраняются:
+    # после подключения снимка срок записи отсчитывался бы заново
+    entries = {
+        name: list(caches[name].snapshot_items())
+        for name in SNAPSHOT_CACHES
+        if name in caches and caches[name].ttl is None
+    }
+    return await asyncio.to_thread(write_snapshot, path, state, entries)
+
+
+async def restore_cache_snapshot(
+    db: AsyncSession, path: str = CACHE_SNAPSHOT_PATH
+) -> int:
+    """
+    Подключение снимка к кэшам и досылка пропущенных инвалидаций.
+    Вызывается после подключения слушателя шины инвалидации
+    :param db: Асинхронная сессия базы данных
+    :param path: Путь к файлу снимка
+    :return: Количество подключенных записей
+    """
+    global _mapped
+
+    opened = await asyncio.to_thread(open_snapshot, path)
+    if opened is None:
+        return 0
+    header, mapped, buffer = opened
+
+    watermark = datetime.fromisoformat(header["watermark"])
+    current = await read_snapshot_state(db)
+    # Таблицы пересоздавались (или журнал за время простоя мог быть уже
+    # удален): события с момента снимка не восстановить
+    if header["epoch"] != current.epoch or current.watermark - watermark > timedelta(
+        seconds=INVALIDATION_LOG_RETENTION
+    ):
+        buffer.release()
+        mapped.close()
+        return 0
+
+    restored = 0
+    for name, entries in header["caches"].items():
+        cache = caches.get(name)
+        if cache is None or name not in SNAPSHOT_CACHES:
+            continue
+        cache.attach_snapshot(buffer, entries)
+        restored += len(entries)
+    _mapped = mapped
+
+    replayed = await replay_invalidations(
+        db, watermark - timedelta(seconds=CACHE_SNAPSHOT_GRACE)
+    )
+    logging.info(
+        "Снимок кэшей: записей %s, досланных инвалидаций %s", restored, replayed
+    )
+    return restored
+
+
+async def snapshot_state_job() -> SnapshotState | None:
+    if not CACHE_SNAPSHOT_PATH:
+        return None
+    try:
+        async with SessionLocal() as db:
+            return await read_snapshot_state(db)
+    except Exception:
+        logging.exception("Не удалось получить момент снимка кэшей")
+        return None
+
+
+async def save_job(state: SnapshotState | None):
+    if not CACHE_SNAPSHOT_PATH or state is None:
+        return
+    try:
+        saved = await save_cache_snapshot(state)
+        logging.info("Снимок кэшей записан: %s записей", saved)
+    except Exception:
+        logging.exception("Не удалось записать снимок кэшей")
+
+
+async def restore_job() -> int:
+    if not CACHE_SNAPSHOT_PATH:
+        return 0
+    try:
+        async with SessionLocal() as db:
+            return await restore_cache_snapshot(db)
+    except Exception:
+        logging.exception("Не удалось загрузить снимок кэшей")
+        for name in SNAPSHOT_CACHES:
+            if name in caches:
+                caches[name].clear()
+        return 0
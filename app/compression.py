@@ -0,0 +1,160 @@
+"""
+Сжатие ответов API с выбором алгоритма по Accept-Encoding (zstd, br, gzip).
+
+Ответы меньше COMPRESSION_MIN_SIZE и потоковые ответы не сжимаются.
+Для горячих путей (лента) уже сжатые байты кэшируются по хэшу тела:
+повторное чтение неизменившейся страницы не тратит CPU на сжатие.
+"""
+
+import gzip
+import hashlib
+import os
+from typing import Callable
+
+from .cache import AsyncLRUCache
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - зависит от окружения
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - зависит от окружения
+    zstandard = None
+
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSED_CACHE_SIZE = int(os.getenv("COMPRESSED_CACHE_SIZE", "128"))
+COMPRESSED_CACHE_PATHS = ("/api/tweets",)
+
+COMPRESSIBLE_TYPES = (b"application/json", b"text/", b"application/x-ndjson")
+
+compressors: dict[str, Callable[[bytes], bytes]] = {}
+if zstandard is not None:
+    _zstd = zstandard.ZstdCompressor(level=3)
+    compressors["zstd"] = _zstd.compress
+if brotli is not None:
+    compressors["br"] = lambda data: brotli.compress(data, quality=4)
+compressors["gzip"] = lambda data: gzip.compress(data, compresslevel=5, mtime=0)
+
+# Порядок предпочтения сервера при равных q
+PREFERRED_ENCODINGS = [name for name in ("zstd", "br", "gzip") if name in compressors]
+
+compressed_cache = AsyncLRUCache("compressed_responses", COMPRESSED_CACHE_SIZE)
+
+
+def choose_encoding(accept_encoding: str) -> str | None:
+    """
+    Выбор алгоритма сжатия по заголовку Accept-Encoding
+    :param accept_encoding: Значение заголовка
+    :return: Имя алгоритма или None, если сжимать нечем
+    """
+    weights: dict[str, float] = {}
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        weights[name.strip()] = quality
+
+    wildcard = weights.get("*", 0.0)
+    best, best_quality = None, 0.0
+    for name in PREFERRED_ENCODINGS:
+        quality = weights.get(name, wildcard)
+        if quality > best_quality:
+            best, best_quality = name, quality
+    return best
+
+
+def compress_body(body: bytes, encoding: str, cacheable: bool) -> bytes:
+    if not cacheable:
+        return compressors[encoding](body)
+
+    key = (encoding, hashlib.blake2b(body, digest_size=16).digest())
+    compressed = compressed_cache.get(key)
+    if compressed is None:
+        compressed_cache.misses += 1
+        compressed = compressors[encoding](body)
+        compressed_cache.set(key, compressed)
+    else:
+        compressed_cache.hits += 1
+    return compressed
+
+
+class CompressionMiddleware:
+    """
+    ASGI-middleware сжатия ответов
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = ""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+                break
+        encoding = choose_encoding(accept_encoding) if accept_encoding else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        cacheable = scope["path"] in COMPRESSED_CACHE_PATHS
+        start_message: dict | None = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, passthrough
+
+            if message["type"] == "http.response.start":
+                start_message = message
+                headers = dict(message.get("headers", []))
+                content_type = headers.get(b"content-type", b"")
+                passthrough = (
+                    b"content-encoding" in headers
+                    or message["status"] < 200
+                    or message["status"] in (204, 304)
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)
+                )
+                if passthrough:
+                    await send(message)
+                return
+
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            headers = list(start_message.get("headers", []))
+            headers.append((b"vary", b"Accept-Encoding"))
+
+            if more_body or len(body) < self.minimum_size:
+                # Потоковый или маленький ответ отдаем как есть
+                passthrough = True
+                await send({**start_message, "headers": headers})
+                await send(message)
+                return
+
+            headers = [
+                (name, value) for name, value in headers if name != b"content-length"
+            ]
+            compressed = compress_body(
+                body, encoding, cacheable and start_message["status"] == 200
+            )
+            headers.append((b"content-encoding", encoding.encode()))
+            headers.append((b"content-length", str(len(compressed)).encode()))
+            await send({**start_message, "headers": headers})
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,78 @@
+"""
+Контекст текущего HTTP-запроса, доступный из любого места обработки
+(логирование, журнал медленных запросов) через contextvars.
+"""
+
+import uuid
+from contextvars import ContextVar
+
+request_id_var: ContextVar[str | None] = ContextVar("request_id", default=None)
+route_var: ContextVar[str | None] = ContextVar("route", default=None)
+
+
+class RequestState:
+    """
+    Изменяемое состояние запроса. Задачи, созданные во время запроса
+    (например, пакетные загрузчики), получают копию контекста, но ссылку
+    на тот же объект, поэтому их изменения видны в middleware
+    """
+
+    __slots__ = ("user_id", "sampled")
+
+    def __init__(self, sampled: bool = True):
+        self.user_id: int | None = None
+        self.sampled = sampled
+
+
+request_state_var: ContextVar[RequestState | None] = ContextVar(
+    "request_state", default=None
+)
+
+
+def set_current_user(user_id: int):
+    """
+    Запоминание пользователя, выполняющего запрос (для логов)
+    :param user_id: ID пользователя
+    :return: Ничего не возвращает
+    """
+    state = request_state_var.get()
+    if state is not None:
+        state.user_id = user_id
+
+
+class RequestContextMiddleware:
+    """
+    ASGI-middleware: назначает запросу id (из заголовка X-Request-ID или новый)
+    и возвращает его в ответе
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")[:64]
+                break
+        request_id = request_id or uuid.uuid4().hex
+
+        request_id_token = request_id_var.set(request_id)
+        route_token = route_var.set(f"{scope['method']} {scope['path']}")
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-request-id", request_id.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id_var.reset(request_id_token)
+            route_var.reset(route_token)
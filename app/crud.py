@@ -1,46 +1,117 @@
+import asyncio
 import os
 import shutil
 import uuid
-
-from fastapi import HTTPException, UploadFile
+from abc import ABC, abstractmethod
+from typing import Iterable
+
+from fastapi import Depends, HTTPException, UploadFile
+from sqlalchemy import (
+    ARRAY,
+    Integer,
+    String,
+    any_,
+    bindparam,
+    func,
+    insert,
+    or_,
+    text,
+    update,
+)
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import joinedload
 
-import conftest
-
-from .models import Follower, Like, Media, Tweet, User
+from .cache import AsyncLRUCache
+from .context import set_current_user
+from .database import get_db
+from .invalidation import publish, subscribe
+from .like_counters import get_like_counts, random_shard
+from .media import (
+    IMAGE_TYPES,
+    MediaInfo,
+    format_media,
+    get_media_dir,
+    guess_mime_type,
+    probe_media,
+)
+from .models import (
+    Follower,
+    Like,
+    Media,
+    Tweet,
+    TweetMention,
+    TweetTag,
+    User,
+    UserSuggestion,
+)
+from .notifications import notification_aggregator
+from .tags import normalize_tag, save_tweet_entities
+from .timeline_cache import FEED_KEY, timeline_cache, tweet_body_cache
+
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "10000"))
+
+# Отформатированные профили по id; сбрасываются при подписке/отписке
+profile_cache = AsyncLRUCache("profiles", PROFILE_CACHE_SIZE, key_type=int)
+subscribe("user", profile_cache.on_invalidation)
+
+subscribe("feed", timeline_cache.on_invalidation)
+subscribe("tweet", tweet_body_cache.on_invalidation)
 
 
 async def create_new_tweet(
     tweet_data: str, author_id: int, media_ids: list, db: AsyncSession
-) -> Tweet:
+) -> int:
     """
-    Создание нового твита
+    Создание нового твита с привязкой медиафайлов одним запросом
     :param tweet_data: Текст твита
     :param author_id: ID автора твита
     :param media_ids: Список ID медиафайлов, прикрепленных к твиту
     :param db: Асинхронная сессия базы данных
-    :return: Объект нового твита
-    """
-    # Создаем новый твит
-    db_tweet = Tweet(tweet_data=tweet_data, author_id=author_id)
-
-    # Проверка и добавление медиа-идентификаторов, если они существуют
-    if media_ids:
-        media_query = await db.execute(select(Media).filter(Media.id.in_(media_ids)))
-        media_items = media_query.scalars().all()
-        if len(media_items) != len(media_ids):
-            raise HTTPException(
-                status_code=404, detail="One or more media IDs not found"
-            )
-        db_tweet.media_items = media_items
+    :return: ID нового твита
+    """
+    media_ids = list(set(media_ids))
+
+    # INSERT твита и UPDATE медиа выполняются в одном выражении через CTE.
+    # Привязываются только медиа автора, еще не прикрепленные к другому твиту
+    new_tweet = (
+        insert(Tweet)
+        .values(tweet_data=tweet_data, author_id=author_id)
+        .returning(Tweet.id)
+        .cte("new_tweet")
+    )
+    attached_media = (
+        update(Media)
+        .where(
+            Media.id == any_(bindparam("media_ids", media_ids, type_=ARRAY(Integer))),
+            Media.user_id == author_id,
+            Media.tweet_id.is_(None),
+        )
+        .values(tweet_id=select(new_tweet.c.id).scalar_subquery())
+        .returning(Media.id)
+        .cte("attached_media")
+    )
+    result = await db.execute(
+        select(
+            new_tweet.c.id,
+            select(func.count()).select_from(attached_media).scalar_subquery(),
+        )
+    )
+    tweet_id, attached_count = result.one()
+
+    if attached_count != len(media_ids):
+        await db.rollback()
+        raise HTTPException(
+            status_code=404,
+            detail="One or more media IDs not found or already attached",
+        )
 
-    db.add(db_tweet)
+    await save_tweet_entities([(tweet_id, tweet_data)], db)
+    # Новый id добавляется в начало закэшированной ленты, без ее сброса
+    publish(db, "feed", tweet_id)
     await db.commit()
-    await db.refresh(db_tweet)
 
-    return db_tweet
+    return tweet_id
 
 
 async def get_user_by_id_or_api_key(param: int | str, db: AsyncSession) -> User:
@@ -62,14 +133,184 @@ async def get_user_by_id_or_api_key(param: int | str, db: AsyncSession) -> User:
             joinedload(User.following).joinedload(Follower.followed),
         )
         .filter(filter_condition)
+        # Объект мог остаться в сессии с устаревшими подписками
+        .execution_options(populate_existing=True)
     )
     user = result.scalars().first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
+    if not isinstance(param, int):
+        set_current_user(int(user.id))
 
     return user
 
 
+class BatchLoader(ABC):
+    """
+    Загрузчик, собирающий запросы одного тика event loop в один SELECT
+    и запоминающий результаты до конца HTTP-запроса
+    """
+
+    not_found_detail = "Not found"
+
+    def __init__(self, loaders: "RequestLoaders"):
+        self.loaders = loaders
+        self._cache: dict = {}
+        self._pending: dict = {}
+
+    def load(self, key) -> asyncio.Future:
+        """
+        Запрос объекта по ключу
+        :param key: Ключ объекта
+        :return: Future с объектом (или HTTPException 404)
+        """
+        if key in self._cache:
+            return self._cache[key]
+        future = asyncio.get_running_loop().create_future()
+        self._cache[key] = future
+        self._pending[key] = future
+        self.loaders.schedule()
+        return future
+
+    async def load_many(self, keys: list) -> list:
+        """
+        Запрос нескольких объектов одним пакетом
+        :param keys: Список ключей
+        :return: Список объектов в порядке ключей
+        """
+        return list(await asyncio.gather(*(self.load(key) for key in keys)))
+
+    def prime(self, key, value):
+        """
+        Добавление уже загруженного объекта в кэш запроса
+        :param key: Ключ объекта
+        :param value: Объект
+        :return: Ничего не возвращает
+        """
+        if key not in self._cache:
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(value)
+            self._cache[key] = future
+
+    @abstractmethod
+    async def fetch(self, keys: list) -> dict:
+        """
+        Загрузка пакета объектов одним запросом
+        :param keys: Список ключей
+        :return: Словарь ключ -> объект (отсутствующие ключи — 404)
+        """
+
+    async def dispatch(self):
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        try:
+            found = await self.fetch(list(pending))
+        except Exception as exc:
+            for key, future in pending.items():
+                self._cache.pop(key, None)
+                future.set_exception(exc)
+            return
+
+        for key, future in pending.items():
+            if key in found:
+                future.set_result(found[key])
+            else:
+                future.set_exception(
+                    HTTPException(status_code=404, detail=self.not_found_detail)
+                )
+
+
+class UserLoader(BatchLoader):
+    """
+    Пакетная загрузка пользователей по id или api_key
+    """
+
+    not_found_detail = "User not found"
+
+    async def fetch(self, keys: list) -> dict:
+        ids = [key for key in keys if isinstance(key, int)]
+        api_keys = [key for key in keys if isinstance(key, str)]
+        result = await self.loaders.db.execute(
+            select(User).filter(
+                or_(
+                    User.id == any_(bindparam("ids", ids, type_=ARRAY(Integer))),
+                    User.api_key
+                    == any_(bindparam("api_keys", api_keys, type_=ARRAY(String))),
+                )
+            )
+        )
+        found = {}
+        for user in result.scalars().all():
+            found[user.id] = user
+            found[user.api_key] = user
+            if user.api_key in api_keys:
+                set_current_user(int(user.id))
+            # Пользователь, найденный по ключу, доступен и по id, и наоборот
+            self.prime(user.id, user)
+            self.prime(user.api_key, user)
+        return found
+
+
+class TweetLoader(BatchLoader):
+    """
+    Пакетная загрузка твитов по id
+    """
+
+    not_found_detail = "Tweet not found"
+
+    async def fetch(self, keys: list) -> dict:
+        result = await self.loaders.db.execute(
+            select(Tweet).filter(
+                Tweet.id == any_(bindparam("ids", keys, type_=ARRAY(Integer)))
+            )
+        )
+        return {tweet.id: tweet for tweet in result.scalars().all()}
+
+
+class RequestLoaders:
+    """
+    Набор загрузчиков одного HTTP-запроса.
+    Пакеты всех загрузчиков выполняются последовательно, так как
+    AsyncSession не допускает параллельных запросов
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+        self.users = UserLoader(self)
+        self.tweets = TweetLoader(self)
+        self._lock = asyncio.Lock()
+        self._scheduled = False
+        self._tasks: set[asyncio.Task] = set()
+
+    def schedule(self):
+        if self._scheduled:
+            return
+        self._scheduled = True
+        # Ждем конца текущего тика, чтобы собрать все load() в один пакет
+        asyncio.get_running_loop().call_soon(self._start_dispatch)
+
+    def _start_dispatch(self):
+        self._scheduled = False
+        task = asyncio.ensure_future(self._dispatch())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _dispatch(self):
+        async with self._lock:
+            for loader in (self.users, self.tweets):
+                await loader.dispatch()
+
+
+async def get_loaders(db: AsyncSession = Depends(get_db)) -> RequestLoaders:
+    """
+    Зависимость FastAPI: загрузчики, общие для всего запроса
+    :param db: Асинхронная сессия базы данных
+    :return: Набор загрузчиков запроса
+    """
+    return RequestLoaders(db)
+
+
 async def format_user_profile_response(user: User) -> dict:
     """
     Форматирование данных профиля юзера
@@ -94,53 +335,270 @@ async def format_user_profile_response(user: User) -> dict:
     return user_profile
 
 
-async def get_all_tweets(db: AsyncSession) -> list:
+async def get_cached_user_profile(user_id: int, db: AsyncSession) -> dict:
     """
-    Получение списка всех твитов
+    Получение отформатированного профиля через кэш
+    :param user_id: ID пользователя
     :param db: Асинхронная сессия базы данных
-    :return: Список всех твитов
+    :return: Словарь с отформатированными данными профиля
+    """
+
+    async def load_profile() -> dict:
+        user = await get_user_by_id_or_api_key(user_id, db)
+        return await format_user_profile_response(user)
+
+    return await profile_cache.get_or_load(user_id, load_profile)
+
+
+async def get_viewer_profile(
+    user_id: int, viewer_id: int | None, db: AsyncSession
+) -> dict:
+    """
+    Профиль из кэша с флагом подписки читателя на пользователя
+    :param user_id: ID пользователя
+    :param viewer_id: ID читателя; None — анонимный читатель
+    :param db: Асинхронная сессия базы данных
+    :return: Словарь с отформатированными данными профиля
+    """
+    profile = await get_cached_user_profile(user_id, db)
+    is_following = False
+    if viewer_id is not None and viewer_id != user_id:
+        is_following = bool(await get_followed_user_ids(viewer_id, [user_id], db))
+    # Профиль из кэша общий для всех запросов, поэтому копируется
+    return {**profile, "user": {**profile["user"], "is_following": is_following}}
+
+
+async def get_user_suggestions(user_id: int, db: AsyncSession) -> list:
+    """
+    Получение предрассчитанных рекомендаций «Кого читать»
+    :param user_id: ID пользователя
+    :param db: Асинхронная сессия базы данных
+    :return: Список рекомендованных пользователей в порядке ранга
+    """
+    result = await db.execute(
+        select(UserSuggestion)
+        .options(joinedload(UserSuggestion.suggested))
+        .filter(UserSuggestion.user_id == user_id)
+        .order_by(UserSuggestion.rank)
+    )
+    return [
+        {
+            "id": suggestion.suggested.id,
+            "name": suggestion.suggested.name,
+            "mutual": suggestion.score,
+        }
+        for suggestion in result.scalars().all()
+    ]
+
+
+async def get_feed_tweet_ids(db: AsyncSession, limit: int) -> list[int]:
+    """
+    Получение id последних твитов ленты
+    :param db: Асинхронная сессия базы данных
+    :param limit: Максимальное количество твитов
+    :return: Список id твитов от новых к старым
     """
     result = await db.execute(
-        select(Tweet).options(
+        select(Tweet.id).order_by(Tweet.created_at.desc(), Tweet.id.desc()).limit(limit)
+    )
+    return list(result.scalars().all())
+
+
+async def get_tweets_by_ids(tweet_ids: list[int], db: AsyncSession) -> list:
+    """
+    Получение твитов с авторами, вложениями и лайками по списку id
+    :param tweet_ids: Список id твитов
+    :param db: Асинхронная сессия базы данных
+    :return: Список твитов
+    """
+    result = await db.execute(
+        select(Tweet)
+        .options(
             joinedload(Tweet.author),
             joinedload(Tweet.media_items),
             joinedload(Tweet.likes).joinedload(
                 Like.user
             ),  # Полный путь от Tweet до Like и User
         )
+        .filter(Tweet.id == any_(bindparam("ids", tweet_ids, type_=ARRAY(Integer))))
     )
-    tweets = result.scalars().unique().all()
-    return tweets
+    return result.scalars().unique().all()
+
+
+def format_tweet(tweet: Tweet) -> dict:
+    """
+    Форматирование данных твита (без счетчика лайков)
+    :param tweet: Объект твита
+    :return: Отформатированные данные твита
+    """
+    media = [format_media(item) for item in tweet.media_items or []]
+    return {
+        "id": tweet.id,
+        "content": tweet.tweet_data,  # Используем правильное поле
+        # Ссылки на изображения — для фронтенда; все вложения с
+        # метаданными — в media
+        "attachments": [item["url"] for item in media if item["type"] in IMAGE_TYPES],
+        "media": media,
+        "author": {"id": tweet.author.id, "name": tweet.author.name},
+        "likes": [
+            {"user_id": like.user.id, "name": like.user.name}
+            for like in tweet.likes or []
+        ],
+    }
+
+
+async def get_feed(
+    db: AsyncSession, viewer_id: int | None = None, include_likes: bool = True
+) -> list:
+    """
+    Получение ленты: id последних твитов берутся из кэша лент
+    :param db: Асинхронная сессия базы данных
+    :param viewer_id: ID читателя для флагов liked_by_me и is_following
+    :param include_likes: False — без списка лайкнувших в ответе
+    :return: Список отформатированных данных твитов от новых к старым
+    """
+    tweet_ids: Iterable[int] | None = timeline_cache.get(FEED_KEY)
+    if tweet_ids is None:
+        generation = timeline_cache.generation
+        fresh_ids = await get_feed_tweet_ids(db, timeline_cache.length)
+        timeline_cache.set(FEED_KEY, fresh_ids, generation)
+        tweet_ids = fresh_ids
+
+    return await hydrate_tweets(tweet_ids, db, viewer_id, include_likes)
+
+
+async def get_tag_tweet_ids(
+    tag: str, db: AsyncSession, limit: int, before: int | None = None
+) -> list[int]:
+    """
+    Получение id твитов с хэштегом (постранично, от новых к старым)
+    :param tag: Хэштег (с "#" или без)
+    :param db: Асинхронная сессия базы данных
+    :param limit: Размер страницы
+    :param before: Курсор: id последнего твита предыдущей страницы
+    :return: Список id твитов
+    """
+    query = select(TweetTag.tweet_id).where(TweetTag.tag == normalize_tag(tag))
+    if before is not None:
+        query = query.where(TweetTag.tweet_id < before)
+    result = await db.execute(query.order_by(TweetTag.tweet_id.desc()).limit(limit))
+    return list(result.scalars().all())
 
 
-async def format_tweet_list(tweets: list) -> list:
+async def get_mention_tweet_ids(
+    user_id: int, db: AsyncSession, limit: int, before: int | None = None
+) -> list[int]:
     """
-    Форматирование данных всех твитов
-    :param tweets: Список объектов твитов
+    Получение id твитов, упоминающих пользователя (постранично)
+    :param user_id: ID пользователя
+    :param db: Асинхронная сессия базы данных
+    :param limit: Размер страницы
+    :param before: Курсор: id последнего твита предыдущей страницы
+    :return: Список id твитов
+    """
+    query = select(TweetMention.tweet_id).where(TweetMention.user_id == user_id)
+    if before is not None:
+        query = query.where(TweetMention.tweet_id < before)
+    result = await db.execute(query.order_by(TweetMention.tweet_id.desc()).limit(limit))
+    return list(result.scalars().all())
+
+
+async def get_liked_tweet_ids(
+    viewer_id: int, tweet_ids: list[int], db: AsyncSession
+) -> set[int]:
+    """
+    Твиты из списка, лайкнутые пользователем (один запрос на страницу)
+    :param viewer_id: ID пользователя
+    :param tweet_ids: ID твитов
+    :param db: Асинхронная сессия базы данных
+    :return: Множество id лайкнутых твитов
+    """
+    if not tweet_ids:
+        return set()
+    result = await db.execute(
+        select(Like.tweet_id).where(
+            Like.tweet_id == any_(bindparam("ids", tweet_ids, type_=ARRAY(Integer))),
+            Like.user_id == viewer_id,
+        )
+    )
+    return set(result.scalars().all())
+
+
+async def get_followed_user_ids(
+    viewer_id: int, user_ids: list[int], db: AsyncSession
+) -> set[int]:
+    """
+    Пользователи из списка, на которых подписан пользователь
+    :param viewer_id: ID пользователя
+    :param user_ids: ID пользователей
+    :param db: Асинхронная сессия базы данных
+    :return: Множество id пользователей
+    """
+    if not user_ids:
+        return set()
+    result = await db.execute(
+        select(Follower.followed_id).where(
+            Follower.followed_id
+            == any_(bindparam("ids", user_ids, type_=ARRAY(Integer))),
+            Follower.follower_id == viewer_id,
+        )
+    )
+    return set(result.scalars().all())
+
+
+async def hydrate_tweets(
+    tweet_ids,
+    db: AsyncSession,
+    viewer_id: int | None = None,
+    include_likes: bool = True,
+) -> list:
+    """
+    Данные твитов по списку id: тела из кэша по id, недостающие — одним
+    запросом, счетчики лайков — из кэша счетчиков.
+    Флаги liked_by_me и author.is_following зависят от читателя и в кэш
+    не попадают: они считаются двумя запросами на всю страницу
+    :param tweet_ids: ID твитов в нужном порядке
+    :param db: Асинхронная сессия базы данных
+    :param viewer_id: ID читателя; None — анонимный читатель
+    :param include_likes: False — без списка лайкнувших: остаются
+        likes_count и liked_by_me, ответ меньше
     :return: Список отформатированных данных твитов
     """
-    tweet_list = []
-    for tweet in tweets:
-        tweet_list.append(
+
+    async def load_bodies(missing: list[int]) -> dict:
+        tweets = await get_tweets_by_ids(missing, db)
+        return {tweet.id: format_tweet(tweet) for tweet in tweets}
+
+    # Тело твита, измененного во время загрузки, не кэшируется;
+    # остальные тела пакета сохраняются
+    bodies = await tweet_body_cache.get_many_or_load(tweet_ids, load_bodies)
+
+    like_counts = await get_like_counts(list(bodies), db)
+    liked = followed = set()
+    if viewer_id is not None:
+        liked = await get_liked_tweet_ids(viewer_id, list(bodies), db)
+        author_ids = list({body["author"]["id"] for body in bodies.values()})
+        followed = await get_followed_user_ids(viewer_id, author_ids, db)
+
+    # Твиты, удаленные после построения ленты, пропускаются.
+    # Тела из кэша общие для всех запросов, поэтому копируются
+    tweets = []
+    for tweet_id in tweet_ids:
+        body = bodies.get(tweet_id)
+        if body is None:
+            continue
+        author = body["author"]
+        if not include_likes:
+            body = {key: value for key, value in body.items() if key != "likes"}
+        tweets.append(
             {
-                "id": tweet.id,
-                "content": tweet.tweet_data,  # Используем правильное поле
-                "attachments": [
-                    f"http://0.0.0.0/media/{attachment.filename}"
-                    for attachment in tweet.media_items or []
-                    if attachment.filename.lower().endswith(
-                        (".png", ".jpg", ".jpeg", ".gif")
-                    )
-                ],
-                "author": {"id": tweet.author.id, "name": tweet.author.name},
-                "likes": [
-                    {"user_id": like.user.id, "name": like.user.name}
-                    for like in tweet.likes or []
-                ],
+                **body,
+                "author": {**author, "is_following": author["id"] in followed},
+                "likes_count": like_counts[tweet_id],
+                "liked_by_me": tweet_id in liked,
             }
         )
-
-    return tweet_list
+    return tweets
 
 
 async def get_follower_relationship(
@@ -178,6 +636,12 @@ async def delete_follower_relationship(
     :return: Ничего не возвращает
     """
     await db.delete(follower_relationship)
+    publish(
+        db,
+        "user",
+        int(follower_relationship.follower_id),
+        int(follower_relationship.followed_id),
+    )
     await db.commit()
 
 
@@ -215,36 +679,106 @@ async def create_follow_relationship(
     """
     new_follow = Follower(follower_id=current_user_id, followed_id=user_to_follow_id)
     db.add(new_follow)
+    publish(db, "user", current_user_id, user_to_follow_id)
     await db.commit()
+    notification_aggregator.add(user_to_follow_id, "follow", current_user_id)
 
 
-async def get_like_relation(tweet_id: int, user_id: int, db: AsyncSession) -> Like:
+# Пользователь лайка: по id или по api_key (второй параметр — NULL)
+_LIKER = """
+    liker AS (
+        SELECT id FROM users
+        WHERE id = CAST(:user_id AS integer) OR api_key = CAST(:api_key AS varchar)
+    )
+"""
+
+_CREATE_LIKE = text(
+    f"""
+    WITH {_LIKER},
+    inserted AS (
+        INSERT INTO likes (user_id, tweet_id)
+        SELECT liker.id, :tweet_id FROM liker
+        WHERE EXISTS (SELECT 1 FROM tweets WHERE tweets.id = :tweet_id)
+            AND NOT EXISTS (
+                SELECT 1 FROM likes
+                WHERE likes.tweet_id = :tweet_id AND likes.user_id = liker.id
+            )
+        RETURNING tweet_id
+    ),
+    counted AS (
+        INSERT INTO like_counter_shards (tweet_id, shard, count)
+        SELECT tweet_id, :shard, 1 FROM inserted
+        ON CONFLICT (tweet_id, shard) DO UPDATE
+            SET count = like_counter_shards.count + excluded.count
+    )
+    SELECT
+        (SELECT id FROM liker) AS user_id,
+        EXISTS (SELECT 1 FROM inserted) AS created,
+        (SELECT author_id FROM tweets WHERE tweets.id = :tweet_id) AS author_id
+    """
+)
+
+_REMOVE_LIKE = text(
+    f"""
+    WITH {_LIKER},
+    removed AS (
+        DELETE FROM likes USING liker
+        WHERE likes.tweet_id = :tweet_id AND likes.user_id = liker.id
+        RETURNING likes.tweet_id
+    ),
+    counted AS (
+        INSERT INTO like_counter_shards (tweet_id, shard, count)
+        SELECT tweet_id, :shard, -count(*) FROM removed GROUP BY tweet_id
+        ON CONFLICT (tweet_id, shard) DO UPDATE
+            SET count = like_counter_shards.count + excluded.count
+    )
+    SELECT (SELECT id FROM liker) AS user_id, (SELECT count(*) FROM removed) AS removed
     """
-    Получение информации о лайке пользователя на твит
-    :param tweet_id: ID твита
-    :param user_id: ID пользователя
-    :param db: Асинхронная сессия базы данных
-    :return: Объект, представляющий отношение лайка
+)
+
+# Твит, его лайки и открепление медиа — одним запросом; шарды счетчика,
+# теги и упоминания удаляются каскадом по внешним ключам
+_DELETE_TWEET = text(
     """
-    result = await db.execute(
-        select(Like).filter(Like.tweet_id == tweet_id, Like.user_id == user_id)
+    WITH deleted_likes AS (
+        DELETE FROM likes WHERE tweet_id = :tweet_id
+    ),
+    detached_media AS (
+        UPDATE media SET tweet_id = NULL WHERE tweet_id = :tweet_id
     )
-    like_relation = result.scalars().first()
-    if not like_relation:
-        raise HTTPException(status_code=404, detail="Like not found")
+    DELETE FROM tweets WHERE id = :tweet_id
+    """
+)
 
-    return like_relation
 
+def _like_params(tweet_id: int, user: int | str) -> dict:
+    by_id = isinstance(user, int)
+    return {
+        "tweet_id": tweet_id,
+        "user_id": user if by_id else None,
+        "api_key": None if by_id else user,
+        "shard": random_shard(),
+    }
 
-async def remove_like_relation(like_relation: Like, db: AsyncSession):
+
+async def delete_like(tweet_id: int, user: int | str, db: AsyncSession) -> int:
     """
-    Удаление лайка из твита
-    :param like_relation: Объект, представляющий отношение лайка
+    Удаление лайка одним запросом: пользователь, лайк и шард счетчика
+    :param tweet_id: ID твита
+    :param user: ID пользователя или его api_key
     :param db: Асинхронная сессия базы данных
-    :return: Ничего не возвращает
+    :return: ID пользователя
     """
-    await db.delete(like_relation)
+    result = await db.execute(_REMOVE_LIKE, _like_params(tweet_id, user))
+    row = result.one()
+    if row.user_id is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    if not row.removed:
+        raise HTTPException(status_code=404, detail="Like not found")
+    set_current_user(row.user_id)
+    publish(db, "tweet", tweet_id)
     await db.commit()
+    return row.user_id
 
 
 async def get_tweet_by_id(tweet_id: int, db: AsyncSession) -> Tweet:
@@ -264,33 +798,28 @@ async def get_tweet_by_id(tweet_id: int, db: AsyncSession) -> Tweet:
     return tweet
 
 
-async def check_like_exists(tweet_id: int, user_id: int, db: AsyncSession) -> bool:
-    """
-    Проверка наличия лайка пользователя на твит
-    :param tweet_id: ID твита
-    :param user_id: ID пользователя
-    :param db: Асинхронная сессия базы данных
-    :return: True, если лайк существует, иначе False
-    """
-    result = await db.execute(
-        select(Like).filter(Like.tweet_id == tweet_id, Like.user_id == user_id)
-    )
-    like_relation = result.scalars().first()
-
-    return like_relation is not None
-
-
-async def create_like(tweet_id: int, user_id: int, db: AsyncSession):
+async def create_like(tweet_id: int, user: int | str, db: AsyncSession) -> int:
     """
-    Создание лайка на твит
+    Создание лайка на твит одним запросом: пользователь, проверка повторного
+    лайка, лайк, шард счетчика и автор твита (получатель уведомления)
     :param tweet_id: ID твита
-    :param user_id: ID пользователя
+    :param user: ID пользователя или его api_key
     :param db: Асинхронная сессия базы данных
-    :return: Ничего не возвращает
+    :return: ID пользователя
     """
-    new_like = Like(tweet_id=tweet_id, user_id=user_id)
-    db.add(new_like)
+    result = await db.execute(_CREATE_LIKE, _like_params(tweet_id, user))
+    row = result.one()
+    if row.user_id is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    if row.author_id is None:
+        raise HTTPException(status_code=404, detail="Tweet not found")
+    if not row.created:
+        raise HTTPException(status_code=400, detail="Already liked this tweet")
+    set_current_user(row.user_id)
+    publish(db, "tweet", tweet_id)
     await db.commit()
+    notification_aggregator.add(row.author_id, "like", row.user_id, tweet_id)
+    return row.user_id
 
 
 async def delete_tweet_from_db(tweet: Tweet, db: AsyncSession):
@@ -300,21 +829,31 @@ async def delete_tweet_from_db(tweet: Tweet, db: AsyncSession):
     :param db: Асинхронная сессия базы данных
     :return: Ничего не возвращает
     """
-    await db.delete(tweet)
+    # Твит и все ссылающиеся на него строки удаляются одним запросом
+    await db.execute(_DELETE_TWEET, {"tweet_id": tweet.id})
+    publish(db, "tweet", int(tweet.id))
+    publish(db, "feed")
     await db.commit()
 
 
+def new_media_filename(original_filename: str) -> str:
+    """
+    Уникальное имя медиафайла с расширением исходного
+    :param original_filename: Имя файла у клиента
+    :return: Имя файла в директории медиа
+    """
+    file_extension = os.path.splitext(original_filename)[1]
+    return f"{uuid.uuid4()}{file_extension}"
+
+
 async def save_file(file: UploadFile) -> str:
     """
     Обработка и сохранение загруженного медиафайла для твита
     :param file: Объект загруженного файла (UploadFile)
     :return: Путь к сохраненному файлу
     """
-    file_extension = os.path.splitext(file.filename)[1]
-    media_filename = f"{uuid.uuid4()}{file_extension}"
-    media_path = f"/app/media/{media_filename}"
-    if conftest.TESTING:
-        media_path = f"/tmp/media/{media_filename}"  # Используем временную директорию
+    media_filename = new_media_filename(file.filename or "")
+    media_path = os.path.join(get_media_dir(), media_filename)
     # Создаем директорию, если она не существует
     os.makedirs(os.path.dirname(media_path), exist_ok=True)
 
@@ -334,7 +873,44 @@ async def save_media_to_db(
     :param db: Асинхронная сессия базы данных
     :return: Объект медиа
     """
-    new_media = Media(filename=media_filename, user_id=user_id)
+    media_path = os.path.join(get_media_dir(), media_filename)
+    try:
+        # Чтение заголовка файла не блокирует цикл событий
+        info = await asyncio.to_thread(probe_media, media_path)
+    except FileNotFoundError:
+        info = MediaInfo(guess_mime_type(media_filename), None, None, None)
+    new_media = Media(filename=media_filename, user_id=user_id, **info._asdict())
     db.add(new_media)
     await db.commit()
     return new_media
+
+
+async def warm_up_statement_cache(db: AsyncSession):
+    """
+    Прогрев кэша скомпилированных выражений SQLAlchemy и кэша подготовленных
+    выражений соединения: горячие запросы выполняются с заведомо
+    несуществующими параметрами и ничего не читают
+    :param db: Асинхронная сессия, привязанная к прогреваемому соединению
+    :return: Ничего не возвращает
+    """
+    for param in (0, ""):
+        try:
+            await get_user_by_id_or_api_key(param, db)
+        except HTTPException:
+            pass
+
+    loaders = RequestLoaders(db)
+    for future in (loaders.users.load_many([0, ""]), loaders.tweets.load(0)):
+        try:
+            await future
+        except HTTPException:
+            pass
+
+    await get_user_suggestions(0, db)
+    await check_follow_relationship(0, 0, db)
+    # Записи лайка с несуществующим пользователем ничего не меняют
+    for like in (create_like, delete_like):
+        try:
+            await like(0, "", db)
+        except HTTPException:
+            pass
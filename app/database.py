@@ -1,13 +1,33 @@
+import asyncio
 import os
+from typing import Awaitable, Callable
 
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
+from .slow_queries import install_slow_query_log
+
 DATABASE_URL = os.getenv(
     "DATABASE_URL", "postgresql+asyncpg://user:password@db:5432/tweet-clone"
 )
 
-engine = create_async_engine(DATABASE_URL, echo=True)
+# Размер пула на один процесс; при нескольких воркерах итоговое число соединений
+# с БД равно WEB_CONCURRENCY * (DB_POOL_SIZE + DB_MAX_OVERFLOW + 1), где 1 —
+# слушатель шины инвалидации (число воркеров ограничено в gunicorn.conf.py)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_WARM_SIZE = int(os.getenv("DB_POOL_WARM_SIZE", str(DB_POOL_SIZE)))
+# Вывод всех SQL-запросов в лог (только для отладки)
+DB_ECHO = os.getenv("DB_ECHO", "0") == "1"
+
+engine = create_async_engine(
+    DATABASE_URL,
+    echo=DB_ECHO,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+)
+install_slow_query_log(engine.sync_engine)
 SessionLocal = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
 
 
@@ -17,3 +37,33 @@ async def get_db():
             yield db
         finally:
             await db.close()
+
+
+async def warm_up_pool(
+    size: int = DB_POOL_WARM_SIZE,
+    prime: Callable[[AsyncSession], Awaitable[None]] | None = None,
+):
+    """
+    Предварительное открытие соединений пула при старте воркера
+    :param size: Сколько соединений открыть
+    :param prime: Корутина-функция, выполняемая на каждом соединении
+        (например, прогрев горячих запросов)
+    :return: Ничего не возвращает
+    """
+
+    async def open_connection():
+        conn = await engine.connect()
+        if prime is None:
+            await conn.execute(text("SELECT 1"))
+        else:
+            async with AsyncSession(bind=conn) as db:
+                await prime(db)
+                await db.rollback()
+        return conn
+
+    # Соединения сверх pool_size закрылись бы при возврате в пул
+    size = min(size, DB_POOL_SIZE)
+    connections = await asyncio.gather(*(open_connection() for _ in range(size)))
+    # Соединения возвращаются в пул и остаются открытыми
+    for conn in connections:
+        await conn.close()
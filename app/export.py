@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Потоковая выгрузка твитов, лайков и графа подписок в формате NDJSON.
+
+Строки читаются серверным курсором пачками по EXPORT_BATCH_SIZE и
+отдаются блоками, поэтому память не зависит от объема данных.
+Выгрузка идет через отдельный маленький пул в read-only транзакции
+REPEATABLE READ: снимок согласован и не отнимает соединения у живого трафика.
+
+Запуск: python -m app.export tweets [-o tweets.ndjson.gz] [--gzip]
+"""
+import argparse
+import asyncio
+import enum
+import json
+import os
+import sys
+import zlib
+from typing import AsyncIterator
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from .database import DATABASE_URL
+from .models import Follower, Like, Tweet
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+EXPORT_MAX_CONNECTIONS = int(os.getenv("EXPORT_MAX_CONNECTIONS", "2"))
+
+export_engine = create_async_engine(
+    DATABASE_URL,
+    pool_size=EXPORT_MAX_CONNECTIONS,
+    max_overflow=0,
+    isolation_level="REPEATABLE READ",
+    execution_options={"postgresql_readonly": True},
+)
+ExportSessionLocal = sessionmaker(
+    bind=export_engine, class_=AsyncSession, expire_on_commit=False
+)
+
+
+class ExportKind(str, enum.Enum):
+    tweets = "tweets"
+    likes = "likes"
+    follows = "follows"
+
+
+EXPORT_QUERIES = {
+    ExportKind.tweets: select(Tweet.id, Tweet.tweet_data, Tweet.author_id).order_by(
+        Tweet.id
+    ),
+    ExportKind.likes: select(Like.id, Like.user_id, Like.tweet_id).order_by(Like.id),
+    ExportKind.follows: select(
+        Follower.id, Follower.follower_id, Follower.followed_id
+    ).order_by(Follower.id),
+}
+
+
+def get_export_sessionmaker() -> sessionmaker:
+    """
+    Зависимость FastAPI: фабрика сессий для выгрузки (переопределяется в тестах)
+    :return: Фабрика сессий
+    """
+    return ExportSessionLocal
+
+
+async def iter_ndjson(
+    kind: ExportKind, db: AsyncSession, compress: bool = False
+) -> AsyncIterator[bytes]:
+    """
+    Потоковая выгрузка таблицы в NDJSON
+    :param kind: Что выгружать
+    :param db: Асинхронная сессия базы данных
+    :param compress: Сжимать ли поток в gzip
+    :return: Асинхронный итератор блоков байт (по одному на пачку строк)
+    """
+    compressor = zlib.compressobj(wbits=31) if compress else None
+
+    result = await db.stream(
+        EXPORT_QUERIES[kind].execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    async for rows in result.mappings().partitions():
+        chunk = "".join(
+            json.dumps(dict(row), ensure_ascii=False) + "\n" for row in rows
+        ).encode()
+        if compressor:
+            chunk = compressor.compress(chunk)
+        if chunk:
+            yield chunk
+
+    if compressor:
+        yield compressor.flush()
+
+
+async def export_to_file(kind: ExportKind, output, compress: bool):
+    async with ExportSessionLocal() as db:
+        async for chunk in iter_ndjson(kind, db, compress):
+            output.write(chunk)
+    await export_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Выгрузка данных в NDJSON")
+    parser.add_argument("kind", choices=[kind.value for kind in ExportKind])
+    parser.add_argument("-o", "--output", help="Файл; по умолчанию — stdout")
+    parser.add_argument("--gzip", action="store_true", help="Сжимать в gzip")
+    args = parser.parse_args()
+
+    if args.output:
+        with open(args.output, "wb") as output:
+            asyncio.run(export_to_file(ExportKind(args.kind), output, args.gzip))
+    else:
+        asyncio.run(export_to_file(ExportKind(args.kind), sys.stdout.buffer, args.gzip))
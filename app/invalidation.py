@@ -0,0 +1,289 @@
+"""
+Шина инвалидации кэшей между воркерами на основе Postgres LISTEN/NOTIFY.
+
+Пути записи в crud.py вызывают publish(db, topic, *keys) до commit:
+событие копится в сессии, отправляется одним NOTIFY в той же транзакции
+(то есть только если она зафиксирована) и после commit рассылается
+локальным подписчикам. Остальные воркеры получают его через слушателя.
+
+Тем же запросом, что и NOTIFY, события транзакции пишутся одной строкой
+в журнал cache_invalidations: по нему воркер, восстановивший кэши из
+снимка, досылает себе события, пропущенные за время простоя
+(replay_invalidations). Журнал нужен только для перезапусков, поэтому
+хранится недолго и часто чистится.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Callable
+
+import asyncpg
+from sqlalchemy import ARRAY, String, bindparam, delete, event, func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from .database import SessionLocal, engine
+from .models import CacheInvalidation
+from .periodic import PeriodicTask
+
+CHANNEL = "cache_invalidation"
+# Postgres ограничивает payload NOTIFY 8000 байтами
+MAX_PAYLOAD_SIZE = 7900
+RECONNECT_DELAY = float(os.getenv("INVALIDATION_RECONNECT_DELAY", "1"))
+# Сколько секунд хранится журнал событий (и годится снимок кэшей)
+INVALIDATION_LOG_RETENTION = float(os.getenv("INVALIDATION_LOG_RETENTION", "3600"))
+INVALIDATION_LOG_PRUNE_INTERVAL = float(
+    os.getenv("INVALIDATION_LOG_PRUNE_INTERVAL", "60")
+)
+
+# Идентификатор процесса, чтобы не обрабатывать собственные уведомления дважды
+ORIGIN = uuid.uuid4().hex
+
+# topic -> обработчики; обработчик получает список ключей или None («сбросить все»)
+Handler = Callable[[list[str] | None], None]
+_handlers: dict[str, list[Handler]] = defaultdict(list)
+
+_PENDING_KEY = "pending_invalidations"
+
+
+def subscribe(topic: str, handler: Handler):
+    """
+    Подписка кэша на события инвалидации
+    :param topic: Тема (например, "user", "tweet", "feed")
+    :param handler: Функция, принимающая список ключей или None
+    :return: Ничего не возвращает
+    """
+    _handlers[topic].append(handler)
+
+
+def dispatch(topic: str, keys: list[str] | None):
+    """
+    Рассылка события локальным подписчикам
+    :param topic: Тема события
+    :param keys: Список ключей или None для полного сброса
+    :return: Ничего не возвращает
+    """
+    for handler in _handlers.get(topic, []):
+        try:
+            handler(keys)
+        except Exception:
+            logging.exception("Ошибка обработчика инвалидации темы %s", topic)
+
+
+def dispatch_all():
+    """
+    Полный сброс всех подписанных кэшей (например, после потери соединения)
+    :return: Ничего не возвращает
+    """
+    for topic in list(_handlers):
+        dispatch(topic, None)
+
+
+def publish(db: AsyncSession, topic: str, *keys: int | str):
+    """
+    Регистрация события инвалидации в текущей транзакции
+    :param db: Асинхронная сессия базы данных
+    :param topic: Тема события
+    :param keys: Ключи затронутых записей; без ключей — сброс всей темы
+    :return: Ничего не возвращает
+    """
+    pending = db.info.setdefault(_PENDING_KEY, defaultdict(set))
+    if keys:
+        pending[topic].update(str(key) for key in keys)
+    else:
+        # Маркер None означает сброс всей темы
+        pending[topic].add(None)
+
+
+def _normalize(pending: dict) -> dict[str, list[str] | None]:
+    return {
+        topic: None if None in keys else sorted(keys) for topic, keys in pending.items()
+    }
+
+
+def encode_payloads(events: dict[str, list[str] | None]) -> list[str]:
+    """
+    Упаковка событий в payload-ы NOTIFY, не превышающие лимит Postgres
+    :param events: Словарь тема -> ключи
+    :return: Список JSON-строк
+    """
+    payloads = []
+    for topic, keys in events.items():
+        if keys is None:
+            payloads.append(json.dumps({"o": ORIGIN, "t": topic, "k": None}))
+            continue
+        chunk: list[str] = []
+        for key in keys:
+            candidate = json.dumps({"o": ORIGIN, "t": topic, "k": chunk + [key]})
+            if chunk and len(candidate.encode()) > MAX_PAYLOAD_SIZE:
+                payloads.append(json.dumps({"o": ORIGIN, "t": topic, "k": chunk}))
+                chunk = []
+            chunk.append(key)
+        payloads.append(json.dumps({"o": ORIGIN, "t": topic, "k": chunk}))
+    return payloads
+
+
+_LOG_AND_NOTIFY = text(
+    """
+    WITH logged AS (
+        INSERT INTO cache_invalidations (events) VALUES (CAST(:events AS jsonb))
+    )
+    SELECT count(pg_notify(:channel, payload)) FROM unnest(:payloads) AS payload
+    """
+).bindparams(bindparam("payloads", type_=ARRAY(String)))
+
+
+@event.listens_for(Session, "before_commit")
+def _send_notifications(session: Session):
+    pending = session.info.get(_PENDING_KEY)
+    if not pending:
+        return
+    events = _normalize(pending)
+    # NOTIFY доставляется слушателям только при фиксации транзакции.
+    # Запись в журнал и все NOTIFY транзакции — одним запросом
+    session.execute(
+        _LOG_AND_NOTIFY,
+        {
+            "events": json.dumps(events),
+            "channel": CHANNEL,
+            "payloads": encode_payloads(events),
+        },
+    )
+
+
+@event.listens_for(Session, "after_commit")
+def _dispatch_local(session: Session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    for topic, keys in _normalize(pending).items():
+        dispatch(topic, keys)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending(session: Session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+async def replay_invalidations(db: AsyncSession, since: datetime) -> int:
+    """
+    Повторная рассылка событий из журнала локальным подписчикам
+    :param db: Асинхронная сессия базы данных
+    :param since: Момент (по часам БД), начиная с которого досылаются события
+    :return: Количество записей (транзакций) в журнале
+    """
+    result = await db.execute(
+        select(CacheInvalidation.events)
+        .where(CacheInvalidation.logged_at > since)
+        .order_by(CacheInvalidation.seq)
+    )
+    # События темы объединяются: одна рассылка на тему
+    merged: dict[str, set | None] = {}
+    count = 0
+    for events in result.scalars():
+        count += 1
+        for topic, keys in events.items():
+            if keys is None:
+                merged[topic] = None
+                continue
+            current = merged.setdefault(topic, set())
+            # Тема уже сброшена целиком — ключи не нужны
+            if current is not None:
+                current.update(keys)
+    for topic, keys in merged.items():
+        dispatch(topic, None if keys is None else sorted(keys))
+    return count
+
+
+async def prune_invalidation_log(db: AsyncSession) -> int:
+    """
+    Удаление записей журнала старше INVALIDATION_LOG_RETENTION
+    :param db: Асинхронная сессия базы данных
+    :return: Количество удаленных записей
+    """
+    result = await db.execute(
+        delete(CacheInvalidation).where(
+            CacheInvalidation.logged_at
+            < func.now() - timedelta(seconds=INVALIDATION_LOG_RETENTION)
+        )
+    )
+    await db.commit()
+    return result.rowcount
+
+
+async def prune_job():
+    async with SessionLocal() as db:
+        removed = await prune_invalidation_log(db)
+    if removed:
+        logging.info("Удалено записей журнала инвалидации: %s", removed)
+
+
+invalidation_log_pruner = PeriodicTask(
+    "invalidation_log_prune", INVALIDATION_LOG_PRUNE_INTERVAL, prune_job
+)
+
+
+class InvalidationListener:
+    """
+    Фоновый слушатель канала инвалидации на выделенном соединении asyncpg
+    """
+
+    def __init__(self, channel: str = CHANNEL):
+        self.channel = channel
+        self._connection: asyncpg.Connection | None = None
+        self._task: asyncio.Task | None = None
+        self._lost = asyncio.Event()
+        # Установлено, пока слушатель подключен и кэши сброшены после подключения
+        self.connected = asyncio.Event()
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._connection and not self._connection.is_closed():
+            await self._connection.close()
+
+    async def _connect(self):
+        dsn = engine.url.set(drivername="postgresql").render_as_string(
+            hide_password=False
+        )
+        self._connection = await asyncpg.connect(dsn)
+        self._lost.clear()
+        self._connection.add_termination_listener(lambda _: self._lost.set())
+        await self._connection.add_listener(self.channel, self._on_notification)
+
+    async def _run(self):
+        while True:
+            try:
+                await self._connect()
+                # Пока соединения не было, события могли потеряться
+                dispatch_all()
+                self.connected.set()
+                await self._lost.wait()
+                self.connected.clear()
+                logging.warning("Соединение шины инвалидации потеряно")
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logging.exception("Не удалось подключиться к шине инвалидации")
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    def _on_notification(self, connection, pid, channel, payload: str):
+        message = json.loads(payload)
+        if message["o"] == ORIGIN:
+            return
+        dispatch(message["t"], message["k"])
+
+
+invalidation_listener = InvalidationListener()
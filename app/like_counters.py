@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Шардированные счетчики лайков.
+
+Лайк увеличивает случайно выбранную строку (tweet_id, shard) таблицы
+like_counter_shards, поэтому лайки популярного твита не выстраиваются
+в очередь за блокировкой одной строки. Чтение суммирует строки твита.
+Периодическое сжатие сворачивает шарды в строку shard = 0, чтобы чтение
+не разрасталось; оно идет пачками в коротких транзакциях и выполняется
+одним воркером за раз (advisory lock).
+
+Суммы для ленты берутся из кэша с коротким TTL: счетчик в ленте может
+отставать на LIKE_COUNT_CACHE_TTL секунд.
+
+Запуск: python -m app.like_counters compact|rebuild
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+
+from sqlalchemy import delete, func, select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .cache import AsyncLRUCache
+from .database import SessionLocal
+from .models import Like, LikeCounterShard
+from .periodic import PeriodicTask
+
+LIKE_COUNTER_SHARDS = int(os.getenv("LIKE_COUNTER_SHARDS", "16"))
+LIKE_COUNT_CACHE_SIZE = int(os.getenv("LIKE_COUNT_CACHE_SIZE", "100000"))
+LIKE_COUNT_CACHE_TTL = float(os.getenv("LIKE_COUNT_CACHE_TTL", "2"))
+# 0 отключает фоновое сжатие
+LIKE_COUNTER_COMPACT_INTERVAL = float(os.getenv("LIKE_COUNTER_COMPACT_INTERVAL", "60"))
+# Строк шардов в одной транзакции сжатия
+LIKE_COUNTER_COMPACT_BATCH_SIZE = int(
+    os.getenv("LIKE_COUNTER_COMPACT_BATCH_SIZE", "1000")
+)
+# Ключ advisory-блокировки сжатия (произвольная константа)
+COMPACT_LOCK_ID = 0x4C494B45
+
+like_count_cache = AsyncLRUCache(
+    "like_counts", LIKE_COUNT_CACHE_SIZE, key_type=int, ttl=LIKE_COUNT_CACHE_TTL
+)
+
+
+def random_shard() -> int:
+    return random.randrange(LIKE_COUNTER_SHARDS)
+
+
+async def add_like_counts(db: AsyncSession, deltas: dict[int, int]):
+    """
+    Изменение счетчиков лайков в текущей транзакции
+    :param db: Асинхронная сессия базы данных
+    :param deltas: ID твита -> изменение количества лайков
+    :return: Ничего не возвращает
+    """
+    rows = [
+        {
+            "tweet_id": tweet_id,
+            "shard": random_shard(),
+            "count": delta,
+        }
+        for tweet_id, delta in sorted(deltas.items())
+        if delta
+    ]
+    if not rows:
+        return
+    statement = insert(LikeCounterShard)
+    await db.execute(
+        statement.on_conflict_do_update(
+            index_elements=[LikeCounterShard.tweet_id, LikeCounterShard.shard],
+            set_={"count": LikeCounterShard.count + statement.excluded.count},
+        ),
+        rows,
+    )
+
+
+async def get_like_counts(tweet_ids: list[int], db: AsyncSession) -> dict[int, int]:
+    """
+    Количество лайков твитов: из кэша, недостающие — одним запросом
+    :param tweet_ids: ID твитов
+    :param db: Асинхронная сессия базы данных
+    :return: ID твита -> количество лайков
+    """
+    counts = {}
+    missing = []
+    for tweet_id in tweet_ids:
+        count = like_count_cache.get(tweet_id)
+        if count is None:
+            missing.append(tweet_id)
+        else:
+            counts[tweet_id] = count
+    like_count_cache.hits += len(counts)
+    if not missing:
+        return counts
+
+    like_count_cache.misses += len(missing)
+    result = await db.execute(
+        select(LikeCounterShard.tweet_id, func.sum(LikeCounterShard.count))
+        .where(LikeCounterShard.tweet_id.in_(missing))
+        .group_by(LikeCounterShard.tweet_id)
+    )
+    loaded = dict.fromkeys(missing, 0)
+    loaded.update((tweet_id, int(total)) for tweet_id, total in result.all())
+    for tweet_id, count in loaded.items():
+        like_count_cache.set(tweet_id, count)
+    counts.update(loaded)
+    return counts
+
+
+_COMPACT_BATCH = text(
+    """
+    WITH batch AS (
+        SELECT tweet_id, shard FROM like_counter_shards
+        WHERE shard <> 0 AND tweet_id >= :after
+        ORDER BY tweet_id, shard
+        LIMIT :batch_size
+        FOR UPDATE SKIP LOCKED
+    ),
+    moved AS (
+        DELETE FROM like_counter_shards AS shards USING batch
+        WHERE shards.tweet_id = batch.tweet_id AND shards.shard = batch.shard
+        RETURNING shards.tweet_id, shards.count
+    ),
+    folded AS (
+        INSERT INTO like_counter_shards (tweet_id, shard, count)
+        SELECT tweet_id, 0, sum(count) FROM moved GROUP BY tweet_id
+        ON CONFLICT (tweet_id, shard) DO UPDATE
+            SET count = like_counter_shards.count + excluded.count
+        RETURNING tweet_id, count
+    )
+    SELECT
+        (SELECT count(*) FROM moved) AS moved,
+        (SELECT max(tweet_id) FROM moved) AS last_id,
+        (SELECT count(*) FROM folded) AS folded,
+        (SELECT array_agg(tweet_id) FROM folded WHERE count = 0) AS emptied
+    """
+)
+
+
+async def compact_like_counters(
+    db: AsyncSession, batch_size: int = LIKE_COUNTER_COMPACT_BATCH_SIZE
+) -> int | None:
+    """
+    Сворачивание шардов каждого твита в строку shard = 0.
+    Шарды обрабатываются пачками по возрастанию tweet_id, каждая пачка —
+    в своей короткой транзакции: удаленные шарды прибавляются к нулевому
+    одним оператором, строки, заблокированные параллельными лайками,
+    пропускаются (SKIP LOCKED) до следующего запуска
+    :param db: Асинхронная сессия базы данных
+    :param batch_size: Количество строк шардов в пачке
+    :return: Количество твитов со свернутыми шардами или None,
+        если сжатие уже выполняет другой воркер
+    """
+    after = 0
+    compacted = 0
+    while True:
+        locked = await db.execute(
+            select(func.pg_try_advisory_xact_lock(COMPACT_LOCK_ID))
+        )
+        if not locked.scalar():
+            await db.rollback()
+            # Сжатие выполняет другой воркер
+            return None if after == 0 else compacted
+
+        batch = (
+            await db.execute(_COMPACT_BATCH, {"after": after, "batch_size": batch_size})
+        ).one()
+        if batch.emptied:
+            await db.execute(
+                delete(LikeCounterShard).where(
+                    LikeCounterShard.tweet_id.in_(batch.emptied),
+                    LikeCounterShard.shard == 0,
+                    LikeCounterShard.count == 0,
+                )
+            )
+        await db.commit()
+
+        compacted += batch.folded
+        if batch.moved < batch_size:
+            return compacted
+        # Шарды последнего твита могли не поместиться в пачку: следующая
+        # начинается с него же (свернутые шарды уже не выбираются)
+        after = batch.last_id
+
+
+async def rebuild_like_counters(db: AsyncSession):
+    """
+    Пересчет счетчиков по таблице likes (первичное заполнение)
+    :param db: Асинхронная сессия базы данных
+    :return: Ничего не возвращает
+    """
+    await db.execute(select(func.pg_advisory_xact_lock(COMPACT_LOCK_ID)))
+    await db.execute(text("LOCK TABLE likes IN SHARE MODE"))
+    await db.execute(delete(LikeCounterShard))
+    await db.execute(
+        insert(LikeCounterShard).from_select(
+            ["tweet_id", "shard", "count"],
+            select(Like.tweet_id, 0, func.count()).group_by(Like.tweet_id),
+        )
+    )
+    await db.commit()
+    like_count_cache.clear()
+
+
+async def compact_job():
+    async with SessionLocal() as db:
+        compacted = await compact_like_counters(db)
+    if compacted:
+        logging.info("Свернуты счетчики лайков твитов: %s", compacted)
+
+
+like_counter_compactor = PeriodicTask(
+    "like_counter_compaction", LIKE_COUNTER_COMPACT_INTERVAL, compact_job
+)
+
+
+async def run(command: str):
+    async with SessionLocal() as db:
+        if command == "compact":
+            logging.info("Свернуто твитов: %s", await compact_like_counters(db))
+        else:
+            await rebuild_like_counters(db)
+            logging.info("Счетчики пересчитаны")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Счетчики лайков")
+    parser.add_argument("command", choices=["compact", "rebuild"])
+    asyncio.run(run(parser.parse_args().command))
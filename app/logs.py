@@ -0,0 +1,231 @@
+"""
+Логирование без блокировки event loop.
+
+Обработчик корневого логгера только кладет запись в ограниченную очередь
+(QueueHandler); форматирование в JSON и запись в stderr выполняет поток
+QueueListener. Если очередь переполнена, запись отбрасывается, а не ждет.
+К каждой записи добавляются id запроса, маршрут и id пользователя; в конце
+запроса AccessLogMiddleware пишет запись с кодом ответа и временем обработки.
+
+Выборка: запрос попадает в лог с вероятностью LOG_SAMPLE_RATE. В
+невыбранных запросах отбрасываются записи ниже WARNING, включая запись
+об успешном ответе; ошибки и ответы 4xx/5xx пишутся всегда.
+"""
+
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from .context import RequestState, request_id_var, request_state_var, route_var
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# json — одна JSON-строка на запись, text — для чтения глазами
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+access_logger = logging.getLogger("app.access")
+
+# Стандартные атрибуты LogRecord; остальные (extra=...) попадают в JSON
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class ContextFilter(logging.Filter):
+    """
+    Выборка и контекст запроса. Выполняется в потоке, создавшем запись,
+    где доступны contextvars запроса
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        state = request_state_var.get()
+        if state is not None and not state.sampled and record.levelno < logging.WARNING:
+            return False
+        record.request_id = request_id_var.get()
+        record.route = route_var.get()
+        record.user_id = state.user_id if state is not None else None
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    QueueHandler, который не ждет места в очереди и откладывает
+    форматирование в поток QueueListener
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Здесь только подстановка аргументов: объекты из args могут
+        # измениться, пока запись ждет в очереди. JSON собирается в потоке
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Запись лога одной JSON-строкой
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and value is not None:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class StderrHandler(logging.StreamHandler):
+    """
+    Запись в текущий sys.stderr (он может быть подменен после настройки)
+    """
+
+    @property
+    def stream(self):
+        return sys.stderr
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+_listener: QueueListener | None = None
+queue_handler: NonBlockingQueueHandler | None = None
+
+
+def configure_logging():
+    """
+    Подключение очереди логов к корневому логгеру (повторный вызов
+    ничего не делает)
+    :return: Ничего не возвращает
+    """
+    global _listener, queue_handler
+    if _listener is not None:
+        return
+
+    output = StderrHandler()
+    if LOG_FORMAT == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(
+            logging.Formatter(
+                "%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"
+            )
+        )
+
+    queue_handler = NonBlockingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    queue_handler.addFilter(ContextFilter())
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    root.addHandler(queue_handler)
+
+    _listener = QueueListener(queue_handler.queue, output)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """
+    Запись оставшихся в очереди логов и остановка потока
+    :return: Ничего не возвращает
+    """
+    global _listener, queue_handler
+    if _listener is None:
+        return
+    logging.getLogger().removeHandler(queue_handler)
+    _listener.stop()
+    _listener = None
+    queue_handler = None
+
+
+class AccessLogMiddleware:
+    """
+    ASGI-middleware: решение о выборке запроса и запись о его завершении.
+    Подключается внутри RequestContextMiddleware, чтобы id запроса был задан
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        state = RequestState(sampled=random.random() < LOG_SAMPLE_RATE)
+        state_token = request_state_var.set(state)
+        started_at = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        except Exception:
+            self.log(state, started_at, 500, exc_info=True)
+            raise
+        else:
+            self.log(state, started_at, status)
+        finally:
+            request_state_var.reset(state_token)
+
+    @staticmethod
+    def log(state: RequestState, started_at: float, status: int, exc_info=False):
+        if status >= 500:
+            level = logging.ERROR
+        elif status >= 400:
+            level = logging.WARNING
+        else:
+            level = logging.INFO
+        # Проверки до создания записи: невыбранный успешный запрос ничего не стоит
+        if level == logging.INFO and not state.sampled:
+            return
+        if not access_logger.isEnabledFor(level):
+            return
+        access_logger.log(
+            level,
+            "%s %s",
+            route_var.get(),
+            status,
+            exc_info=exc_info,
+            extra={
+                "status": status,
+                "latency_ms": round((time.perf_counter() - started_at) * 1000, 2),
+            },
+        )
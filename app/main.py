@@ -1,10 +1,23 @@
 import os
+from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.exceptions import HTTPException, RequestValidationError
 from fastapi.responses import JSONResponse
 
-from .routers.tweets import router
+from .cache_snapshot import save_job, snapshot_state_job
+from .compression import CompressionMiddleware
+from .context import RequestContextMiddleware
+from .database import engine
+from .invalidation import invalidation_listener, invalidation_log_pruner
+from .like_counters import like_counter_compactor
+from .logs import AccessLogMiddleware, configure_logging
+from .notifications import notification_aggregator, notification_flusher
+from .routers import admin, health, notifications, tweets, uploads
+from .startup import startup_state, warm_up
+from .uploads import upload_collector
+
+configure_logging()
 
 
 def get_dist_dir():
@@ -13,17 +26,47 @@ def get_dist_dir():
     return dist_dir
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Каждый воркер прогревает пул и кэши выражений до приема трафика
+    await warm_up()
+    yield
+    startup_state.ready = False
+    # Момент снимка кэшей фиксируется, пока слушатель еще получает события:
+    # более поздние события досылаются из журнала при следующем старте
+    snapshot_state = await snapshot_state_job()
+    await invalidation_listener.stop()
+    await invalidation_log_pruner.stop()
+    await like_counter_compactor.stop()
+    await upload_collector.stop()
+    await notification_flusher.stop()
+    # События, накопленные с последнего сброса
+    await notification_aggregator.flush()
+    # Снимок кэшей для быстрого старта следующего воркера
+    await save_job(snapshot_state)
+    await engine.dispose()
+
+
 app = FastAPI(
     title="Tweet-clone",
     description="Мини версия Tweet с минимальной функциональностью",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
-app.include_router(router)
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(AccessLogMiddleware)
+app.add_middleware(RequestContextMiddleware)
+
+app.include_router(tweets.router)
+app.include_router(uploads.router)
+app.include_router(notifications.router)
+app.include_router(admin.router)
+app.include_router(health.router)
 
 
 @app.exception_handler(HTTPException)
-async def http_exception_handler(exc: HTTPException):
+async def http_exception_handler(request: Request, exc: HTTPException):
     return JSONResponse(
         status_code=exc.status_code,
         content={
@@ -35,7 +78,7 @@ async def http_exception_handler(exc: HTTPException):
 
 
 @app.exception_handler(RequestValidationError)
-async def validation_exception_handler(exc: RequestValidationError):
+async def validation_exception_handler(request: Request, exc: RequestValidationError):
     return JSONResponse(
         status_code=422,
         content={
@@ -47,7 +90,7 @@ async def validation_exception_handler(exc: RequestValidationError):
 
 
 @app.exception_handler(Exception)
-async def generic_exception_handler(exc: Exception):
+async def generic_exception_handler(request: Request, exc: Exception):
     return JSONResponse(
         status_code=500,
         content={"result": False, "error_type": "Exception", "error_message": str(exc)},
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Метаданные медиафайлов и ссылки на них.
+
+При сохранении медиа MIME-тип и размеры изображения (PNG, JPEG, GIF,
+WebP) определяются по заголовку файла, для остальных файлов MIME-тип
+берется по расширению. Все это хранится в таблице media, и лента не
+разбирает имена файлов на каждый запрос.
+
+Ссылку строит media_url: база MEDIA_BASE_URL (nginx или внешний CDN) и
+имя файла. Имя уникально (uuid) и содержимое под ним не меняется, поэтому
+ответ можно кэшировать как immutable. С MEDIA_URL_SECRET ссылки
+подписываются HMAC-SHA256 и действуют ограниченное время; подпись
+проверяет verify_media_signature (эндпоинт для auth_request nginx или CDN).
+
+Заполнение метаданных для уже загруженных файлов:
+python -m app.media backfill
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import hmac
+import logging
+import mimetypes
+import os
+import struct
+import time
+from typing import BinaryIO, NamedTuple, cast
+from urllib.parse import quote, urlsplit
+
+from sqlalchemy import select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import conftest
+
+from .database import SessionLocal
+from .models import Media
+
+MEDIA_BASE_URL = os.getenv("MEDIA_BASE_URL", "http://0.0.0.0/media").rstrip("/")
+# Пустое значение — ссылки без подписи
+MEDIA_URL_SECRET = os.getenv("MEDIA_URL_SECRET", "")
+MEDIA_URL_TTL = int(os.getenv("MEDIA_URL_TTL", str(24 * 3600)))
+MEDIA_BACKFILL_BATCH_SIZE = int(os.getenv("MEDIA_BACKFILL_BATCH_SIZE", "500"))
+
+# Путь ссылки без хоста: именно его видит nginx и он входит в подпись
+_MEDIA_PATH = urlsplit(MEDIA_BASE_URL).path
+# Вложения, которые фронтенд показывает как изображения (attachments)
+IMAGE_TYPES = frozenset({"image/png", "image/jpeg", "image/gif"})
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# Маркеры JPEG с размерами кадра (SOF0-SOF15, кроме DHT, JPG и DAC)
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7} | {
+    0xC9,
+    0xCA,
+    0xCB,
+    0xCD,
+    0xCE,
+    0xCF,
+}
+
+
+class MediaInfo(NamedTuple):
+    mime_type: str
+    size: int | None
+    width: int | None
+    height: int | None
+
+
+def get_media_dir() -> str:
+    """
+    Директория медиафайлов
+    :return: Путь к директории
+    """
+    if conftest.TESTING:
+        return "/tmp/media"  # Используем временную директорию
+    return "/app/media"
+
+
+def _image_size(header: bytes) -> tuple[str, int, int] | None:
+    if header.startswith(_PNG_SIGNATURE) and header[12:16] == b"IHDR":
+        width, height = struct.unpack(">II", header[16:24])
+        return "image/png", width, height
+    if header[:6] in (b"GIF87a", b"GIF89a"):
+        width, height = struct.unpack("<HH", header[6:10])
+        return "image/gif", width, height
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        chunk = header[12:16]
+        if chunk == b"VP8 ":
+            width, height = struct.unpack("<HH", header[26:30])
+            return "image/webp", width & 0x3FFF, height & 0x3FFF
+        if chunk == b"VP8L":
+            bits = int.from_bytes(header[21:25], "little")
+            return "image/webp", (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        if chunk == b"VP8X":
+            width = int.from_bytes(header[24:27], "little") + 1
+            height = int.from_bytes(header[27:30], "little") + 1
+            return "image/webp", width, height
+    return None
+
+
+def _jpeg_size(media_file: BinaryIO) -> tuple[int, int] | None:
+    # Сегменты JPEG идут подряд; размеры — в первом сегменте SOF
+    media_file.seek(2)
+    while True:
+        marker = media_file.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        code = marker[1]
+        if code == 0x01 or 0xD0 <= code <= 0xD9:
+            continue  # Маркеры без длины
+        length = media_file.read(2)
+        if len(length) < 2:
+            return None
+        if code in _JPEG_SOF:
+            frame = media_file.read(5)
+            if len(frame) < 5:
+                return None
+            height, width = struct.unpack(">HH", frame[1:5])
+            return width, height
+        media_file.seek(struct.unpack(">H", length)[0] - 2, os.SEEK_CUR)
+
+
+def guess_mime_type(filename: str) -> str:
+    return mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+
+def probe_media(path: str) -> MediaInfo:
+    """
+    Определение MIME-типа, размера и размеров изображения по файлу
+    :param path: Путь к файлу
+    :return: Метаданные файла
+    """
+    size = os.path.getsize(path)
+    with open(path, "rb") as media_file:
+        header = media_file.read(32)
+        image = _image_size(header)
+        if image is None and header[:2] == b"\xff\xd8":
+            dimensions = _jpeg_size(media_file)
+            if dimensions is not None:
+                image = ("image/jpeg", *dimensions)
+    if image is not None:
+        return MediaInfo(image[0], size, image[1], image[2])
+    return MediaInfo(guess_mime_type(path), size, None, None)
+
+
+def _sign(path: str, expires: int) -> str:
+    digest = hmac.new(
+        MEDIA_URL_SECRET.encode(), f"{path}:{expires}".encode(), hashlib.sha256
+    ).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+
+
+def media_url(filename: str, now: float | None = None) -> str:
+    """
+    Ссылка на медиафайл
+    :param filename: Имя файла в директории медиа
+    :param now: Текущее время (для тестов)
+    :return: Ссылка, с MEDIA_URL_SECRET — подписанная
+    """
+    name = quote(filename)
+    url = f"{MEDIA_BASE_URL}/{name}"
+    if not MEDIA_URL_SECRET:
+        return url
+    # Срок округляется до окна в половину TTL: в пределах окна ссылка
+    # одна и та же (кэшируется CDN и кэшем тел твитов) и действует еще
+    # не меньше половины TTL
+    window = max(MEDIA_URL_TTL // 2, 1)
+    now = time.time() if now is None else now
+    expires = (int(now) // window + 2) * window
+    return f"{url}?expires={expires}&sig={_sign(f'{_MEDIA_PATH}/{name}', expires)}"
+
+
+def verify_media_signature(
+    path: str, expires: str | None, signature: str | None, now: float | None = None
+) -> bool:
+    """
+    Проверка подписанной ссылки
+    :param path: Путь ссылки (без хоста и параметров)
+    :param expires: Параметр expires ссылки
+    :param signature: Параметр sig ссылки
+    :param now: Текущее время (для тестов)
+    :return: True, если подпись верна и срок не истек (или подпись отключена)
+    """
+    if not MEDIA_URL_SECRET:
+        return True
+    if expires is None or not expires.isdigit():
+        return False
+    expires_at = int(expires)
+    if expires_at < (time.time() if now is None else now):
+        return False
+    return hmac.compare_digest(_sign(path, expires_at), signature or "")
+
+
+def format_media(media: Media) -> dict:
+    """
+    Вложение твита для ответа API
+    :param media: Объект медиа
+    :return: Ссылка и метаданные вложения
+    """
+    filename = cast(str, media.filename)
+    return {
+        "id": media.id,
+        "url": media_url(filename),
+        # У файлов, загруженных до появления метаданных, тип — по расширению
+        "type": media.mime_type or guess_mime_type(filename),
+        "size": media.size,
+        "width": media.width,
+        "height": media.height,
+    }
+
+
+async def backfill_media_info(
+    db: AsyncSession, batch_size: int = MEDIA_BACKFILL_BATCH_SIZE
+) -> int:
+    """
+    Заполнение метаданных медиа, загруженных до их появления
+    :param db: Асинхронная сессия базы данных
+    :param batch_size: Количество файлов в пачке
+    :return: Количество обработанных файлов
+    """
+    last_id = 0
+    processed = 0
+    media_dir = get_media_dir()
+    while True:
+        result = await db.execute(
+            select(Media.id, Media.filename)
+            .where(Media.id > last_id, Media.mime_type.is_(None))
+            .order_by(Media.id)
+            .limit(batch_size)
+        )
+        rows = result.all()
+        if not rows:
+            break
+        for media_id, filename in rows:
+            path = os.path.join(media_dir, filename)
+            try:
+                info = await asyncio.to_thread(probe_media, path)
+            except FileNotFoundError:
+                info = MediaInfo(guess_mime_type(filename), None, None, None)
+            await db.execute(
+                update(Media).where(Media.id == media_id).values(**info._asdict())
+            )
+        await db.commit()
+
+        last_id = rows[-1][0]
+        processed += len(rows)
+        logging.info("Медиа: обработано файлов %s (до id %s)", processed, last_id)
+    return processed
+
+
+async def run(batch_size: int):
+    async with SessionLocal() as db:
+        # Столбцы метаданных в таблице, созданной до их появления
+        await db.execute(
+            text(
+                "ALTER TABLE media "
+                "ADD COLUMN IF NOT EXISTS mime_type varchar, "
+                "ADD COLUMN IF NOT EXISTS size bigint, "
+                "ADD COLUMN IF NOT EXISTS width integer, "
+                "ADD COLUMN IF NOT EXISTS height integer"
+            )
+        )
+        await db.commit()
+        await backfill_media_info(db, batch_size)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Метаданные медиафайлов")
+    parser.add_argument("command", choices=["backfill"])
+    parser.add_argument("--batch-size", type=int, default=MEDIA_BACKFILL_BATCH_SIZE)
+    asyncio.run(run(parser.parse_args().batch_size))
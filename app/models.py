@@ -1,6 +1,19 @@
 from typing import TYPE_CHECKING
 
-from sqlalchemy import ARRAY, Column, ForeignKey, Integer, String
+from sqlalchemy import (
+    ARRAY,
+    BigInteger,
+    Boolean,
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    func,
+    text,
+)
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import declarative_base, relationship
 
 if TYPE_CHECKING:
@@ -33,10 +46,12 @@ class Tweet(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     tweet_data = Column(String, index=True)
-    tweet_media_ids = Column(ARRAY(Integer), nullable=True)
     author_id = Column(
         Integer, ForeignKey("users.id", name="fk_author_us_id")
     )  # Внешний ключ для связи с таблицей users
+    created_at = Column(
+        DateTime(timezone=True), nullable=False, server_default=func.now()
+    )  # Порядок ленты (индекс ix_tweets_created_at_id)
     likes = relationship(
         "Like", back_populates="tweet", cascade="all, delete-orphan"
     )  # Обратное отношение к Like
@@ -45,6 +60,8 @@ class Tweet(Base):
         "User", back_populates="tweets"
     )  # Определение отношения к модели User
 
+    __table_args__ = (Index("ix_tweets_created_at_id", created_at.desc(), id.desc()),)
+
 
 # Модель Like
 class Like(Base):
@@ -58,6 +75,8 @@ class Like(Base):
     user = relationship("User", back_populates="likes")
     tweet = relationship("Tweet", back_populates="likes")
 
+    __table_args__ = (Index("ix_likes_tweet_id_user_id", tweet_id, user_id),)
+
 
 # Модель Media
 class Media(Base):
@@ -65,7 +84,14 @@ class Media(Base):
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     filename = Column(String, index=True, nullable=False)
     user_id = Column(Integer, ForeignKey("users.id", name="fk_use_id"), nullable=False)
-    tweet_id = Column(Integer, ForeignKey("tweets.id", name="fk_twe_id"), nullable=True)
+    tweet_id = Column(
+        Integer, ForeignKey("tweets.id", name="fk_twe_id"), nullable=True, index=True
+    )  # Индекс нужен удалению твита (открепление медиа)
+    # Метаданные файла, определяются при загрузке (см. media.py)
+    mime_type = Column(String, nullable=True)
+    size = Column(BigInteger, nullable=True)
+    width = Column(Integer, nullable=True)
+    height = Column(Integer, nullable=True)
 
     user = relationship("User", back_populates="media")
     tweet = relationship("Tweet", back_populates="media_items")
@@ -88,3 +114,140 @@ class Follower(Base):
     followed = relationship(
         "User", foreign_keys=[followed_id], back_populates="followers"
     )
+
+
+# Модель предрассчитанных рекомендаций «Кого читать»
+class UserSuggestion(Base):
+    __tablename__ = "user_suggestions"
+
+    user_id = Column(
+        Integer,
+        ForeignKey("users.id", name="fk_sugg_us_id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    rank = Column(Integer, primary_key=True)
+    suggested_id = Column(
+        Integer,
+        ForeignKey("users.id", name="fk_sugg_sugg_id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    score = Column(Integer, nullable=False)  # Количество общих связей
+
+    suggested = relationship("User", foreign_keys=[suggested_id])
+
+
+# Модель LikeCounterShard: счетчик лайков твита, разбитый на несколько строк,
+# чтобы параллельные лайки одного твита не ждали блокировку одной строки
+class LikeCounterShard(Base):
+    __tablename__ = "like_counter_shards"
+
+    tweet_id = Column(
+        Integer,
+        ForeignKey("tweets.id", name="fk_shard_tw_id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    shard = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+
+# Модель TweetTag: хэштеги твита в нормализованном виде (без "#", casefold).
+# Индекс (tag, tweet_id DESC) отдает ленту тега сканированием диапазона
+class TweetTag(Base):
+    __tablename__ = "tags"
+
+    tweet_id = Column(
+        Integer,
+        ForeignKey("tweets.id", name="fk_tag_tw_id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    tag = Column(String, primary_key=True)
+
+    __table_args__ = (Index("ix_tags_tag_tweet_id", tag, tweet_id.desc()),)
+
+
+# Модель TweetMention: упоминания пользователей (@name) в твите
+class TweetMention(Base):
+    __tablename__ = "mentions"
+
+    tweet_id = Column(
+        Integer,
+        ForeignKey("tweets.id", name="fk_ment_tw_id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    user_id = Column(
+        Integer,
+        ForeignKey("users.id", name="fk_ment_us_id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+
+    __table_args__ = (Index("ix_mentions_user_id_tweet_id", user_id, tweet_id.desc()),)
+
+
+# Модель Notification: агрегированное уведомление («X и еще 47 лайкнули
+# ваш твит»). Пока уведомление не прочитано, новые события той же группы
+# (получатель, тип, твит) добавляются в него, а не создают новую строку
+class Notification(Base):
+    __tablename__ = "notifications"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(
+        Integer,
+        ForeignKey("users.id", name="fk_notif_us_id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    kind = Column(String, nullable=False)  # "like" или "follow"
+    tweet_id = Column(Integer, nullable=False, default=0)  # 0 — без твита
+    actor_ids = Column(ARRAY(Integer), nullable=False)  # Последние участники
+    actor_count = Column(Integer, nullable=False)
+    read = Column(Boolean, nullable=False, default=False)
+    updated_at = Column(
+        DateTime(timezone=True), nullable=False, server_default=func.now()
+    )
+
+    __table_args__ = (
+        Index("ix_notifications_user_id_id", user_id, id.desc()),
+        Index(
+            "ux_notifications_unread_group",
+            user_id,
+            kind,
+            tweet_id,
+            unique=True,
+            postgresql_where=text("NOT read"),
+        ),
+    )
+
+
+# Модель NotificationCounter: количество непрочитанных уведомлений,
+# поддерживается при записи и не пересчитывается при чтении
+class NotificationCounter(Base):
+    __tablename__ = "notification_counters"
+
+    user_id = Column(
+        Integer,
+        ForeignKey("users.id", name="fk_notif_cnt_us_id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    unread = Column(Integer, nullable=False, default=0)
+
+
+# Модель CacheInvalidation: журнал событий шины инвалидации, одна строка
+# на транзакцию. По нему воркер, загрузивший снимок кэшей, досылает события,
+# пропущенные за время простоя; записи старше INVALIDATION_LOG_RETENTION
+# удаляются
+class CacheInvalidation(Base):
+    __tablename__ = "cache_invalidations"
+
+    seq = Column(BigInteger, primary_key=True)
+    # Тема -> список ключей (null — вся тема)
+    events = Column(JSONB, nullable=False)
+    logged_at = Column(
+        DateTime(timezone=True),
+        nullable=False,
+        server_default=func.clock_timestamp(),
+    )
+
+    # Строки добавляются в порядке времени: BRIN-индекс почти не стоит
+    # ничего при вставке и годится для выборки и удаления по диапазону
+    __table_args__ = (
+        Index("ix_cache_invalidations_logged_at", logged_at, postgresql_using="brin"),
+    )
@@ -0,0 +1,267 @@
+"""
+Уведомления о лайках и подписках.
+
+События не пишутся в БД на горячих путях: create_like и
+create_follow_relationship после commit только добавляют их в агрегатор
+воркера. Агрегатор схлопывает события одной группы (получатель, тип,
+твит) и раз в NOTIFICATION_FLUSH_INTERVAL секунд сбрасывает все группы
+одним запросом. В БД непрочитанное уведомление группы одно: новые события
+добавляются в него («X и еще 47 лайкнули ваш твит»). Счетчик непрочитанных
+меняется в том же запросе и при чтении не пересчитывается.
+
+События, не сброшенные до аварийной остановки воркера, теряются.
+"""
+
+import asyncio
+import logging
+import os
+from typing import cast
+
+from sqlalchemy import ARRAY, Integer, any_, bindparam, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .database import SessionLocal
+from .models import Notification, NotificationCounter, User
+from .periodic import PeriodicTask
+
+NOTIFICATION_FLUSH_INTERVAL = float(os.getenv("NOTIFICATION_FLUSH_INTERVAL", "5"))
+# При таком числе групп сброс запускается, не дожидаясь интервала
+NOTIFICATION_MAX_PENDING = int(os.getenv("NOTIFICATION_MAX_PENDING", "10000"))
+# Сколько последних участников хранится в уведомлении
+NOTIFICATION_ACTORS = 3
+
+_UPSERT_NOTIFICATIONS = text(
+    f"""
+    WITH events AS (
+        SELECT * FROM unnest(
+            CAST(:user_ids AS integer[]),
+            CAST(:kinds AS varchar[]),
+            CAST(:tweet_ids AS integer[]),
+            CAST(:actors AS varchar[]),
+            CAST(:counts AS integer[])
+        ) AS e(user_id, kind, tweet_id, actors, actor_count)
+    ), upserted AS (
+        INSERT INTO notifications
+            (user_id, kind, tweet_id, actor_ids, actor_count, read, updated_at)
+        SELECT user_id, kind, tweet_id, CAST(string_to_array(actors, ',') AS
+            integer[]), actor_count, false, now()
+        FROM events
+        ON CONFLICT (user_id, kind, tweet_id) WHERE NOT read DO UPDATE SET
+            actor_ids = ARRAY(
+                SELECT actor
+                FROM unnest(excluded.actor_ids || notifications.actor_ids)
+                    WITH ORDINALITY AS a(actor, position)
+                GROUP BY actor
+                ORDER BY min(position)
+                LIMIT {NOTIFICATION_ACTORS}
+            ),
+            actor_count = notifications.actor_count + excluded.actor_count,
+            updated_at = excluded.updated_at
+        RETURNING user_id, (xmax = 0) AS inserted
+    )
+    INSERT INTO notification_counters (user_id, unread)
+    SELECT user_id, count(*) FROM upserted WHERE inserted GROUP BY user_id
+    ON CONFLICT (user_id) DO UPDATE
+        SET unread = notification_counters.unread + excluded.unread
+    """
+)
+
+_MARK_READ = text(
+    """
+    WITH marked AS (
+        UPDATE notifications SET read = true
+        WHERE user_id = :user_id AND NOT read
+            AND (CAST(:up_to AS integer) IS NULL OR id <= :up_to)
+        RETURNING id
+    )
+    UPDATE notification_counters
+    SET unread = greatest(unread - (SELECT count(*) FROM marked), 0)
+    WHERE user_id = :user_id
+    RETURNING unread
+    """
+)
+
+
+class PendingGroup:
+    """
+    События одной группы, накопленные с последнего сброса
+    """
+
+    __slots__ = ("actor_ids", "count")
+
+    def __init__(self):
+        self.actor_ids: list[int] = []
+        self.count = 0
+
+
+class NotificationAggregator:
+    """
+    Внутрипроцессный агрегатор событий уведомлений
+    """
+
+    def __init__(self, max_pending: int = NOTIFICATION_MAX_PENDING):
+        self.max_pending = max_pending
+        self._pending: dict[tuple[int, str, int], PendingGroup] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: asyncio.Task | None = None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, user_id: int | None, kind: str, actor_id: int, tweet_id: int = 0):
+        """
+        Регистрация события (вызывается после commit)
+        :param user_id: ID получателя
+        :param kind: Тип события ("like", "follow")
+        :param actor_id: ID пользователя, совершившего действие
+        :param tweet_id: ID твита или 0
+        :return: Ничего не возвращает
+        """
+        if user_id is None or user_id == actor_id:
+            return
+        key = (user_id, kind, tweet_id)
+        group = self._pending.get(key)
+        if group is None:
+            group = self._pending[key] = PendingGroup()
+        if actor_id in group.actor_ids:
+            group.actor_ids.remove(actor_id)
+        group.actor_ids.insert(0, actor_id)
+        del group.actor_ids[NOTIFICATION_ACTORS:]
+        group.count += 1
+
+        if len(self._pending) >= self.max_pending and (
+            self._flush_task is None or self._flush_task.done()
+        ):
+            self._flush_task = asyncio.get_running_loop().create_task(self.flush())
+
+    def _restore(self, pending: dict):
+        # Сброс не удался: возвращаем события, сохраняя более новые
+        for key, group in pending.items():
+            current = self._pending.get(key)
+            if current is None:
+                self._pending[key] = group
+            else:
+                current.actor_ids = list(
+                    dict.fromkeys(current.actor_ids + group.actor_ids)
+                )[:NOTIFICATION_ACTORS]
+                current.count += group.count
+
+    async def flush(self, db: AsyncSession | None = None) -> int:
+        """
+        Запись накопленных групп одним запросом
+        :param db: Сессия БД; по умолчанию открывается новая
+        :return: Количество записанных групп
+        """
+        async with self._flush_lock:
+            pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+
+            params: dict[str, list] = {
+                "user_ids": [],
+                "kinds": [],
+                "tweet_ids": [],
+                "actors": [],
+                "counts": [],
+            }
+            for (user_id, kind, tweet_id), group in pending.items():
+                params["user_ids"].append(user_id)
+                params["kinds"].append(kind)
+                params["tweet_ids"].append(tweet_id)
+                params["actors"].append(",".join(map(str, group.actor_ids)))
+                params["counts"].append(group.count)
+
+            try:
+                if db is None:
+                    async with SessionLocal() as session:
+                        await session.execute(_UPSERT_NOTIFICATIONS, params)
+                        await session.commit()
+                else:
+                    await db.execute(_UPSERT_NOTIFICATIONS, params)
+                    await db.commit()
+            except Exception:
+                self._restore(pending)
+                raise
+        return len(pending)
+
+
+notification_aggregator = NotificationAggregator()
+
+
+async def flush_job():
+    flushed = await notification_aggregator.flush()
+    if flushed:
+        logging.info("Записано групп уведомлений: %s", flushed)
+
+
+notification_flusher = PeriodicTask(
+    "notification_flush", NOTIFICATION_FLUSH_INTERVAL, flush_job
+)
+
+
+async def get_unread_count(user_id: int, db: AsyncSession) -> int:
+    result = await db.execute(
+        select(NotificationCounter.unread).where(NotificationCounter.user_id == user_id)
+    )
+    return result.scalar() or 0
+
+
+async def get_notifications(
+    user_id: int, db: AsyncSession, limit: int, before: int | None = None
+) -> list:
+    """
+    Уведомления пользователя от новых к старым (постранично по id)
+    :param user_id: ID пользователя
+    :param db: Асинхронная сессия базы данных
+    :param limit: Размер страницы
+    :param before: Курсор: id последнего уведомления предыдущей страницы
+    :return: Список уведомлений
+    """
+    query = select(Notification).where(Notification.user_id == user_id)
+    if before is not None:
+        query = query.where(Notification.id < before)
+    result = await db.execute(query.order_by(Notification.id.desc()).limit(limit))
+    notifications = result.scalars().all()
+    actors = {item.id: cast(list[int], item.actor_ids) for item in notifications}
+
+    # Имена участников всей страницы — одним запросом
+    actor_ids = list({actor for ids in actors.values() for actor in ids})
+    names: dict[int, str] = {}
+    if actor_ids:
+        users = await db.execute(
+            select(User.id, User.name).where(
+                User.id == any_(bindparam("actor_ids", actor_ids, type_=ARRAY(Integer)))
+            )
+        )
+        names = {actor: name for actor, name in users.all()}
+
+    return [
+        {
+            "id": item.id,
+            "kind": item.kind,
+            "tweet_id": item.tweet_id or None,
+            "actors": [
+                {"id": actor, "name": names.get(actor)} for actor in actors[item.id]
+            ],
+            "actor_count": item.actor_count,
+            "read": item.read,
+            "updated_at": item.updated_at.isoformat(),
+        }
+        for item in notifications
+    ]
+
+
+async def mark_notifications_read(
+    user_id: int, db: AsyncSession, up_to: int | None = None
+) -> int:
+    """
+    Отметка уведомлений прочитанными
+    :param user_id: ID пользователя
+    :param db: Асинхронная сессия базы данных
+    :param up_to: Отметить уведомления с id не больше данного; None — все
+    :return: Количество оставшихся непрочитанных
+    """
+    result = await db.execute(_MARK_READ, {"user_id": user_id, "up_to": up_to})
+    unread = result.scalar()
+    await db.commit()
+    return unread or 0
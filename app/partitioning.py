@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Необязательная секционированная схема likes и ее онлайн-миграция.
+
+likes секционируется по HASH (tweet_id): лайки одного твита (проверка
+лайка, удаление лайка, удаление твита) лежат в одной секции, а vacuum и
+индексы работают с секциями в 1/LIKES_PARTITIONS таблицы. Первичный ключ
+становится составным (id, tweet_id); внешние ключи на users и tweets
+сохраняются.
+
+tweets не секционируется: поиск твита по id (загрузчики, тела твитов,
+удаление) не содержит ключа секционирования и читал бы все месячные
+секции. Для ленты достаточно индекса (created_at DESC, id DESC).
+
+Миграция выполняется без остановки записи: новая таблица наполняется
+пачками, а изменения исходной таблицы на время копирования дублируются
+триггером. В конце таблицы меняются местами в короткой транзакции.
+Недостающие created_at и индексы ленты и media.tweet_id создаются
+до секционирования.
+
+Запуск:
+    python -m app.partitioning migrate [--likes-partitions 8]
+    python -m app.partitioning drop-old
+    python -m app.partitioning status
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from .database import engine
+
+LIKES_PARTITIONS = int(os.getenv("LIKES_PARTITIONS", "8"))
+MIGRATION_BATCH_SIZE = int(os.getenv("PARTITION_MIGRATION_BATCH_SIZE", "10000"))
+
+# Таблица -> DDL секционированной копии, ее индексы, условие поиска строки
+# для триггера синхронизации и внешние ключи исходной таблицы: у копии
+# *_old они удаляются, чтобы она не мешала удалять твиты и пользователей
+PARTITIONED_TABLES = {
+    "likes": {
+        "ddl": """
+            CREATE TABLE likes_partitioned (
+                LIKE likes INCLUDING DEFAULTS,
+                PRIMARY KEY (id, tweet_id),
+                CONSTRAINT fk_likes_p_user_id
+                    FOREIGN KEY (user_id) REFERENCES users (id),
+                CONSTRAINT fk_likes_p_tweet_id
+                    FOREIGN KEY (tweet_id) REFERENCES tweets (id)
+            ) PARTITION BY HASH (tweet_id)
+        """,
+        "indexes": [
+            "CREATE INDEX ix_likes_p_tweet_id_user_id "
+            "ON likes_partitioned (tweet_id, user_id)",
+            # Лайки читателя на странице ленты: один спуск по индексу на секцию
+            "CREATE INDEX ix_likes_p_user_id_tweet_id "
+            "ON likes_partitioned (user_id, tweet_id)",
+        ],
+        "row_match": "id = {row}.id AND tweet_id = {row}.tweet_id",
+        "foreign_keys": ["fk_user_id", "fk_tw_id"],
+    },
+}
+
+# Индексы несекционированных таблиц, которых может не быть в старой схеме
+INDEXES = [
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_tweets_created_at_id "
+    "ON tweets (created_at DESC, id DESC)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_media_tweet_id ON media (tweet_id)",
+]
+
+
+async def is_partitioned(conn: AsyncConnection, table: str) -> bool:
+    result = await conn.execute(
+        text("SELECT relkind::text FROM pg_class " "WHERE oid = to_regclass(:table)"),
+        {"table": table},
+    )
+    return result.scalar() == "p"
+
+
+async def create_partitioned_table(
+    conn: AsyncConnection, table: str, likes_partitions: int
+):
+    config = PARTITIONED_TABLES[table]
+    new_table = f"{table}_partitioned"
+    await conn.execute(text(config["ddl"]))
+
+    for remainder in range(likes_partitions):
+        await conn.execute(
+            text(
+                f"CREATE TABLE {table}_p{remainder:02d} PARTITION OF {new_table} "
+                f"FOR VALUES WITH (MODULUS {likes_partitions}, "
+                f"REMAINDER {remainder})"
+            )
+        )
+
+    for index_ddl in config["indexes"]:
+        await conn.execute(text(index_ddl))
+
+    # Триггер дублирует изменения исходной таблицы, пока идет копирование
+    old_match = config["row_match"].format(row="OLD")
+    await conn.execute(
+        text(
+            f"""
+            CREATE OR REPLACE FUNCTION {new_table}_sync() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    DELETE FROM {new_table} WHERE {old_match};
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    INSERT INTO {new_table} SELECT NEW.* ON CONFLICT DO NOTHING;
+                END IF;
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql
+            """
+        )
+    )
+    await conn.execute(
+        text(
+            f"CREATE TRIGGER {new_table}_sync "
+            f"AFTER INSERT OR UPDATE OR DELETE ON {table} "
+            f"FOR EACH ROW EXECUTE FUNCTION {new_table}_sync()"
+        )
+    )
+
+
+async def backfill(conn: AsyncConnection, table: str, batch_size: int) -> int:
+    """
+    Копирование строк в секционированную таблицу пачками по диапазонам id.
+    Каждая пачка — отдельная короткая транзакция; FOR SHARE не дает
+    параллельному UPDATE потеряться между чтением и вставкой
+    :param conn: Соединение с БД
+    :param table: Исходная таблица
+    :param batch_size: Размер диапазона id
+    :return: Количество скопированных строк
+    """
+    max_id = (
+        await conn.execute(text(f"SELECT coalesce(max(id), 0) FROM {table}"))
+    ).scalar()
+    await conn.commit()
+
+    copied = 0
+    for low in range(0, max_id, batch_size):
+        result = await conn.execute(
+            text(
+                f"INSERT INTO {table}_partitioned "
+                f"SELECT * FROM {table} WHERE id > :low AND id <= :high "
+                f"FOR SHARE ON CONFLICT DO NOTHING"
+            ),
+            {"low": low, "high": low + batch_size},
+        )
+        await conn.commit()
+        copied += result.rowcount
+        logging.info("%s: скопировано до id %s", table, low + batch_size)
+    return copied
+
+
+async def swap_tables(conn: AsyncConnection, table: str):
+    config = PARTITIONED_TABLES[table]
+    new_table = f"{table}_partitioned"
+    # Короткая блокировка: копия уже актуальна благодаря триггеру
+    await conn.execute(text(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE"))
+    await conn.execute(text(f"DROP TRIGGER {new_table}_sync ON {table}"))
+    await conn.execute(text(f"DROP FUNCTION {new_table}_sync()"))
+    for constraint in config["foreign_keys"]:
+        await conn.execute(
+            text(f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {constraint}")
+        )
+    await conn.execute(text(f"ALTER TABLE {table} RENAME TO {table}_old"))
+    await conn.execute(text(f"ALTER TABLE {new_table} RENAME TO {table}"))
+    await conn.execute(text(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id"))
+    await conn.commit()
+
+
+async def backfill_created_at(conn: AsyncConnection, batch_size: int) -> int:
+    """
+    Добавление created_at в схему, где его еще нет. Время создания старых
+    твитов нигде не хранилось, поэтому оно восстанавливается по порядку id:
+    каждый следующий твит на микросекунду новее предыдущего, последний —
+    время миграции. Так лента, упорядоченная по created_at, сохраняет
+    прежний порядок
+    :param conn: Соединение с БД
+    :param batch_size: Размер диапазона id
+    :return: Количество заполненных строк
+    """
+    columns = await conn.execute(
+        text(
+            "SELECT 1 FROM information_schema.columns "
+            "WHERE table_schema = current_schema() AND table_name = 'tweets' "
+            "AND column_name = 'created_at'"
+        )
+    )
+    if columns.scalar():
+        return 0
+    # Без DEFAULT добавление колонки не переписывает таблицу; новые твиты
+    # сразу получают now(), старые остаются NULL до заполнения
+    await conn.execute(text("ALTER TABLE tweets ADD COLUMN created_at timestamptz"))
+    await conn.execute(
+        text("ALTER TABLE tweets ALTER COLUMN created_at SET DEFAULT now()")
+    )
+    bounds = await conn.execute(text("SELECT coalesce(max(id), 0), now() FROM tweets"))
+    max_id, migrated_at = bounds.one()
+    await conn.commit()
+
+    filled = 0
+    for low in range(0, max_id, batch_size):
+        result = await conn.execute(
+            text(
+                "UPDATE tweets SET created_at = "
+                "CAST(:migrated_at AS timestamptz) "
+                "- (:max_id - id) * interval '1 microsecond' "
+                "WHERE id > :low AND id <= :high AND created_at IS NULL"
+            ),
+            {
+                "migrated_at": migrated_at,
+                "max_id": max_id,
+                "low": low,
+                "high": low + batch_size,
+            },
+        )
+        await conn.commit()
+        filled += result.rowcount
+        logging.info("tweets: created_at заполнен до id %s", low + batch_size)
+
+    await conn.execute(text("ALTER TABLE tweets ALTER COLUMN created_at SET NOT NULL"))
+    await conn.commit()
+    return filled
+
+
+async def create_indexes():
+    # CREATE INDEX CONCURRENTLY не выполняется внутри транзакции
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        for index_ddl in INDEXES:
+            await conn.execute(text(index_ddl))
+
+
+async def migrate(likes_partitions: int, batch_size: int):
+    async with engine.connect() as conn:
+        # Колонка created_at могла отсутствовать в старой схеме
+        filled = await backfill_created_at(conn, batch_size)
+        logging.info("tweets: created_at заполнен для строк: %s", filled)
+    await create_indexes()
+
+    async with engine.connect() as conn:
+        for table in PARTITIONED_TABLES:
+            if await is_partitioned(conn, table):
+                logging.info("%s уже секционирована", table)
+                continue
+            await create_partitioned_table(conn, table, likes_partitions)
+            await conn.commit()
+            copied = await backfill(conn, table, batch_size)
+            await swap_tables(conn, table)
+            logging.info("%s секционирована, скопировано строк: %s", table, copied)
+
+
+async def drop_old():
+    async with engine.connect() as conn:
+        for table in PARTITIONED_TABLES:
+            await conn.execute(text(f"DROP TABLE IF EXISTS {table}_old"))
+        await conn.commit()
+
+
+async def status() -> dict:
+    async with engine.connect() as conn:
+        report = {}
+        for table in PARTITIONED_TABLES:
+            partitions = await conn.execute(
+                text(
+                    "SELECT count(*) FROM pg_inherits "
+                    "WHERE inhparent = to_regclass(:table)"
+                ),
+                {"table": table},
+            )
+            report[table] = {
+                "partitioned": await is_partitioned(conn, table),
+                "partitions": partitions.scalar(),
+            }
+    return report
+
+
+async def run(args):
+    if args.command == "migrate":
+        await migrate(args.likes_partitions, args.batch_size)
+    elif args.command == "drop-old":
+        await drop_old()
+    logging.info("Состояние: %s", await status())
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Секционирование likes")
+    parser.add_argument("command", choices=["migrate", "drop-old", "status"])
+    parser.add_argument("--likes-partitions", type=int, default=LIKES_PARTITIONS)
+    parser.add_argument("--batch-size", type=int, default=MIGRATION_BATCH_SIZE)
+    asyncio.run(run(parser.parse_args()))
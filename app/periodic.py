@@ -0,0 +1,42 @@
+"""
+Периодические фоновые задачи воркера.
+"""
+
+import asyncio
+import logging
+import random
+from typing import Awaitable, Callable
+
+
+class PeriodicTask:
+    """
+    Задача, выполняющая job раз в interval секунд (со случайным сдвигом,
+    чтобы воркеры не просыпались одновременно). interval <= 0 отключает ее
+    """
+
+    def __init__(self, name: str, interval: float, job: Callable[[], Awaitable]):
+        self.name = name
+        self.interval = interval
+        self.job = job
+        self._task: asyncio.Task | None = None
+
+    async def start(self):
+        if self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval * random.uniform(0.5, 1.5))
+            try:
+                await self.job()
+            except Exception:
+                logging.exception("Ошибка фоновой задачи %s", self.name)
@@ -0,0 +1,80 @@
+import os
+
+from fastapi import APIRouter, Depends, Header, Query, Request
+from fastapi.exceptions import HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+import conftest
+from app.bulk_import import KIND_TYPES, import_ndjson
+from app.cache import caches
+from app.database import get_db
+from app.export import ExportKind, get_export_sessionmaker, iter_ndjson
+from app.slow_queries import slow_queries
+
+ADMIN_API_KEY = os.getenv("ADMIN_API_KEY")
+
+
+async def require_admin(api_key: str = Header(None)):
+    if conftest.TESTING:
+        return
+
+    if not ADMIN_API_KEY or api_key != ADMIN_API_KEY:
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+
+router = APIRouter(prefix="/api/admin", dependencies=[Depends(require_admin)])
+
+
+@router.get(
+    "/export/{kind}",
+    description="Потоковая выгрузка твитов, лайков или подписок в NDJSON",
+)
+async def export_data(
+    kind: ExportKind,
+    gzip: bool = Query(False),
+    session_factory: sessionmaker = Depends(get_export_sessionmaker),
+):
+    # Сессия открывается внутри генератора: она должна жить, пока идет ответ
+    async def stream():
+        async with session_factory() as db:
+            async for chunk in iter_ndjson(kind, db, compress=gzip):
+                yield chunk
+
+    filename = f"{kind.value}.ndjson" + (".gz" if gzip else "")
+    return StreamingResponse(
+        stream(),
+        media_type="application/gzip" if gzip else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.post(
+    "/import",
+    description="Массовый импорт твитов, лайков и подписок из потока NDJSON",
+)
+async def import_data(
+    request: Request,
+    kind: ExportKind | None = Query(None),
+    db: AsyncSession = Depends(get_db),
+):
+    default_type = KIND_TYPES[kind] if kind else None
+    report = await import_ndjson(request.stream(), db, default_type)
+
+    return {"result": True, **report}
+
+
+@router.get("/cache", description="Статистика внутрипроцессных кэшей")
+async def cache_stats():
+    return {
+        "result": True,
+        "caches": {name: cache.stats() for name, cache in caches.items()},
+    }
+
+
+@router.get("/slow-queries", description="Журнал медленных SQL-запросов")
+async def get_slow_queries(limit: int = Query(50, ge=1, le=1000)):
+    # Новые записи — первыми
+    entries = list(slow_queries)[-limit:][::-1]
+    return {"result": True, "queries": entries}
@@ -0,0 +1,19 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from app.startup import startup_state
+
+router = APIRouter(prefix="/api/health")
+
+
+@router.get("/live", description="Процесс запущен")
+async def liveness():
+    return {"result": True}
+
+
+@router.get("/ready", description="Воркер прогрет и готов принимать трафик")
+async def readiness():
+    return JSONResponse(
+        status_code=200 if startup_state.ready else 503,
+        content={"result": startup_state.ready, "startup": startup_state.timings_ms},
+    )
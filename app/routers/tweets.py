@@ -1,114 +1,211 @@
+import asyncio
 import logging
+from urllib.parse import parse_qs, urlsplit
 
-from fastapi import APIRouter, Depends, File, Header, UploadFile
+from fastapi import APIRouter, Depends, File, Header, Query, Response, UploadFile
 from fastapi.exceptions import HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 
 import conftest
 from app.crud import (
+    RequestLoaders,
     check_follow_relationship,
-    check_like_exists,
     create_follow_relationship,
     create_like,
     create_new_tweet,
     delete_follower_relationship,
+    delete_like,
     delete_tweet_from_db,
-    format_tweet_list,
-    format_user_profile_response,
-    get_all_tweets,
+    get_cached_user_profile,
+    get_feed,
     get_follower_relationship,
-    get_like_relation,
-    get_tweet_by_id,
+    get_loaders,
+    get_mention_tweet_ids,
+    get_tag_tweet_ids,
     get_user_by_id_or_api_key,
-    remove_like_relation,
+    get_user_suggestions,
+    get_viewer_profile,
+    hydrate_tweets,
     save_file,
     save_media_to_db,
 )
 from app.database import get_db
+from app.media import verify_media_signature
 from app.schemas import TweetCreate
 
 router = APIRouter()
 
-logging.basicConfig(level=logging.INFO)
+
+async def get_viewer_id(api_key: str | None, loaders: RequestLoaders) -> int | None:
+    """
+    Читатель публичной страницы: без api-key или с неизвестным ключом
+    (фронтенд всегда отправляет заголовок) — анонимный
+    :param api_key: Ключ из заголовка запроса
+    :param loaders: Загрузчики запроса
+    :return: ID пользователя или None
+    """
+    if api_key is None:
+        return None
+    try:
+        return (await loaders.users.load(api_key)).id
+    except HTTPException as exc:
+        if exc.status_code == 404:
+            return None
+        raise
 
 
 @router.post("/api/tweets", description="Создает новый твит")
 async def create_tweet(
-    tweet: TweetCreate, api_key: str = Header(None), db: AsyncSession = Depends(get_db)
+    tweet: TweetCreate,
+    api_key: str = Header(None),
+    db: AsyncSession = Depends(get_db),
+    loaders: RequestLoaders = Depends(get_loaders),
 ):
     # Найти текущего пользователя по api_key
     if conftest.TESTING:
         api_key = "test"
 
-    current_user = await get_user_by_id_or_api_key(api_key, db)
+    current_user = await loaders.users.load(api_key)
 
-    logging.info(f"Пробуем создать новый твит для {current_user} в API/TWEETS")
-    db_tweet = await create_new_tweet(
+    logging.debug("Создание твита пользователем %s", current_user.id)
+    tweet_id = await create_new_tweet(
         tweet.tweet_data, current_user.id, tweet.tweet_media_ids or [], db
     )
-    logging.info(f"Новый твит для {current_user} СОЗДАН!!!")
+    logging.debug("Создан твит %s", tweet_id)
 
-    return {"result": True, "tweet_id": db_tweet.id}
+    return {"result": True, "tweet_id": tweet_id}
 
 
 @router.get("/api/users/me", description="Страница текущего пользователя")
 async def get_user_info(
-    api_key: str = Header(None), db: AsyncSession = Depends(get_db)
+    api_key: str = Header(None),
+    db: AsyncSession = Depends(get_db),
+    loaders: RequestLoaders = Depends(get_loaders),
 ):
     if conftest.TESTING:
         api_key = "test"
 
-    logging.info(f"Получаем юзера по ключу: {api_key}")
-    user = await get_user_by_id_or_api_key(api_key, db)
+    user = await loaders.users.load(api_key)
 
-    response = await format_user_profile_response(user)
+    response = await get_cached_user_profile(user.id, db)
 
     return response
 
 
+@router.get(
+    "/api/users/me/suggestions",
+    description="Рекомендации «Кого читать» для текущего пользователя",
+)
+async def get_suggestions(
+    api_key: str = Header(None), db: AsyncSession = Depends(get_db)
+):
+    if conftest.TESTING:
+        api_key = "test"
+
+    current_user = await get_user_by_id_or_api_key(api_key, db)
+    suggestions = await get_user_suggestions(int(current_user.id), db)
+
+    return {"result": True, "users": suggestions}
+
+
 @router.get(
     "/api/users/{user_id}", description="Страница пользователя с определённым id"
 )
 async def get_user_profile(
-    user_id: int, api_key: str = Header(None), db: AsyncSession = Depends(get_db)
+    user_id: int,
+    api_key: str = Header(None),
+    db: AsyncSession = Depends(get_db),
+    loaders: RequestLoaders = Depends(get_loaders),
 ):
-    logging.info(f"Получаем профиль пользователя с ID: {user_id}")
-    user = await get_user_by_id_or_api_key(user_id, db)
-
-    logging.info(
-        f"Пользователь с ID: {user_id} найден. Формируем ответ для USER/USER_ID"
-    )
-    response = await format_user_profile_response(user)
-    logging.info(f"ВОЗВРАЩАЕМ ИЗ GET/USERS/USER_ID: {response}")
+    viewer_id = await get_viewer_id(api_key, loaders)
+    response = await get_viewer_profile(user_id, viewer_id, db)
 
     return response
 
 
 @router.get("/api/tweets", description="Лента со всеми твитами")
-async def get_tweets(api_key: str = Header(None), db: AsyncSession = Depends(get_db)):
+async def get_tweets(
+    include_likes: bool = Query(
+        True, description="false — без списка лайкнувших (liked_by_me и счетчик)"
+    ),
+    api_key: str = Header(None),
+    db: AsyncSession = Depends(get_db),
+    loaders: RequestLoaders = Depends(get_loaders),
+):
     # Получить твиты, связанные с пользователем
-    logging.info("ПРОБУЕМ ПОЛУЧИТЬ ТВИТЫ юзеров")
-    tweets = await get_all_tweets(db)
-    tweet_list = await format_tweet_list(tweets)
+    viewer_id = await get_viewer_id(api_key, loaders)
+    tweet_list = await get_feed(db, viewer_id, include_likes)
 
     return {"result": True, "tweets": tweet_list}
 
 
+@router.get("/api/tags/{tag}", description="Твиты с хэштегом, от новых к старым")
+async def get_tag_tweets(
+    tag: str,
+    limit: int = Query(20, ge=1, le=100),
+    before: int | None = Query(None, description="Курсор: next_cursor из ответа"),
+    include_likes: bool = Query(
+        True, description="false — без списка лайкнувших (liked_by_me и счетчик)"
+    ),
+    api_key: str = Header(None),
+    db: AsyncSession = Depends(get_db),
+    loaders: RequestLoaders = Depends(get_loaders),
+):
+    viewer_id = await get_viewer_id(api_key, loaders)
+    tweet_ids = await get_tag_tweet_ids(tag, db, limit, before)
+    tweet_list = await hydrate_tweets(tweet_ids, db, viewer_id, include_likes)
+
+    return {
+        "result": True,
+        "tweets": tweet_list,
+        "next_cursor": tweet_ids[-1] if len(tweet_ids) == limit else None,
+    }
+
+
+@router.get(
+    "/api/users/me/mentions",
+    description="Твиты, упоминающие текущего пользователя",
+)
+async def get_my_mentions(
+    limit: int = Query(20, ge=1, le=100),
+    before: int | None = Query(None, description="Курсор: next_cursor из ответа"),
+    include_likes: bool = Query(
+        True, description="false — без списка лайкнувших (liked_by_me и счетчик)"
+    ),
+    api_key: str = Header(None),
+    db: AsyncSession = Depends(get_db),
+    loaders: RequestLoaders = Depends(get_loaders),
+):
+    if conftest.TESTING:
+        api_key = "test"
+
+    user = await loaders.users.load(api_key)
+    tweet_ids = await get_mention_tweet_ids(user.id, db, limit, before)
+    tweet_list = await hydrate_tweets(tweet_ids, db, user.id, include_likes)
+
+    return {
+        "result": True,
+        "tweets": tweet_list,
+        "next_cursor": tweet_ids[-1] if len(tweet_ids) == limit else None,
+    }
+
+
 @router.delete(
     "/api/users/{user_id}/follow",
     description="Отписка от пользователя с определенным id",
 )
 async def unfollow_user(
-    user_id: int, api_key: str = Header(None), db: AsyncSession = Depends(get_db)
+    user_id: int,
+    api_key: str = Header(None),
+    db: AsyncSession = Depends(get_db),
+    loaders: RequestLoaders = Depends(get_loaders),
 ):
-    # Найти текущего пользователя по api_key
     if conftest.TESTING:
         api_key = "test"
 
-    current_user = await get_user_by_id_or_api_key(api_key, db)
-
-    # Найти пользователя, от которого надо отписаться
-    user_to_unfollow = await get_user_by_id_or_api_key(user_id, db)
+    # Найти текущего пользователя по api_key и пользователя, от которого надо
+    # отписаться, одним запросом
+    current_user, user_to_unfollow = await loaders.users.load_many([api_key, user_id])
 
     # Проверка, не подписан ли уже текущий пользователь на этого
     follower_relationship = await get_follower_relationship(
@@ -125,16 +222,17 @@ async def unfollow_user(
     description="Подписка на пользователя с определенным id",
 )
 async def follow_user(
-    user_id: int, api_key: str = Header(None), db: AsyncSession = Depends(get_db)
+    user_id: int,
+    api_key: str = Header(None),
+    db: AsyncSession = Depends(get_db),
+    loaders: RequestLoaders = Depends(get_loaders),
 ):
     if conftest.TESTING:
         api_key = "test"
 
-    # Найти текущего пользователя по api_key
-    current_user = await get_user_by_id_or_api_key(api_key, db)
-
-    # Найти пользователя, на которого надо подписаться
-    user_to_follow = await get_user_by_id_or_api_key(user_id, db)
+    # Найти текущего пользователя по api_key и пользователя, на которого надо
+    # подписаться, одним запросом
+    current_user, user_to_follow = await loaders.users.load_many([api_key, user_id])
 
     if await check_follow_relationship(current_user.id, user_to_follow.id, db):
         raise HTTPException(status_code=400, detail="Already following this user")
@@ -154,14 +252,8 @@ async def remove_like(
     if conftest.TESTING:
         api_key = "test"
 
-    # Найти текущего пользователя по api_key
-    current_user = await get_user_by_id_or_api_key(api_key, db)
-
-    # Найти лайк для твита и текущего пользователя
-    like_relation = await get_like_relation(tweet_id, current_user.id, db)
-
-    # Удалить лайк из базы данных
-    await remove_like_relation(like_relation, db)
+    # Пользователь по api_key, лайк и счетчик — одним запросом
+    await delete_like(tweet_id, api_key, db)
 
     return {"result": True}
 
@@ -176,15 +268,9 @@ async def like_tweet(
     if conftest.TESTING:
         api_key = "test"
 
-    # Найти текущего пользователя по api_key
-    current_user = await get_user_by_id_or_api_key(api_key, db)
-
-    # Проверка, не поставил ли уже текущий пользователь лайк на этот твит
-    if await check_like_exists(tweet_id, current_user.id, db):
-        raise HTTPException(status_code=400, detail="Already liked this tweet")
-
-    # Создать запись о лайке
-    await create_like(tweet_id, current_user.id, db)
+    # Пользователь по api_key, проверка повторного лайка, лайк и счетчик —
+    # одним запросом
+    await create_like(tweet_id, api_key, db)
 
     return {"result": True}
 
@@ -193,16 +279,18 @@ async def like_tweet(
     "/api/tweets/{tweet_id}", description="Удаляет твит по его идентификатору"
 )
 async def delete_tweet(
-    tweet_id: int, api_key: str = Header(None), db: AsyncSession = Depends(get_db)
+    tweet_id: int,
+    api_key: str = Header(None),
+    db: AsyncSession = Depends(get_db),
+    loaders: RequestLoaders = Depends(get_loaders),
 ):
     if conftest.TESTING:
         api_key = "test"
 
-    # Найти текущего пользователя по api_key
-    current_user = await get_user_by_id_or_api_key(api_key, db)
-
-    # Найти твит по его id
-    tweet = await get_tweet_by_id(tweet_id, db)
+    # Найти текущего пользователя по api_key и твит по его id за один тик
+    current_user, tweet = await asyncio.gather(
+        loaders.users.load(api_key), loaders.tweets.load(tweet_id)
+    )
 
     # Проверить, что твит принадлежит текущему пользователю
     if tweet.author_id != current_user.id:
@@ -235,3 +323,17 @@ async def upload_media(
     new_media = await save_media_to_db(media_filename, current_user.id, db)
 
     return {"result": True, "media_id": new_media.id}
+
+
+@router.get(
+    "/api/medias/verify",
+    description="Проверка подписи ссылки на медиа (auth_request nginx или CDN)",
+)
+async def verify_media(x_original_uri: str = Header("")):
+    url = urlsplit(x_original_uri)
+    params = parse_qs(url.query)
+    if not verify_media_signature(
+        url.path, params.get("expires", [None])[0], params.get("sig", [None])[0]
+    ):
+        raise HTTPException(status_code=403, detail="Invalid or expired media URL")
+    return Response(status_code=204)
@@ -0,0 +1,96 @@
+from fastapi import APIRouter, Depends, Header, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import conftest
+from app.crud import RequestLoaders, get_loaders, save_media_to_db
+from app.database import get_db
+from app.models import Media
+from app.schemas import UploadCreate
+from app.uploads import (
+    UPLOAD_CHUNK_SIZE,
+    abort_upload,
+    create_upload,
+    finish_upload,
+    get_upload,
+    parse_content_range,
+    upload_status,
+    write_chunk,
+)
+
+router = APIRouter(prefix="/api/medias/uploads")
+
+
+async def get_current_user_id(
+    api_key: str = Header(None),
+    db: AsyncSession = Depends(get_db),
+    loaders: RequestLoaders = Depends(get_loaders),
+) -> int:
+    if conftest.TESTING:
+        api_key = "test"
+
+    user_id = (await loaders.users.load(api_key)).id
+    # Соединение с БД не держим, пока клиент передает данные
+    await db.rollback()
+    return user_id
+
+
+@router.post("", description="Создание сессии докачиваемой загрузки медиа")
+async def create_upload_session(
+    upload: UploadCreate, user_id: int = Depends(get_current_user_id)
+):
+    meta = await create_upload(user_id, upload.filename, upload.size)
+
+    return {
+        "result": True,
+        "upload_id": meta["id"],
+        "chunk_size": UPLOAD_CHUNK_SIZE,
+    }
+
+
+@router.put("/{upload_id}", description="Загрузка части файла (Content-Range)")
+async def upload_chunk(
+    upload_id: str,
+    request: Request,
+    content_range: str = Header(None),
+    user_id: int = Depends(get_current_user_id),
+):
+    meta = await get_upload(upload_id, user_id)
+    start, end = parse_content_range(content_range, meta["size"])
+    meta = await write_chunk(meta, start, end, request.stream())
+
+    return {"result": True, **upload_status(meta)}
+
+
+@router.get("/{upload_id}", description="Полученные диапазоны байт загрузки")
+async def get_upload_status(
+    upload_id: str, user_id: int = Depends(get_current_user_id)
+):
+    meta = await get_upload(upload_id, user_id)
+
+    return {"result": True, **upload_status(meta)}
+
+
+@router.post(
+    "/{upload_id}/complete", description="Завершение загрузки и создание медиа"
+)
+async def complete_upload(
+    upload_id: str,
+    user_id: int = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_db),
+):
+    meta = await get_upload(upload_id, user_id)
+
+    async def register(media_filename: str) -> Media:
+        return await save_media_to_db(media_filename, user_id, db)
+
+    new_media = await finish_upload(meta, register)
+
+    return {"result": True, "media_id": new_media.id}
+
+
+@router.delete("/{upload_id}", description="Отмена загрузки")
+async def cancel_upload(upload_id: str, user_id: int = Depends(get_current_user_id)):
+    meta = await get_upload(upload_id, user_id)
+    await abort_upload(meta)
+
+    return {"result": True}
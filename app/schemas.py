@@ -1,6 +1,6 @@
-from typing import List, Optional
+from typing import Annotated, List, Literal, Optional, Union
 
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field
 
 
 class TweetBase(BaseModel):
@@ -99,6 +99,37 @@ class MediaCreate(MediaBase):
 
 class Media(MediaBase):
     id: int
+    mime_type: Optional[str] = None
+    size: Optional[int] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
 
     class Config(ConfigDict):
         from_attributes = True
+
+
+class TweetImport(BaseModel):
+    type: Literal["tweet"]
+    id: Optional[int] = None
+    tweet_data: str
+    author_id: int
+
+
+class LikeImport(LikeBase):
+    type: Literal["like"]
+    id: Optional[int] = None
+
+
+class FollowerImport(FollowerBase):
+    type: Literal["follow"]
+    id: Optional[int] = None
+
+
+ImportRecord = Annotated[
+    Union[TweetImport, LikeImport, FollowerImport], Field(discriminator="type")
+]
+
+
+class UploadCreate(BaseModel):
+    filename: str
+    size: int = Field(gt=0)
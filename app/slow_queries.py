@@ -0,0 +1,156 @@
+"""
+Журнал медленных SQL-запросов.
+
+Каждый запрос дольше SLOW_QUERY_THRESHOLD_MS попадает в кольцевой буфер
+вместе с описанием параметров (только типы и длины: значения, например
+api_key, в журнал не попадают), функцией приложения, из которой он вызван, и id
+HTTP-запроса. Для доли SELECT-ов (SLOW_QUERY_EXPLAIN_RATE) дополнительно
+снимается план EXPLAIN (ANALYZE, BUFFERS) — в savepoint, который затем
+откатывается.
+"""
+
+import json
+import logging
+import os
+import random
+import sys
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+import greenlet
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .context import request_id_var, route_var
+
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "200"))
+SLOW_QUERY_EXPLAIN_RATE = float(os.getenv("SLOW_QUERY_EXPLAIN_RATE", "0"))
+SLOW_QUERY_LOG_SIZE = int(os.getenv("SLOW_QUERY_LOG_SIZE", "200"))
+MAX_PARAMETERS_LENGTH = 1000
+
+slow_queries: deque = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+
+# Функции с побочными эффектами вне транзакции: такие запросы не повторяем
+_UNSAFE_TO_EXPLAIN = ("nextval", "setval", "pg_advisory", "dblink")
+
+
+def _find_caller() -> str | None:
+    """
+    Поиск функции приложения, выполнившей запрос.
+    Синхронная часть SQLAlchemy работает в дочернем greenlet, поэтому
+    стек корутин (crud -> AsyncSession.execute) ищется в родительском
+    """
+    frames = [sys._getframe(2)]
+    parent = greenlet.getcurrent().parent
+    if parent is not None and parent.gr_frame is not None:
+        frames.append(parent.gr_frame)
+
+    fallback = None
+    for frame in frames:
+        while frame is not None:
+            module = frame.f_globals.get("__name__", "")
+            if module == "app.crud":
+                return f"{module}.{frame.f_code.co_name}"
+            if fallback is None and module.startswith("app.") and module != __name__:
+                fallback = f"{module}.{frame.f_code.co_name}"
+            frame = frame.f_back
+    return fallback
+
+
+def _describe_value(value) -> str:
+    if isinstance(value, (str, bytes, list, tuple, dict)):
+        return f"{type(value).__name__}({len(value)})"
+    return type(value).__name__
+
+
+def describe_parameters(parameters) -> str:
+    """
+    Описание параметров запроса без значений
+    :param parameters: Параметры DBAPI (кортеж, словарь или список для
+        executemany)
+    :return: Строка вида "(str(12), int)"
+    """
+    if isinstance(parameters, dict):
+        return repr({key: _describe_value(value) for key, value in parameters.items()})
+    if isinstance(parameters, list):
+        # executemany: описание первого набора и количество наборов
+        if not parameters:
+            return "[]"
+        return f"[{describe_parameters(parameters[0])} x {len(parameters)}]"
+    if isinstance(parameters, tuple):
+        return "(" + ", ".join(_describe_value(value) for value in parameters) + ")"
+    return _describe_value(parameters)
+
+
+def _explain(connection, statement: str, parameters) -> list | str:
+    # Отдельный DBAPI-курсор, чтобы не затереть результат исходного запроса
+    cursor = connection.connection.dbapi_connection.cursor()
+    try:
+        cursor.execute("SAVEPOINT slow_query_explain")
+        try:
+            cursor.execute(
+                "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + statement, parameters
+            )
+            plan = cursor.fetchall()[0][0]
+        finally:
+            cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+            cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+        return json.loads(plan) if isinstance(plan, str) else plan
+    except Exception as exc:
+        return f"EXPLAIN failed: {exc}"
+    finally:
+        cursor.close()
+
+
+def _should_explain(statement: str, executemany: bool) -> bool:
+    if executemany or random.random() >= SLOW_QUERY_EXPLAIN_RATE:
+        return False
+    lowered = statement.lstrip().lower()
+    return lowered.startswith("select") and not any(
+        name in lowered for name in _UNSAFE_TO_EXPLAIN
+    )
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._query_started_at = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started_at = getattr(context, "_query_started_at", None)
+    if started_at is None:
+        return
+    duration_ms = (time.perf_counter() - started_at) * 1000
+    if duration_ms < SLOW_QUERY_THRESHOLD_MS:
+        return
+
+    entry = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "duration_ms": round(duration_ms, 2),
+        "statement": statement,
+        "parameters": describe_parameters(parameters)[:MAX_PARAMETERS_LENGTH],
+        "caller": _find_caller(),
+        "request_id": request_id_var.get(),
+        "route": route_var.get(),
+    }
+    if _should_explain(statement, executemany):
+        # Значения параметров нужны только для повторного выполнения
+        entry["plan"] = _explain(conn, statement, parameters)
+
+    slow_queries.append(entry)
+    logging.warning(
+        "Медленный запрос %.1f мс в %s (request_id=%s)",
+        duration_ms,
+        entry["caller"],
+        entry["request_id"],
+    )
+
+
+def install_slow_query_log(engine: Engine):
+    """
+    Подключение журнала медленных запросов к движку
+    :param engine: Синхронный движок (AsyncEngine.sync_engine)
+    :return: Ничего не возвращает
+    """
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
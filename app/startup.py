@@ -0,0 +1,76 @@
+"""
+Прогрев воркера при старте и состояние готовности для readiness-проверки.
+"""
+
+import asyncio
+import logging
+import os
+import time
+
+from .cache_snapshot import restore_job
+from .crud import warm_up_statement_cache
+from .database import warm_up_pool
+from .invalidation import invalidation_listener, invalidation_log_pruner
+from .like_counters import like_counter_compactor
+from .notifications import notification_flusher
+from .uploads import upload_collector
+
+# Сколько ждать подключения к шине инвалидации перед загрузкой снимка кэшей
+SNAPSHOT_LISTENER_TIMEOUT = float(os.getenv("SNAPSHOT_LISTENER_TIMEOUT", "5"))
+
+
+class StartupState:
+    def __init__(self):
+        self.ready = False
+        self.timings_ms: dict[str, float] = {}
+
+
+startup_state = StartupState()
+
+
+async def warm_up():
+    """
+    Прогрев воркера: пул соединений с подготовленными горячими запросами,
+    подписка на шину инвалидации и снимок кэшей. Время каждого этапа
+    сохраняется
+    :return: Ничего не возвращает
+    """
+    started_at = time.perf_counter()
+    stage_started_at = started_at
+
+    def mark(stage: str):
+        nonlocal stage_started_at
+        now = time.perf_counter()
+        startup_state.timings_ms[stage] = round((now - stage_started_at) * 1000, 1)
+        stage_started_at = now
+
+    await warm_up_pool(prime=warm_up_statement_cache)
+    mark("pool_and_statements")
+    await invalidation_listener.start()
+    # Снимок подключается только после подписки: иначе события между
+    # досылкой по журналу и подпиской были бы потеряны
+    try:
+        await asyncio.wait_for(
+            invalidation_listener.connected.wait(), SNAPSHOT_LISTENER_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        logging.warning("Шина инвалидации недоступна, снимок кэшей не загружен")
+        mark("invalidation_listener")
+    else:
+        mark("invalidation_listener")
+        await restore_job()
+        mark("cache_snapshot")
+    await invalidation_log_pruner.start()
+    await like_counter_compactor.start()
+    await upload_collector.start()
+    await notification_flusher.start()
+
+    startup_state.timings_ms["total"] = round(
+        (time.perf_counter() - started_at) * 1000, 1
+    )
+    startup_state.ready = True
+    logging.info(
+        "Воркер прогрет за %s мс: %s",
+        startup_state.timings_ms["total"],
+        startup_state.timings_ms,
+    )
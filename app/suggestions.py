@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Пакетный пересчет рекомендаций «Кого читать».
+
+Граф подписок загружается в разреженную матрицу смежности (CSR),
+кандидаты «друзья друзей» считаются одним матричным умножением,
+а топ-N для каждого пользователя сохраняется в таблицу user_suggestions.
+
+Запуск: python -m app.suggestions [--top-n 20] [--interval 3600]
+"""
+import argparse
+import asyncio
+import logging
+import os
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy import delete, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .database import SessionLocal
+from .models import Follower, UserSuggestion
+
+SUGGESTIONS_TOP_N = int(os.getenv("SUGGESTIONS_TOP_N", "20"))
+INSERT_BATCH_SIZE = 10_000
+
+
+def build_follow_matrix(
+    follower_ids: np.ndarray, followed_ids: np.ndarray
+) -> tuple[sparse.csr_matrix, np.ndarray]:
+    """
+    Построение матрицы смежности графа подписок
+    :param follower_ids: Массив ID подписчиков (начало ребра)
+    :param followed_ids: Массив ID тех, на кого подписаны (конец ребра)
+    :return: CSR-матрица (строка подписывается на столбец) и массив ID
+        пользователей, где индекс соответствует номеру строки/столбца
+    """
+    user_ids = np.unique(np.concatenate([follower_ids, followed_ids]))
+    rows = np.searchsorted(user_ids, follower_ids)
+    cols = np.searchsorted(user_ids, followed_ids)
+    data = np.ones(len(rows), dtype=np.int32)
+    size = len(user_ids)
+    matrix = sparse.csr_matrix((data, (rows, cols)), shape=(size, size))
+    # Дубликаты подписок суммируются при построении, оставляем только факт связи
+    matrix.data[:] = 1
+    return matrix, user_ids
+
+
+def rank_friends_of_friends(
+    matrix: sparse.csr_matrix, top_n: int
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Ранжирование кандидатов «друзья друзей» для всех пользователей сразу
+    :param matrix: CSR-матрица подписок
+    :param top_n: Сколько кандидатов оставлять на пользователя
+    :return: Массивы (строка, столбец кандидата, число общих связей, ранг),
+        отсортированные по строке и рангу
+    """
+    # (A @ A)[u, v] — количество путей u -> x -> v длины 2
+    two_hop = matrix @ matrix
+    # Убираем тех, на кого пользователь уже подписан
+    two_hop = (two_hop - two_hop.multiply(matrix)).tocoo()
+
+    keep = (two_hop.data > 0) & (two_hop.row != two_hop.col)
+    rows = two_hop.row[keep]
+    cols = two_hop.col[keep]
+    scores = two_hop.data[keep]
+
+    # Сортировка по строке, затем по убыванию счета, при равенстве — по индексу
+    order = np.lexsort((cols, -scores, rows))
+    rows, cols, scores = rows[order], cols[order], scores[order]
+
+    # Ранг внутри строки — смещение от первого элемента этой строки
+    row_starts = np.searchsorted(rows, rows, side="left")
+    ranks = np.arange(len(rows)) - row_starts
+
+    top = ranks < top_n
+    return rows[top], cols[top], scores[top], ranks[top]
+
+
+async def rebuild_suggestions(db: AsyncSession, top_n: int = SUGGESTIONS_TOP_N) -> int:
+    """
+    Пересчет и сохранение рекомендаций для всех пользователей
+    :param db: Асинхронная сессия базы данных
+    :param top_n: Сколько кандидатов сохранять на пользователя
+    :return: Количество сохраненных рекомендаций
+    """
+    result = await db.execute(select(Follower.follower_id, Follower.followed_id))
+    edges = np.array(result.all(), dtype=np.int64).reshape(-1, 2)
+
+    records: list[dict] = []
+    if len(edges):
+        matrix, user_ids = build_follow_matrix(edges[:, 0], edges[:, 1])
+        rows, cols, scores, ranks = rank_friends_of_friends(matrix, top_n)
+        records = [
+            {
+                "user_id": user_id,
+                "rank": rank,
+                "suggested_id": suggested,
+                "score": score,
+            }
+            for user_id, suggested, score, rank in zip(
+                user_ids[rows].tolist(),
+                user_ids[cols].tolist(),
+                scores.tolist(),
+                ranks.tolist(),
+            )
+        ]
+
+    # Замена выполняется в одной транзакции: читатели видят старые данные до commit
+    await db.execute(delete(UserSuggestion))
+    for start in range(0, len(records), INSERT_BATCH_SIZE):
+        await db.execute(
+            insert(UserSuggestion), records[start : start + INSERT_BATCH_SIZE]
+        )
+    await db.commit()
+
+    return len(records)
+
+
+async def run(top_n: int, interval: int | None):
+    while True:
+        async with SessionLocal() as db:
+            count = await rebuild_suggestions(db, top_n)
+        logging.info("Рекомендации пересчитаны: %s записей", count)
+        if not interval:
+            return
+        await asyncio.sleep(interval)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Пересчет рекомендаций")
+    parser.add_argument("--top-n", type=int, default=SUGGESTIONS_TOP_N)
+    parser.add_argument(
+        "--interval",
+        type=int,
+        default=None,
+        help="Период пересчета в секундах; без параметра — однократный запуск",
+    )
+    args = parser.parse_args()
+
+    asyncio.run(run(args.top_n, args.interval))
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Хэштеги и упоминания в тексте твитов.
+
+При создании твита #теги и @имена сохраняются в таблицы tags и mentions,
+откуда ленты тега и упоминаний читаются по индексам (tag, tweet_id DESC)
+и (user_id, tweet_id DESC). Упоминание ссылается на пользователей с точно
+таким именем. Для твитов, созданных раньше (или загруженных через импорт),
+таблицы заполняет backfill.
+
+Запуск: python -m app.tags backfill [--batch-size 5000]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import re
+
+from sqlalchemy import ARRAY, Integer, String, bindparam, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .database import SessionLocal
+from .models import Tweet, TweetMention, TweetTag, User
+
+TAGS_BACKFILL_BATCH_SIZE = int(os.getenv("TAGS_BACKFILL_BATCH_SIZE", "5000"))
+MAX_TAG_LENGTH = 100
+
+# Тег или имя — буквы, цифры и "_" после "#"/"@", не внутри слова (e-mail)
+_HASHTAG_RE = re.compile(r"(?<![\w#@])#(\w{1,%d})" % MAX_TAG_LENGTH)
+_MENTION_RE = re.compile(r"(?<![\w#@])@(\w{1,%d})" % MAX_TAG_LENGTH)
+
+
+def normalize_tag(tag: str) -> str:
+    return tag.lstrip("#").casefold()
+
+
+def extract_hashtags(text: str | None) -> list[str]:
+    """
+    Хэштеги текста в нормализованном виде, без повторов
+    :param text: Текст твита
+    :return: Список тегов в порядке появления
+    """
+    return list(
+        dict.fromkeys(normalize_tag(tag) for tag in _HASHTAG_RE.findall(text or ""))
+    )
+
+
+def extract_mentions(text: str | None) -> list[str]:
+    """
+    Упомянутые имена пользователей без повторов
+    :param text: Текст твита
+    :return: Список имен в порядке появления
+    """
+    return list(dict.fromkeys(_MENTION_RE.findall(text or "")))
+
+
+async def save_tweet_entities(rows: list[tuple[int, str | None]], db: AsyncSession):
+    """
+    Сохранение хэштегов и упоминаний твитов в текущей транзакции
+    (не больше двух запросов на всю пачку)
+    :param rows: Пары (ID твита, текст твита)
+    :param db: Асинхронная сессия базы данных
+    :return: Ничего не возвращает
+    """
+    tag_rows = [
+        {"tweet_id": tweet_id, "tag": tag}
+        for tweet_id, text in rows
+        for tag in extract_hashtags(text)
+    ]
+    if tag_rows:
+        await db.execute(insert(TweetTag).on_conflict_do_nothing(), tag_rows)
+
+    mentioned = [
+        (tweet_id, name) for tweet_id, text in rows for name in extract_mentions(text)
+    ]
+    if mentioned:
+        tweet_ids, names = zip(*mentioned)
+        pairs = (
+            func.unnest(
+                bindparam("tweet_ids", list(tweet_ids), type_=ARRAY(Integer)),
+                bindparam("names", list(names), type_=ARRAY(String)),
+            )
+            .table_valued("tweet_id", "name")
+            .render_derived()
+        )
+        await db.execute(
+            insert(TweetMention)
+            .from_select(
+                ["tweet_id", "user_id"],
+                select(pairs.c.tweet_id, User.id).join(User, User.name == pairs.c.name),
+            )
+            .on_conflict_do_nothing()
+        )
+
+
+async def backfill_tweet_entities(
+    db: AsyncSession, batch_size: int = TAGS_BACKFILL_BATCH_SIZE
+) -> int:
+    """
+    Заполнение тегов и упоминаний для уже существующих твитов пачками по id.
+    Повторный запуск безопасен: существующие строки пропускаются
+    :param db: Асинхронная сессия базы данных
+    :param batch_size: Количество твитов в пачке
+    :return: Количество обработанных твитов
+    """
+    last_id = 0
+    processed = 0
+    while True:
+        result = await db.execute(
+            select(Tweet.id, Tweet.tweet_data)
+            .where(Tweet.id > last_id)
+            .order_by(Tweet.id)
+            .limit(batch_size)
+        )
+        rows = result.all()
+        if not rows:
+            break
+        await save_tweet_entities(rows, db)
+        await db.commit()
+
+        last_id = rows[-1][0]
+        processed += len(rows)
+        logging.info("Теги: обработано твитов %s (до id %s)", processed, last_id)
+    return processed
+
+
+async def run(batch_size: int):
+    async with SessionLocal() as db:
+        total = (await db.execute(select(func.count()).select_from(Tweet))).scalar()
+        logging.info("Твитов в базе: %s", total)
+        await backfill_tweet_entities(db, batch_size)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Хэштеги и упоминания твитов")
+    parser.add_argument("command", choices=["backfill"])
+    parser.add_argument("--batch-size", type=int, default=TAGS_BACKFILL_BATCH_SIZE)
+    asyncio.run(run(parser.parse_args().batch_size))
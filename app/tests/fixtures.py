@@ -1,11 +1,16 @@
+import tracemalloc
+from contextlib import asynccontextmanager
+
 import docker
 import pytest_asyncio
 from httpx import ASGITransport, AsyncClient
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
 import conftest
 from app.database import get_db
+from app.export import get_export_sessionmaker
 from app.main import app
 from app.models import Base, Like, Tweet, User
 
@@ -47,6 +52,7 @@ async def async_client(override_get_db):
         base_url="http://0.0.0.0:80", transport=ASGITransport(app)
     ) as ac:
         app.dependency_overrides[get_db] = lambda: override_get_db
+        app.dependency_overrides[get_export_sessionmaker] = lambda: TestSessionLocal
         yield ac
     conftest.TESTING = False
 
@@ -102,3 +108,57 @@ async def like_relation(override_get_db, test_user, tweet):
         await db.commit()
         await db.refresh(like)
         yield like
+
+
+class RequestMeter:
+    """
+    Счетчики одного замера: SQL-выражения, полученные строки и пик
+    выделенной памяти (tracemalloc)
+    """
+
+    def __init__(self):
+        self.statements: list[str] = []
+        self.rows = 0
+        self.peak_bytes = 0
+        self._active = False
+
+    def _after_cursor_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ):
+        if not self._active:
+            return
+        self.statements.append(statement)
+        if cursor.description is not None:
+            self.rows += max(cursor.rowcount, 0)
+
+    @asynccontextmanager
+    async def measure(self):
+        self.statements = []
+        self.rows = 0
+        tracemalloc.reset_peak()
+        start_bytes = tracemalloc.get_traced_memory()[0]
+        self._active = True
+        try:
+            yield self
+        finally:
+            self._active = False
+            self.peak_bytes = tracemalloc.get_traced_memory()[1] - start_bytes
+
+
+# Замер SQL-выражений, строк и памяти запросов к API
+@pytest_asyncio.fixture
+async def request_meter():
+    meter = RequestMeter()
+    event.listen(
+        test_engine.sync_engine, "after_cursor_execute", meter._after_cursor_execute
+    )
+    tracemalloc.start()
+    try:
+        yield meter
+    finally:
+        tracemalloc.stop()
+        event.remove(
+            test_engine.sync_engine,
+            "after_cursor_execute",
+            meter._after_cursor_execute,
+        )
@@ -0,0 +1,33 @@
+import pytest
+
+from app.bulk_import import BulkImporter, iter_lines
+
+
+async def chunks(*parts):
+    for part in parts:
+        yield part
+
+
+@pytest.mark.asyncio
+async def test_iter_lines_joins_split_lines():
+    lines = [
+        line async for line in iter_lines(chunks(b'{"a": 1}\n{"b"', b": 2}\n", b"{}"))
+    ]
+
+    assert lines == [b'{"a": 1}', b'{"b": 2}', b"{}"]
+
+
+@pytest.mark.asyncio
+async def test_bulk_importer_validates_records():
+    importer = BulkImporter(db=None, default_type="tweet", batch_size=100)
+
+    await importer.add_line(1, b'{"tweet_data": "hello", "author_id": 1}')
+    await importer.add_line(2, b'{"type": "like", "user_id": 1, "tweet_id": 1}')
+    await importer.add_line(3, b'{"type": "like", "user_id": "x"}')
+    await importer.add_line(4, b"not json")
+    await importer.add_line(5, b"")
+
+    assert importer.error_count == 2
+    assert [error["line"] for error in importer.errors] == [3, 4]
+    assert importer._batch["tweet"] == [(1, {"tweet_data": "hello", "author_id": 1})]
+    assert importer._batch["like"] == [(2, {"user_id": 1, "tweet_id": 1})]
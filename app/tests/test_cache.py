@@ -0,0 +1,81 @@
+import asyncio
+import time
+
+import pytest
+
+from app.cache import AsyncLRUCache
+
+
+@pytest.mark.asyncio
+async def test_single_flight_load():
+    cache = AsyncLRUCache("test-single-flight", max_size=10)
+    calls = 0
+
+    async def loader():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"id": 1}
+
+    results = await asyncio.gather(*(cache.get_or_load(1, loader) for _ in range(5)))
+    cached = await cache.get_or_load(1, loader)
+
+    assert calls == 1
+    assert all(result is cached for result in results)
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["coalesced"] == 4
+    assert cache.stats()["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_invalidation_during_load_is_not_cached():
+    cache = AsyncLRUCache("test-stale", max_size=10, key_type=int)
+
+    async def loader():
+        cache.on_invalidation(["1"])
+        return "stale"
+
+    assert await cache.get_or_load(1, loader) == "stale"
+    assert len(cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_batch_load_skips_only_invalidated_keys():
+    cache = AsyncLRUCache("test-batch", max_size=10, key_type=int)
+    cache.set(1, "cached")
+
+    async def loader(keys):
+        cache.on_invalidation(["3", "9"])
+        return {key: f"loaded {key}" for key in keys if key != 4}
+
+    found = await cache.get_many_or_load([1, 2, 3, 4], loader)
+
+    assert found == {1: "cached", 2: "loaded 2", 3: "loaded 3"}
+    assert cache.get(2) == "loaded 2"
+    assert cache.get(3) is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 3
+
+
+@pytest.mark.asyncio
+async def test_lru_eviction():
+    cache = AsyncLRUCache("test-lru", max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.stats()["evictions"] == 1
+
+
+def test_ttl_expiration(monkeypatch):
+    cache = AsyncLRUCache("test-ttl", max_size=10, ttl=5)
+    now = time.monotonic()
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+
+    monkeypatch.setattr(time, "monotonic", lambda: now + 6)
+    assert cache.get("a") is None
+    assert len(cache) == 0
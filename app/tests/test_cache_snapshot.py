@@ -0,0 +1,116 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from app import cache_snapshot
+from app.cache import AsyncLRUCache
+from app.cache_snapshot import (
+    SnapshotState,
+    open_snapshot,
+    read_snapshot_state,
+    restore_cache_snapshot,
+    save_cache_snapshot,
+    write_snapshot,
+)
+from app.crud import profile_cache
+from app.invalidation import publish
+from app.models import User
+from app.timeline_cache import TimelineCache, timeline_cache
+
+from .fixtures import async_client, cleanup_database, override_get_db
+
+STATE = SnapshotState(datetime.now(timezone.utc), "1:2")
+
+
+def test_snapshot_entries_are_loaded_lazily(tmp_path):
+    path = str(tmp_path / "caches.bin")
+    profiles = AsyncLRUCache("test-snapshot-profiles", max_size=10, key_type=int)
+    timelines = TimelineCache("test-snapshot-timelines", max_bytes=10_000)
+    profiles.set(1, {"user": {"id": 1}})
+    profiles.set(2, {"user": {"id": 2}})
+    timelines.set("global", [3, 2, 1])
+    entries = {
+        cache.name: list(cache.snapshot_items()) for cache in (profiles, timelines)
+    }
+    assert write_snapshot(path, STATE, entries) == 3
+
+    profiles.clear()
+    timelines.clear()
+    header, _, buffer = open_snapshot(path)
+    profiles.attach_snapshot(buffer, header["caches"][profiles.name])
+    timelines.attach_snapshot(buffer, header["caches"][timelines.name])
+    assert len(profiles) == 0
+
+    profiles.invalidate(2)
+    assert profiles.get(1) == {"user": {"id": 1}}
+    assert profiles.get(2) is None
+    assert list(timelines.get("global")) == [3, 2, 1]
+    assert profiles.stats()["restored"] == 1
+    assert timelines.stats()["restored"] == 1
+
+
+def test_snapshot_of_other_payload_version_is_ignored(tmp_path, monkeypatch):
+    path = str(tmp_path / "caches.bin")
+    write_snapshot(path, STATE, {})
+    monkeypatch.setattr(
+        cache_snapshot,
+        "CACHE_PAYLOAD_VERSION",
+        cache_snapshot.CACHE_PAYLOAD_VERSION + 1,
+    )
+    assert open_snapshot(path) is None
+    assert open_snapshot(str(tmp_path / "missing.bin")) is None
+
+
+@pytest.mark.asyncio
+async def test_restore_replays_missed_invalidations(
+    async_client, override_get_db, tmp_path
+):
+    path = str(tmp_path / "caches.bin")
+    users = [
+        User(name=f"Snapshot {number}", api_key=f"snap-{number}") for number in range(2)
+    ]
+    override_get_db.add_all(users)
+    await override_get_db.commit()
+    for user in users:
+        await async_client.get(f"/api/users/{user.id}")
+    await async_client.get("/api/tweets")
+    state = await read_snapshot_state(override_get_db)
+    assert await save_cache_snapshot(state, path) >= 3
+
+    # Воркер остановлен; тем временем профиль второго пользователя меняется
+    profile_cache.clear()
+    timeline_cache.clear()
+    publish(override_get_db, "user", users[1].id)
+    await override_get_db.commit()
+
+    try:
+        assert await restore_cache_snapshot(override_get_db, path) >= 3
+        assert profile_cache.get(users[0].id)["user"]["name"] == "Snapshot 0"
+        assert profile_cache.get(users[1].id) is None
+        assert timeline_cache.get("global") is not None
+    finally:
+        profile_cache.clear()
+        timeline_cache.clear()
+
+
+@pytest.mark.asyncio
+async def test_snapshot_of_other_database_epoch_is_ignored(
+    async_client, override_get_db, tmp_path
+):
+    path = str(tmp_path / "caches.bin")
+    user = User(name="Recreated", api_key="snap-epoch")
+    override_get_db.add(user)
+    await override_get_db.commit()
+    await async_client.get(f"/api/users/{user.id}")
+
+    # Снимок свежий, но сделан до пересоздания таблиц (другая эпоха)
+    state = await read_snapshot_state(override_get_db)
+    await save_cache_snapshot(state._replace(epoch="0:0"), path)
+    profile_cache.clear()
+
+    try:
+        assert await restore_cache_snapshot(override_get_db, path) == 0
+        assert profile_cache.get(user.id) is None
+    finally:
+        profile_cache.clear()
+        timeline_cache.clear()
@@ -0,0 +1,68 @@
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+from fastapi.testclient import TestClient
+
+from app.compression import (
+    CompressionMiddleware,
+    choose_encoding,
+    compressed_cache,
+    compressors,
+)
+
+test_app = FastAPI()
+test_app.add_middleware(CompressionMiddleware, minimum_size=100)
+
+
+@test_app.get("/api/tweets")
+async def feed():
+    return {"tweets": ["tweet"] * 100}
+
+
+@test_app.get("/small")
+async def small():
+    return {"ok": True}
+
+
+@test_app.get("/text")
+async def text():
+    return PlainTextResponse("x" * 1000)
+
+
+client = TestClient(test_app)
+
+
+def test_choose_encoding():
+    assert choose_encoding("gzip") == "gzip"
+    assert choose_encoding("gzip;q=0, deflate") is None
+    assert choose_encoding("identity") is None
+    assert choose_encoding("*") in compressors
+    assert choose_encoding("gzip;q=0.5, br;q=0.9") in ("br", "gzip")
+
+
+def test_gzip_response_and_cache():
+    hits = compressed_cache.hits
+
+    first = client.get("/api/tweets", headers={"Accept-Encoding": "gzip"})
+    second = client.get("/api/tweets", headers={"Accept-Encoding": "gzip"})
+
+    assert first.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in first.headers["vary"]
+    assert first.json() == second.json() == {"tweets": ["tweet"] * 100}
+    assert compressed_cache.hits == hits + 1
+
+
+def test_small_and_identity_responses_are_not_compressed():
+    small = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    identity = client.get("/text", headers={"Accept-Encoding": "identity"})
+
+    assert "content-encoding" not in small.headers
+    assert "content-encoding" not in identity.headers
+    assert identity.text == "x" * 1000
+
+
+def test_text_response_gzip_roundtrip():
+    response = client.get("/text", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert int(response.headers["content-length"]) < 1000
+    assert response.text == "x" * 1000
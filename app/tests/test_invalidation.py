@@ -0,0 +1,27 @@
+import json
+
+from app.invalidation import MAX_PAYLOAD_SIZE, dispatch, encode_payloads, subscribe
+
+
+def test_encode_payloads_respects_notify_limit():
+    keys = [str(key) for key in range(5000)]
+    payloads = encode_payloads({"tweet": keys, "feed": None})
+
+    decoded = [json.loads(payload) for payload in payloads]
+    assert all(len(payload.encode()) <= MAX_PAYLOAD_SIZE for payload in payloads)
+    assert [
+        key for item in decoded if item["t"] == "tweet" for key in item["k"]
+    ] == keys
+    assert {"t": "feed", "k": None} in [
+        {"t": item["t"], "k": item["k"]} for item in decoded
+    ]
+
+
+def test_dispatch_calls_subscribers():
+    received = []
+    subscribe("test-topic", received.append)
+
+    dispatch("test-topic", ["1", "2"])
+    dispatch("test-topic", None)
+
+    assert received == [["1", "2"], None]
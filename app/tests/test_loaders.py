@@ -0,0 +1,43 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from app.crud import RequestLoaders
+from app.models import User
+
+
+class FakeSession:
+    def __init__(self, users):
+        self.users = users
+        self.statements = []
+
+    async def execute(self, statement):
+        self.statements.append(statement)
+        users = self.users
+        return SimpleNamespace(scalars=lambda: SimpleNamespace(all=lambda: list(users)))
+
+
+@pytest.mark.asyncio
+async def test_user_loader_batches_and_memoizes():
+    db = FakeSession([User(id=1, name="User_1", api_key="test")])
+    loaders = RequestLoaders(db)
+
+    by_key, by_id = await asyncio.gather(
+        loaders.users.load("test"), loaders.users.load(1)
+    )
+    again = await loaders.users.load(1)
+
+    assert by_key is by_id is again
+    assert len(db.statements) == 1
+
+
+@pytest.mark.asyncio
+async def test_user_loader_not_found():
+    loaders = RequestLoaders(FakeSession([]))
+
+    with pytest.raises(HTTPException) as exc:
+        await loaders.users.load(42)
+
+    assert exc.value.status_code == 404
@@ -0,0 +1,54 @@
+import json
+import logging
+import queue
+
+from app.context import RequestState, request_id_var, request_state_var
+from app.logs import ContextFilter, JsonFormatter, NonBlockingQueueHandler
+
+
+def make_handler(size: int = 10) -> NonBlockingQueueHandler:
+    handler = NonBlockingQueueHandler(queue.Queue(size))
+    handler.addFilter(ContextFilter())
+    return handler
+
+
+def test_json_record_with_request_context():
+    handler = make_handler()
+    state = RequestState()
+    state.user_id = 7
+    request_token = request_id_var.set("req-1")
+    state_token = request_state_var.set(state)
+    try:
+        record = logging.makeLogRecord(
+            {"msg": "Твит %s", "args": (42,), "levelno": logging.INFO}
+        )
+        handler.handle(record)
+    finally:
+        request_state_var.reset(state_token)
+        request_id_var.reset(request_token)
+
+    entry = json.loads(JsonFormatter().format(handler.queue.get_nowait()))
+    assert entry["message"] == "Твит 42"
+    assert entry["request_id"] == "req-1"
+    assert entry["user_id"] == 7
+
+
+def test_unsampled_request_keeps_only_warnings():
+    handler = make_handler()
+    state_token = request_state_var.set(RequestState(sampled=False))
+    try:
+        for level in (logging.DEBUG, logging.INFO, logging.WARNING):
+            handler.handle(logging.makeLogRecord({"msg": "x", "levelno": level}))
+    finally:
+        request_state_var.reset(state_token)
+
+    assert handler.queue.qsize() == 1
+    assert handler.queue.get_nowait().levelno == logging.WARNING
+
+
+def test_full_queue_drops_records():
+    handler = make_handler(size=1)
+    for _ in range(3):
+        handler.handle(logging.makeLogRecord({"msg": "x", "levelno": logging.ERROR}))
+    assert handler.queue.qsize() == 1
+    assert handler.dropped == 2
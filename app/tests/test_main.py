@@ -1,7 +1,20 @@
+import gzip
+import json
+import time
 from io import BytesIO
+from urllib.parse import urlsplit
 
 import pytest
 from fastapi import UploadFile
+from sqlalchemy import select
+
+from app import media
+from app.crud import create_follow_relationship, create_like
+from app.like_counters import compact_like_counters, like_count_cache
+from app.models import LikeCounterShard, Tweet, User
+from app.notifications import notification_aggregator
+from app.tags import backfill_tweet_entities
+from app.timeline_cache import timeline_cache
 
 from .fixtures import (
     async_client,
@@ -118,3 +131,366 @@ async def test_upload_media(async_client, test_user):
     # Проверка статуса и результата
     assert response.status_code == 200
     assert response.json() == {"result": True, "media_id": 1}
+
+
+@pytest.mark.asyncio
+async def test_get_suggestions(async_client, test_user):
+    response = await async_client.get("/api/users/me/suggestions")
+    print("--->>>>>>>>>", response.json())
+
+    assert response.status_code == 200
+    assert response.json() == {"result": True, "users": []}
+
+
+@pytest.mark.asyncio
+async def test_add_tweet_with_unknown_media(async_client, test_user):
+    tweet_data = {"tweet_data": "Tweet with media", "tweet_media_ids": [9999]}
+    response = await async_client.post("/api/tweets", json=tweet_data)
+    print("--->>>>>>>>>", response.json())
+
+    assert response.status_code == 404
+    assert response.json()["result"] is False
+
+
+@pytest.mark.asyncio
+async def test_export_tweets(async_client, test_user):
+    response = await async_client.get("/api/admin/export/tweets")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert all(set(record) == {"id", "tweet_data", "author_id"} for record in records)
+
+
+@pytest.mark.asyncio
+async def test_export_follows_gzip(async_client):
+    response = await async_client.get("/api/admin/export/follows?gzip=true")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/gzip"
+    gzip.decompress(response.content)
+
+
+@pytest.mark.asyncio
+async def test_user_profile_cache_invalidated_on_follow(async_client, test_user):
+    response = await async_client.get(f"/api/users/{test_user.id}")
+    assert response.json()["user"]["followers"] == []
+
+    await async_client.post(f"/api/users/{test_user.id}/follow")
+    response = await async_client.get(f"/api/users/{test_user.id}")
+    assert response.json()["user"]["followers"] == [
+        {"id": test_user.id, "name": "User_test"}
+    ]
+
+    await async_client.delete(f"/api/users/{test_user.id}/follow")
+    response = await async_client.get(f"/api/users/{test_user.id}")
+    assert response.json()["user"]["followers"] == []
+
+
+@pytest.mark.asyncio
+async def test_feed_likes_count_from_sharded_counters(
+    async_client, override_get_db, test_user
+):
+    response = await async_client.post(
+        "/api/tweets", json={"tweet_data": "Counted tweet"}
+    )
+    tweet_id = response.json()["tweet_id"]
+
+    await async_client.post(f"/api/tweets/{tweet_id}/likes")
+    like_count_cache.clear()
+    tweets = (await async_client.get("/api/tweets")).json()["tweets"]
+    counted = next(tweet for tweet in tweets if tweet["id"] == tweet_id)
+    assert counted["likes_count"] == 1
+
+    # Сжатие шардов не меняет сумму
+    assert await compact_like_counters(override_get_db) is not None
+    like_count_cache.clear()
+    tweets = (await async_client.get("/api/tweets")).json()["tweets"]
+    counted = next(tweet for tweet in tweets if tweet["id"] == tweet_id)
+    assert counted["likes_count"] == 1
+
+    await async_client.delete(f"/api/tweets/{tweet_id}/likes")
+    like_count_cache.clear()
+    tweets = (await async_client.get("/api/tweets")).json()["tweets"]
+    counted = next(tweet for tweet in tweets if tweet["id"] == tweet_id)
+    assert counted["likes_count"] == 0
+
+
+@pytest.mark.asyncio
+async def test_resumable_upload(async_client, test_user):
+    content = b"0123456789" * 100
+    response = await async_client.post(
+        "/api/medias/uploads", json={"filename": "big.png", "size": len(content)}
+    )
+    upload_id = response.json()["upload_id"]
+
+    # Части приходят не по порядку; первая повторяется после «обрыва»
+    for start, end in ((600, 1000), (0, 300), (0, 300)):
+        response = await async_client.put(
+            f"/api/medias/uploads/{upload_id}",
+            content=content[start:end],
+            headers={"Content-Range": f"bytes {start}-{end - 1}/{len(content)}"},
+        )
+        assert response.status_code == 200
+
+    response = await async_client.get(f"/api/medias/uploads/{upload_id}")
+    assert response.json()["received"] == [[0, 300], [600, 1000]]
+    response = await async_client.post(f"/api/medias/uploads/{upload_id}/complete")
+    assert response.status_code == 409
+
+    await async_client.put(
+        f"/api/medias/uploads/{upload_id}",
+        content=content[300:600],
+        headers={"Content-Range": f"bytes 300-599/{len(content)}"},
+    )
+    response = await async_client.post(f"/api/medias/uploads/{upload_id}/complete")
+    assert response.status_code == 200
+    assert response.json()["result"] is True
+
+    response = await async_client.get(f"/api/medias/uploads/{upload_id}")
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_tag_and_mention_timelines(async_client, override_get_db, test_user):
+    tweet_ids = []
+    for number in range(3):
+        response = await async_client.post(
+            "/api/tweets",
+            json={"tweet_data": f"#Keyset page {number} for @{test_user.name}"},
+        )
+        tweet_ids.append(response.json()["tweet_id"])
+
+    response = await async_client.get("/api/tags/keyset", params={"limit": 2})
+    page = response.json()
+    assert [tweet["id"] for tweet in page["tweets"]] == tweet_ids[:0:-1]
+    response = await async_client.get(
+        "/api/tags/%23KEYSET", params={"limit": 2, "before": page["next_cursor"]}
+    )
+    page = response.json()
+    assert [tweet["id"] for tweet in page["tweets"]] == tweet_ids[:1]
+    assert page["next_cursor"] is None
+
+    response = await async_client.get("/api/users/me/mentions")
+    mentioned = [tweet["id"] for tweet in response.json()["tweets"]]
+    assert mentioned[:3] == tweet_ids[::-1]
+
+
+@pytest.mark.asyncio
+async def test_tags_backfill(async_client, override_get_db, test_user):
+    tweet = Tweet(tweet_data="Old #backfilled tweet", author_id=test_user.id)
+    override_get_db.add(tweet)
+    await override_get_db.commit()
+
+    response = await async_client.get("/api/tags/backfilled")
+    assert response.json()["tweets"] == []
+
+    await backfill_tweet_entities(override_get_db, batch_size=2)
+    response = await async_client.get("/api/tags/backfilled")
+    assert [item["id"] for item in response.json()["tweets"]] == [tweet.id]
+
+
+@pytest.mark.asyncio
+async def test_aggregated_notifications(async_client, override_get_db, test_user):
+    await notification_aggregator.flush(override_get_db)
+    response = await async_client.post(
+        "/api/tweets", json={"tweet_data": "Tweet to be liked"}
+    )
+    tweet_id = response.json()["tweet_id"]
+    fans = [
+        User(name=f"Fan_{number}", api_key=f"notif-fan-{number}") for number in range(4)
+    ]
+    override_get_db.add_all(fans)
+    await override_get_db.commit()
+
+    for fan in fans:
+        await create_like(tweet_id, fan.id, override_get_db)
+    await create_follow_relationship(fans[0].id, test_user.id, override_get_db)
+    assert await notification_aggregator.flush(override_get_db) == 2
+
+    # Лайк после сброса дописывается в то же непрочитанное уведомление
+    await create_like(tweet_id, test_user.id, override_get_db)
+    late_fan = User(name="Fan_late", api_key="notif-fan-late")
+    override_get_db.add(late_fan)
+    await override_get_db.commit()
+    await create_like(tweet_id, late_fan.id, override_get_db)
+    assert await notification_aggregator.flush(override_get_db) == 1
+
+    page = (await async_client.get("/api/notifications", params={"limit": 1})).json()
+    assert page["unread"] == 2
+    (follow,) = page["notifications"]
+    assert follow["kind"] == "follow"
+    assert [actor["name"] for actor in follow["actors"]] == ["Fan_0"]
+
+    response = await async_client.get(
+        "/api/notifications", params={"before": page["next_cursor"]}
+    )
+    like = response.json()["notifications"][0]
+    assert like["kind"] == "like" and like["tweet_id"] == tweet_id
+    assert like["actor_count"] == 5
+    assert [actor["name"] for actor in like["actors"]] == [
+        "Fan_late",
+        "Fan_3",
+        "Fan_2",
+    ]
+
+    response = await async_client.post(
+        "/api/notifications/read", params={"up_to": like["id"]}
+    )
+    assert response.json()["unread"] == 1
+    response = await async_client.post("/api/notifications/read")
+    assert response.json()["unread"] == 0
+
+
+@pytest.mark.asyncio
+async def test_viewer_flags(async_client, override_get_db, test_user):
+    author = User(name="Flagged author", api_key="flagged-author")
+    override_get_db.add(author)
+    await override_get_db.commit()
+    tweet = Tweet(tweet_data="Tweet with viewer flags", author_id=author.id)
+    override_get_db.add(tweet)
+    await override_get_db.commit()
+    # Твит добавлен в обход create_new_tweet: лента не знает о нем
+    timeline_cache.clear()
+    await async_client.get("/api/tweets")  # Твит уже в кэше тел
+
+    await async_client.post(f"/api/tweets/{tweet.id}/likes")
+    await async_client.post(f"/api/users/{author.id}/follow")
+
+    def find(response):
+        return next(
+            item for item in response.json()["tweets"] if item["id"] == tweet.id
+        )
+
+    viewed = find(await async_client.get("/api/tweets", headers={"api-key": "test"}))
+    assert viewed["liked_by_me"] is True
+    assert viewed["author"]["is_following"] is True
+    # Флаги читателя не попадают в общий кэш
+    anonymous = find(await async_client.get("/api/tweets"))
+    assert anonymous["liked_by_me"] is False
+    assert anonymous["author"]["is_following"] is False
+
+    response = await async_client.get(
+        f"/api/users/{author.id}", headers={"api-key": "test"}
+    )
+    assert response.json()["user"]["is_following"] is True
+    response = await async_client.get(f"/api/users/{author.id}")
+    assert response.json()["user"]["is_following"] is False
+
+    # Неизвестный ключ — анонимный читатель, а не 404
+    headers = {"api-key": "unknown-viewer"}
+    response = await async_client.get(f"/api/users/{author.id}", headers=headers)
+    assert response.json()["user"]["is_following"] is False
+    unknown = find(await async_client.get("/api/tweets", headers=headers))
+    assert unknown["liked_by_me"] is False
+
+
+@pytest.mark.asyncio
+async def test_feed_without_likes(async_client, override_get_db, test_user):
+    response = await async_client.post(
+        "/api/tweets", json={"tweet_data": "Liked #slimfeed tweet"}
+    )
+    tweet_id = response.json()["tweet_id"]
+    for number in range(3):
+        fan = User(name=f"Slim fan {number}", api_key=f"slim-fan-{number}")
+        override_get_db.add(fan)
+        await override_get_db.commit()
+        await create_like(tweet_id, fan.id, override_get_db)
+
+    headers = {"api-key": "slim-fan-0"}
+    for url in ("/api/tweets", "/api/tags/slimfeed", "/api/users/me/mentions"):
+        full = await async_client.get(url, headers=headers)
+        slim = await async_client.get(
+            url, headers=headers, params={"include_likes": "false"}
+        )
+        assert len(slim.content) <= len(full.content)
+        assert all("likes" not in item for item in slim.json()["tweets"])
+
+    response = await async_client.get(
+        "/api/tags/slimfeed", headers=headers, params={"include_likes": "false"}
+    )
+    full = await async_client.get("/api/tags/slimfeed", headers=headers)
+    assert len(response.content) < len(full.content)
+    (item,) = response.json()["tweets"]
+    assert item["likes_count"] == 3
+    assert item["liked_by_me"] is True
+
+
+@pytest.mark.asyncio
+async def test_media_metadata_in_feed(async_client, test_user):
+    png = b"\x89PNG\r\n\x1a\n\x00\x00\x00\x0dIHDR" + (3).to_bytes(4, "big") * 2
+    files = {"file": ("pixel.png", BytesIO(png), "image/png")}
+    media_id = (await async_client.post("/api/medias", files=files)).json()["media_id"]
+    response = await async_client.post(
+        "/api/tweets", json={"tweet_data": "With image", "tweet_media_ids": [media_id]}
+    )
+    tweet_id = response.json()["tweet_id"]
+
+    tweets = (await async_client.get("/api/tweets")).json()["tweets"]
+    created = next(tweet for tweet in tweets if tweet["id"] == tweet_id)
+    (item,) = created["media"]
+    assert item["url"].endswith(".png")
+    assert item == {
+        "id": media_id,
+        "url": item["url"],
+        "type": "image/png",
+        "size": len(png),
+        "width": 3,
+        "height": 3,
+    }
+    assert created["attachments"] == [item["url"]]
+    response = await async_client.get(
+        "/api/medias/verify", headers={"X-Original-URI": item["url"]}
+    )
+    assert response.status_code == 204
+
+
+@pytest.mark.asyncio
+async def test_verify_signed_media_url(async_client, monkeypatch):
+    monkeypatch.setattr(media, "MEDIA_URL_SECRET", "secret")
+    url = urlsplit(media.media_url("pixel.png"))
+    # nginx передает путь с параметрами ($request_uri)
+    uri = f"{url.path}?{url.query}"
+
+    async def verify(original_uri: str) -> int:
+        response = await async_client.get(
+            "/api/medias/verify", headers={"X-Original-URI": original_uri}
+        )
+        return response.status_code
+
+    assert await verify(uri) == 204
+    assert await verify(uri.replace("pixel.png", "other.png")) == 403
+    assert await verify(url.path) == 403
+    expired = media.media_url("pixel.png", now=time.time() - 3 * media.MEDIA_URL_TTL)
+    assert await verify(expired) == 403
+
+
+@pytest.mark.asyncio
+async def test_like_counters_compact_in_batches(override_get_db, test_user):
+    # У первых двух твитов сумма — ноль (лайки сняты), у третьего — 4
+    tweets = [
+        Tweet(tweet_data=f"Compacted {number}", author_id=test_user.id)
+        for number in range(3)
+    ]
+    override_get_db.add_all(tweets)
+    await override_get_db.flush()
+    tweet_ids = [tweet.id for tweet in tweets]
+    override_get_db.add_all(
+        LikeCounterShard(
+            tweet_id=tweet_id,
+            shard=shard,
+            count=1 if shard or tweet_id == tweet_ids[-1] else -3,
+        )
+        for tweet_id in tweet_ids
+        for shard in range(4)
+    )
+    await override_get_db.commit()
+
+    # Пачки по 2 строки: шарды твита делятся между пачками
+    assert await compact_like_counters(override_get_db, batch_size=2) >= 3
+    result = await override_get_db.execute(
+        select(
+            LikeCounterShard.tweet_id, LikeCounterShard.shard, LikeCounterShard.count
+        ).where(LikeCounterShard.tweet_id.in_(tweet_ids))
+    )
+    assert result.all() == [(tweet_ids[-1], 0, 4)]
@@ -0,0 +1,57 @@
+import struct
+from urllib.parse import parse_qs, urlsplit
+
+from app import media
+from app.media import media_url, probe_media, verify_media_signature
+
+
+def test_probe_media(tmp_path):
+    png = tmp_path / "a.png"
+    png.write_bytes(
+        b"\x89PNG\r\n\x1a\n"
+        + struct.pack(">I", 13)
+        + b"IHDR"
+        + struct.pack(">II", 640, 480)
+        + b"\x08\x02\x00\x00\x00"
+    )
+    gif = tmp_path / "b.gif"
+    gif.write_bytes(b"GIF89a" + struct.pack("<HH", 32, 16) + b"\x00" * 10)
+    jpeg = tmp_path / "c.jpg"
+    jpeg.write_bytes(
+        b"\xff\xd8"
+        + b"\xff\xe0"
+        + struct.pack(">H", 16)
+        + b"JFIF\x00" * 2
+        + b"\x00" * 4
+        + b"\xff\xc0"
+        + struct.pack(">HBHH", 17, 8, 200, 300)
+        + b"\x00" * 10
+    )
+    text = tmp_path / "d.txt"
+    text.write_bytes(b"hello")
+
+    assert probe_media(str(png)) == ("image/png", png.stat().st_size, 640, 480)
+    assert probe_media(str(gif))[2:] == (32, 16)
+    assert probe_media(str(jpeg))[::2] == ("image/jpeg", 300)
+    assert probe_media(str(text)) == ("text/plain", 5, None, None)
+
+
+def test_signed_media_url(monkeypatch):
+    assert media_url("a b.png") == "http://0.0.0.0/media/a%20b.png"
+
+    monkeypatch.setattr(media, "MEDIA_URL_SECRET", "secret")
+    monkeypatch.setattr(media, "MEDIA_URL_TTL", 100)
+    # В пределах окна ссылка одна и та же
+    assert media_url("a.png", now=1000) == media_url("a.png", now=1049)
+
+    url = urlsplit(media_url("a.png", now=1000))
+    params = {key: value[0] for key, value in parse_qs(url.query).items()}
+    assert int(params["expires"]) >= 1050
+    assert verify_media_signature(url.path, params["expires"], params["sig"], 1049)
+    assert not verify_media_signature(url.path, params["expires"], "x", now=1049)
+    assert not verify_media_signature(
+        "/media/b.png", params["expires"], params["sig"], now=1049
+    )
+    assert not verify_media_signature(
+        url.path, params["expires"], params["sig"], now=int(params["expires"]) + 1
+    )
@@ -0,0 +1,15 @@
+from app.notifications import NotificationAggregator
+
+
+def test_aggregator_collapses_events():
+    aggregator = NotificationAggregator(max_pending=100)
+    for actor_id in (2, 3, 4, 2, 5):
+        aggregator.add(1, "like", actor_id, tweet_id=10)
+    aggregator.add(1, "like", 1, tweet_id=10)  # свой лайк не уведомляет
+    aggregator.add(None, "like", 2, tweet_id=11)  # твит не найден
+    aggregator.add(1, "follow", 2)
+
+    assert len(aggregator) == 2
+    group = aggregator._pending[(1, "like", 10)]
+    assert group.count == 5
+    assert group.actor_ids == [5, 2, 4]
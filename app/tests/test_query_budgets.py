@@ -0,0 +1,215 @@
+from typing import NamedTuple
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import select
+
+from app.crud import profile_cache
+from app.like_counters import like_count_cache
+from app.models import Like, Tweet, User
+from app.timeline_cache import timeline_cache, tweet_body_cache
+
+from .fixtures import (
+    TestSessionLocal,
+    async_client,
+    cleanup_database,
+    override_get_db,
+    request_meter,
+)
+
+
+@pytest_asyncio.fixture(scope="module")
+async def budget_user():
+    # Пользователь с ключом "test" может быть уже создан другим модулем
+    async with TestSessionLocal() as db:
+        user = (await db.execute(select(User).filter(User.api_key == "test"))).scalar()
+        if user is None:
+            user = User(name="User_test", api_key="test")
+            db.add(user)
+            await db.commit()
+            await db.refresh(user)
+        yield user
+
+
+@pytest_asyncio.fixture(scope="module")
+async def budget_tweets(budget_user):
+    async with TestSessionLocal() as db:
+        tweets = [
+            Tweet(tweet_data=f"Budget tweet {number}", author_id=budget_user.id)
+            for number in range(50)
+        ]
+        db.add_all(tweets)
+        await db.commit()
+        yield tweets
+
+
+class Budget(NamedTuple):
+    statements: int
+    rows: int | None
+    kilobytes: int
+
+
+# Бюджеты маршрутов на холодных кэшах. Превышение — повод искать лишний
+# joinedload, дополнительный запрос или цикл запросов по элементам
+BUDGETS = {
+    # Лента: id, тела твитов, счетчики — независимо от числа твитов и лайков
+    "get_tweets": Budget(statements=3, rows=None, kilobytes=2048),
+    "get_tweets_warm": Budget(statements=0, rows=0, kilobytes=1024),
+    # Читатель, лайки читателя и подписки читателя на авторов страницы
+    "get_tweets_viewer_warm": Budget(statements=3, rows=None, kilobytes=1024),
+    "create_tweet": Budget(statements=3, rows=3, kilobytes=1024),
+    # Пользователь и твит, один DELETE со всеми зависимыми строками, журнал
+    "delete_tweet": Budget(statements=4, rows=4, kilobytes=1024),
+    # Один запрос на лайк со счетчиком и один — на журнал инвалидации
+    "like_tweet": Budget(statements=2, rows=2, kilobytes=1024),
+    "remove_like": Budget(statements=2, rows=2, kilobytes=1024),
+    "follow_user": Budget(statements=4, rows=4, kilobytes=1024),
+    "unfollow_user": Budget(statements=4, rows=4, kilobytes=1024),
+    "get_user_info": Budget(statements=2, rows=2, kilobytes=1024),
+    "get_user": Budget(statements=1, rows=1, kilobytes=1024),
+    "get_suggestions": Budget(statements=2, rows=None, kilobytes=1024),
+}
+
+
+async def check_budget(meter, name: str, send):
+    budget = BUDGETS[name]
+    async with meter.measure():
+        response = await send()
+    assert response.status_code == 200, response.text
+
+    statements = "\n".join(meter.statements)
+    assert (
+        len(meter.statements) <= budget.statements
+    ), f"{name}: {len(meter.statements)} SQL > {budget.statements}:\n{statements}"
+    if budget.rows is not None:
+        assert meter.rows <= budget.rows, f"{name}: {meter.rows} rows > {budget.rows}"
+    assert (
+        meter.peak_bytes <= budget.kilobytes * 1024
+    ), f"{name}: peak {meter.peak_bytes // 1024} KB > {budget.kilobytes} KB"
+    return response
+
+
+def clear_caches():
+    for cache in (timeline_cache, tweet_body_cache, like_count_cache, profile_cache):
+        cache.clear()
+
+
+@pytest.mark.asyncio
+async def test_feed_budget_independent_of_likes(
+    async_client, request_meter, budget_tweets
+):
+    clear_caches()
+    await check_budget(
+        request_meter, "get_tweets", lambda: async_client.get("/api/tweets")
+    )
+    statements_without_likes = len(request_meter.statements)
+
+    # Каждый из 10 твитов получает по 5 лайков разных пользователей
+    async with TestSessionLocal() as db:
+        fans = [
+            User(name=f"Fan {number}", api_key=f"budget-fan-{number}")
+            for number in range(5)
+        ]
+        db.add_all(fans)
+        await db.flush()
+        db.add_all(
+            Like(user_id=fan.id, tweet_id=tweet.id)
+            for tweet in budget_tweets[:10]
+            for fan in fans
+        )
+        await db.commit()
+
+    clear_caches()
+    response = await check_budget(
+        request_meter, "get_tweets", lambda: async_client.get("/api/tweets")
+    )
+    assert len(request_meter.statements) == statements_without_likes
+    tweets = response.json()["tweets"]
+    likes = sum(len(tweet["likes"]) for tweet in tweets)
+    # id ленты + строки твитов (по одной на лайк) + счетчики
+    assert request_meter.rows <= 3 * len(tweets) + likes
+
+    await check_budget(
+        request_meter, "get_tweets_warm", lambda: async_client.get("/api/tweets")
+    )
+    await check_budget(
+        request_meter,
+        "get_tweets_viewer_warm",
+        lambda: async_client.get("/api/tweets", headers={"api-key": "test"}),
+    )
+
+
+@pytest.mark.asyncio
+async def test_like_budgets(async_client, request_meter, budget_user):
+    async with TestSessionLocal() as db:
+        tweet = Tweet(tweet_data="Budget like", author_id=budget_user.id)
+        db.add(tweet)
+        await db.commit()
+    tweet_id = tweet.id
+
+    clear_caches()
+    await check_budget(
+        request_meter,
+        "like_tweet",
+        lambda: async_client.post(f"/api/tweets/{tweet_id}/likes"),
+    )
+    await check_budget(
+        request_meter,
+        "remove_like",
+        lambda: async_client.delete(f"/api/tweets/{tweet_id}/likes"),
+    )
+
+
+@pytest.mark.asyncio
+async def test_follow_budgets(async_client, request_meter, budget_user):
+    async with TestSessionLocal() as db:
+        author = User(name="Followed author", api_key="budget-followed-author")
+        db.add(author)
+        await db.commit()
+
+    clear_caches()
+    await check_budget(
+        request_meter,
+        "follow_user",
+        lambda: async_client.post(f"/api/users/{author.id}/follow"),
+    )
+    await check_budget(
+        request_meter,
+        "unfollow_user",
+        lambda: async_client.delete(f"/api/users/{author.id}/follow"),
+    )
+
+
+@pytest.mark.asyncio
+async def test_profile_budgets(async_client, request_meter, budget_user):
+    clear_caches()
+    await check_budget(
+        request_meter, "get_user_info", lambda: async_client.get("/api/users/me")
+    )
+    clear_caches()
+    await check_budget(
+        request_meter,
+        "get_user",
+        lambda: async_client.get(f"/api/users/{budget_user.id}"),
+    )
+    await check_budget(
+        request_meter,
+        "get_suggestions",
+        lambda: async_client.get("/api/users/me/suggestions"),
+    )
+
+
+@pytest.mark.asyncio
+async def test_tweet_write_budgets(async_client, request_meter, budget_user):
+    clear_caches()
+    response = await check_budget(
+        request_meter,
+        "create_tweet",
+        lambda: async_client.post("/api/tweets", json={"tweet_data": "Budget"}),
+    )
+    tweet_id = response.json()["tweet_id"]
+    await check_budget(
+        request_meter,
+        "delete_tweet",
+        lambda: async_client.delete(f"/api/tweets/{tweet_id}"),
+    )
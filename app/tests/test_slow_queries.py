@@ -0,0 +1,28 @@
+from app import slow_queries
+
+
+def test_only_safe_selects_are_explained(monkeypatch):
+    monkeypatch.setattr(slow_queries, "SLOW_QUERY_EXPLAIN_RATE", 1.0)
+
+    assert slow_queries._should_explain("SELECT * FROM tweets", False)
+    assert not slow_queries._should_explain("SELECT * FROM tweets", True)
+    assert not slow_queries._should_explain("INSERT INTO likes VALUES (1)", False)
+    assert not slow_queries._should_explain(
+        "WITH t AS (INSERT INTO tweets DEFAULT VALUES RETURNING id) SELECT 1", False
+    )
+    assert not slow_queries._should_explain("SELECT setval('tweets_id_seq', 1)", False)
+
+
+def test_explain_disabled_by_default(monkeypatch):
+    monkeypatch.setattr(slow_queries, "SLOW_QUERY_EXPLAIN_RATE", 0.0)
+
+    assert not slow_queries._should_explain("SELECT 1", False)
+
+
+def test_parameter_values_are_not_logged():
+    described = slow_queries.describe_parameters(("secret-api-key", 42, None))
+
+    assert "secret" not in described
+    assert described == "(str(14), int, NoneType)"
+    assert slow_queries.describe_parameters([(1,), (2,)]) == "[(int) x 2]"
+    assert slow_queries.describe_parameters({"key": "abc"}) == "{'key': 'str(3)'}"
@@ -0,0 +1,33 @@
+import numpy as np
+
+from app.suggestions import build_follow_matrix, rank_friends_of_friends
+
+
+def test_rank_friends_of_friends():
+    # 1 -> 2, 1 -> 3, 2 -> 4, 3 -> 4, 3 -> 5, 2 -> 1
+    follower_ids = np.array([1, 1, 2, 3, 3, 2])
+    followed_ids = np.array([2, 3, 4, 4, 5, 1])
+    matrix, user_ids = build_follow_matrix(follower_ids, followed_ids)
+
+    rows, cols, scores, ranks = rank_friends_of_friends(matrix, top_n=10)
+    suggestions = {}
+    for row, col, score in zip(rows, cols, scores):
+        suggestions.setdefault(int(user_ids[row]), []).append(
+            (int(user_ids[col]), int(score))
+        )
+
+    # Для 1: юзер 4 через 2 и 3, юзер 5 через 3; себя и 2, 3 не предлагаем
+    assert suggestions[1] == [(4, 2), (5, 1)]
+    # Для 2: юзер 3 через 1
+    assert suggestions[2] == [(3, 1)]
+
+
+def test_rank_friends_of_friends_top_n():
+    follower_ids = np.array([1, 1, 1, 2, 3, 4])
+    followed_ids = np.array([2, 3, 4, 5, 6, 7])
+    matrix, user_ids = build_follow_matrix(follower_ids, followed_ids)
+
+    rows, cols, scores, ranks = rank_friends_of_friends(matrix, top_n=2)
+
+    assert [int(user_ids[row]) for row in rows] == [1, 1]
+    assert ranks.tolist() == [0, 1]
@@ -0,0 +1,15 @@
+from app.tags import extract_hashtags, extract_mentions, normalize_tag
+
+
+def test_extract_hashtags_normalized_and_unique():
+    text = "#Python и #python, #ПиТон! mail@host.com#not a#b ##double"
+    assert extract_hashtags(text) == ["python", "питон"]
+
+
+def test_extract_mentions():
+    text = "@alice привет, @bob_2 и снова @alice; me@example.com"
+    assert extract_mentions(text) == ["alice", "bob_2"]
+
+
+def test_normalize_tag():
+    assert normalize_tag("#FastAPI") == "fastapi"
@@ -0,0 +1,50 @@
+from app.timeline_cache import FEED_KEY, TimelineCache
+
+
+def test_timeline_is_truncated_and_compact():
+    cache = TimelineCache("test-timelines-truncate", max_bytes=10**6, length=100)
+    cache.set("global", range(1000, 0, -1))
+
+    ids = cache.get("global")
+    assert len(ids) == 100
+    assert ids[0] == 1000
+    assert ids.itemsize == 8
+    # 100 id в array('q') занимают порядка 1 КБ вместе с заголовками
+    assert cache.stats()["bytes"] < 2000
+
+
+def test_eviction_by_bytes_is_lru():
+    cache = TimelineCache("test-timelines-lru", max_bytes=2500, length=100)
+    cache.set(1, range(100))
+    cache.set(2, range(100))
+    cache.get(1)
+    cache.set(3, range(100))
+
+    assert cache.get(2) is None
+    assert cache.get(1) is not None
+    assert cache.stats()["bytes"] <= 2500
+    assert cache.stats()["evictions"] == 1
+
+
+def test_timeline_loaded_before_invalidation_is_not_stored():
+    cache = TimelineCache("test-timelines-stale", max_bytes=10**6)
+    generation = cache.generation
+    cache.on_invalidation(None)
+    cache.set("global", [3, 2, 1], generation)
+
+    assert cache.get("global") is None
+
+
+def test_new_tweets_are_prepended_to_feed():
+    cache = TimelineCache("test-timelines-ring", max_bytes=10**6, length=5)
+    cache.set(FEED_KEY, [10, 8, 6, 4, 2])
+    # Твиты параллельных транзакций — не по порядку id, один уже в ленте
+    cache.on_invalidation(["11", "9", "12", "10"])
+
+    assert list(cache.get(FEED_KEY)) == [12, 11, 10, 9, 8]
+
+    # Лента, загружавшаяся до нового твита, не сохраняется
+    generation = cache.generation
+    cache.on_invalidation(["13"])
+    cache.set("other", [1], generation)
+    assert cache.get("other") is None
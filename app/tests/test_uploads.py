@@ -0,0 +1,76 @@
+import os
+import time
+
+import pytest
+from fastapi.exceptions import HTTPException
+
+from app import uploads
+from app.uploads import (
+    collect_stale_uploads,
+    create_upload,
+    finish_upload,
+    get_upload,
+    merge_range,
+    parse_content_range,
+    write_chunk,
+)
+
+
+def test_merge_range():
+    ranges = merge_range([], 10, 20)
+    ranges = merge_range(ranges, 0, 5)
+    assert ranges == [[0, 5], [10, 20]]
+    assert merge_range(ranges, 5, 10) == [[0, 20]]
+    assert merge_range(ranges, 12, 15) == [[0, 5], [10, 20]]
+
+
+def test_parse_content_range():
+    assert parse_content_range("bytes 0-99/1000", 1000) == (0, 100)
+    assert parse_content_range("bytes 900-999/*", 1000) == (900, 1000)
+    for header in (None, "bytes=0-99", "bytes 0-1000/1000", "bytes 0-9/20"):
+        with pytest.raises(HTTPException):
+            parse_content_range(header, 1000)
+
+
+@pytest.mark.asyncio
+async def test_stale_uploads_are_collected(monkeypatch, tmp_path):
+    monkeypatch.setattr(uploads, "get_media_dir", lambda: str(tmp_path))
+    stale = await create_upload(1, "a.png", 10)
+    fresh = await create_upload(1, "b.png", 10)
+
+    old = time.time() - 3600
+    for name in os.listdir(uploads.get_upload_dir()):
+        if name.startswith(stale["id"]):
+            os.utime(os.path.join(uploads.get_upload_dir(), name), (old, old))
+
+    assert await collect_stale_uploads(max_age=60) == 1
+    remaining = {name.split(".")[0] for name in os.listdir(uploads.get_upload_dir())}
+    assert remaining == {fresh["id"]}
+
+
+async def _body(data: bytes):
+    yield data
+
+
+@pytest.mark.asyncio
+async def test_failed_registration_keeps_upload(monkeypatch, tmp_path):
+    monkeypatch.setattr(uploads, "get_media_dir", lambda: str(tmp_path))
+    meta = await create_upload(1, "a.png", 4)
+    meta = await write_chunk(meta, 0, 4, _body(b"data"))
+
+    async def failing(media_filename: str):
+        assert (tmp_path / media_filename).read_bytes() == b"data"
+        raise RuntimeError("insert failed")
+
+    with pytest.raises(RuntimeError):
+        await finish_upload(meta, failing)
+    # Файл вернулся в сессию, и завершение можно повторить
+    assert os.listdir(tmp_path) == [".uploads"]
+    meta = await get_upload(meta["id"], 1)
+
+    async def register(media_filename: str) -> str:
+        return media_filename
+
+    media_filename = await finish_upload(meta, register)
+    assert (tmp_path / media_filename).read_bytes() == b"data"
+    assert os.listdir(uploads.get_upload_dir()) == []
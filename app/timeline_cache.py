@@ -0,0 +1,214 @@
+"""
+Компактный кэш лент: для каждой ленты хранятся только id последних твитов
+в array('q') (8 байт на твит), тела твитов — в отдельном кэше по id.
+Размер кэша лент ограничен суммарным объемом памяти, а не числом лент;
+при превышении вытесняются давно не читавшиеся ленты.
+
+Общая лента работает как кольцевой буфер: id нового твита (событие
+"feed" с ключами) добавляется в начало, самые старые id за пределами
+length отбрасываются. Полный сброс (событие без ключей) — только при
+удалении твитов и импорте.
+"""
+
+import heapq
+import os
+import sys
+from array import array
+from collections import OrderedDict
+from typing import Hashable, Iterable, Iterator
+
+from .cache import AsyncLRUCache, SnapshotSection, caches
+from .media import MEDIA_URL_SECRET, MEDIA_URL_TTL
+
+TIMELINE_LENGTH = int(os.getenv("TIMELINE_LENGTH", "1000"))
+TIMELINE_CACHE_BYTES = int(os.getenv("TIMELINE_CACHE_BYTES", str(64 * 1024 * 1024)))
+TWEET_BODY_CACHE_SIZE = int(os.getenv("TWEET_BODY_CACHE_SIZE", "50000"))
+# Ключ общей ленты в кэше лент
+FEED_KEY = "global"
+
+
+def _load_ids(view: memoryview) -> array:
+    ids = array("q")
+    ids.frombytes(view)
+    return ids
+
+
+class TimelineEntry:
+    """
+    Лента: id твитов от новых к старым и занимаемый объем
+    """
+
+    __slots__ = ("ids", "nbytes")
+
+    def __init__(self, key: Hashable, ids: array):
+        self.ids = ids
+        self.nbytes = sys.getsizeof(ids) + sys.getsizeof(key) + sys.getsizeof(self)
+
+
+class TimelineCache:
+    """
+    LRU-кэш лент с ограничением по байтам
+    """
+
+    # Ленты не устаревают по времени, только по инвалидации
+    ttl: float | None = None
+
+    def __init__(self, name: str, max_bytes: int, length: int = TIMELINE_LENGTH):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.length = length
+        self._data: OrderedDict[Hashable, TimelineEntry] = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+        self.generation = 0
+        # Еще не прочитанные ленты снимка, загруженного при старте
+        self.snapshot: SnapshotSection | None = None
+        self.restored = 0
+        caches[name] = self
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> array | None:
+        entry = self._data.get(key)
+        if entry is None and self._restore(key):
+            entry = self._data[key]
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._data.move_to_end(key)
+        return entry.ids
+
+    def set(
+        self, key: Hashable, tweet_ids: Iterable[int], generation: int | None = None
+    ):
+        """
+        Сохранение ленты (лишние id сверх length отбрасываются)
+        :param key: Ключ ленты
+        :param tweet_ids: ID твитов от новых к старым
+        :param generation: Значение generation до загрузки ленты; если с тех
+            пор была инвалидация, лента не сохраняется
+        :return: Ничего не возвращает
+        """
+        if generation is not None and generation != self.generation:
+            return
+        ids = array("q", tweet_ids)
+        del ids[self.length :]
+        self._remove(key)
+        entry = TimelineEntry(key, ids)
+        self._data[key] = entry
+        self.nbytes += entry.nbytes
+        while self.nbytes > self.max_bytes and len(self._data) > 1:
+            _, evicted = self._data.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+            self.evictions += 1
+
+    def _restore(self, key: Hashable) -> bool:
+        if self.snapshot is None:
+            return False
+        ids = self.snapshot.pop(key)
+        if ids is None:
+            return False
+        self.set(key, ids)
+        self.restored += 1
+        return True
+
+    def _remove(self, key: Hashable):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.nbytes -= entry.nbytes
+
+    def invalidate(self, key: Hashable):
+        self.invalidations += 1
+        self.generation += 1
+        self._remove(key)
+        if self.snapshot is not None:
+            self.snapshot.discard(key)
+
+    def prepend(self, key: Hashable, tweet_ids: Iterable[int]):
+        """
+        Добавление новых твитов в начало закэшированной ленты
+        :param key: Ключ ленты
+        :param tweet_ids: ID новых твитов
+        :return: Ничего не возвращает
+        """
+        # Лента, загружаемая в этот момент, могла не увидеть новые твиты
+        self.generation += 1
+        entry = self._data.get(key)
+        if entry is None:
+            if self.snapshot is not None:
+                self.snapshot.discard(key)
+            return
+        present = set(entry.ids)
+        new_ids = sorted({i for i in tweet_ids if i not in present}, reverse=True)
+        if not new_ids:
+            return
+        # Твиты параллельных транзакций могут прийти не по порядку id
+        self.set(key, heapq.merge(new_ids, entry.ids, reverse=True))
+
+    def clear(self):
+        self.invalidations += 1
+        self.generation += 1
+        self._data.clear()
+        self.nbytes = 0
+        self.snapshot = None
+
+    def on_invalidation(self, keys: list[str] | None):
+        """
+        Обработчик событий шины инвалидации общей ленты
+        :param keys: ID новых твитов или None для полного сброса
+        :return: Ничего не возвращает
+        """
+        if keys is None:
+            self.clear()
+        else:
+            self.prepend(FEED_KEY, (int(key) for key in keys))
+
+    def snapshot_items(self) -> Iterator[tuple[Hashable, bytes]]:
+        """
+        Записи для снимка на диске: ключ ленты и id твитов (int64)
+        :return: Итератор пар (ключ, байты)
+        """
+        if self.snapshot is not None:
+            yield from self.snapshot.raw_items()
+        for key, entry in list(self._data.items()):
+            yield key, entry.ids.tobytes()
+
+    def attach_snapshot(self, buffer: memoryview, entries: dict):
+        """
+        Подключение лент из снимка
+        :param buffer: Буфер с данными снимка
+        :param entries: Ключ -> (смещение, длина)
+        :return: Ничего не возвращает
+        """
+        self.snapshot = SnapshotSection(buffer, dict(entries), _load_ids)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "bytes": self.nbytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "evictions": self.evictions,
+            "restored": self.restored,
+            "snapshot": len(self.snapshot) if self.snapshot is not None else 0,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+timeline_cache = TimelineCache("timelines", TIMELINE_CACHE_BYTES)
+# Подписанные ссылки на медиа в теле твита действуют ограниченное время:
+# тело должно устаревать раньше, чем истекает срок ссылки (см. media_url)
+tweet_body_cache = AsyncLRUCache(
+    "tweet_bodies",
+    TWEET_BODY_CACHE_SIZE,
+    key_type=int,
+    ttl=MEDIA_URL_TTL / 4 if MEDIA_URL_SECRET else None,
+)
@@ -0,0 +1,330 @@
+"""
+Докачиваемая загрузка медиафайлов по частям.
+
+Сессия загрузки — два файла в <медиа>/.uploads: выделенный заранее <id>.part
+размером с итоговый файл и метаданные <id>.json со списком полученных
+диапазонов байт. Части (PUT с Content-Range) пишутся сразу по своему
+смещению, поэтому могут приходить в любом порядке, повторно и в разные
+воркеры (при общей директории медиа). После получения всех байт файл
+переносится в директорию медиа и регистрируется через save_media_to_db;
+метаданные сессии удаляются только после регистрации, а при ее ошибке файл
+возвращается на место и завершение можно повторить.
+Сессии без активности дольше UPLOAD_SESSION_TTL удаляются фоновой задачей.
+"""
+
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import re
+import time
+import uuid
+from typing import AsyncIterator, Awaitable, Callable, TypedDict, TypeVar
+
+from fastapi.exceptions import HTTPException
+
+from .crud import get_media_dir, new_media_filename
+from .periodic import PeriodicTask
+
+UPLOAD_MAX_SIZE = int(os.getenv("UPLOAD_MAX_SIZE", str(100 * 1024 * 1024)))
+# Рекомендуемый клиенту размер части
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+UPLOAD_SESSION_TTL = float(os.getenv("UPLOAD_SESSION_TTL", str(24 * 3600)))
+UPLOAD_GC_INTERVAL = float(os.getenv("UPLOAD_GC_INTERVAL", "600"))
+UPLOAD_WRITE_BUFFER = 1024 * 1024
+
+T = TypeVar("T")
+
+
+class UploadMeta(TypedDict):
+    id: str
+    user_id: int
+    filename: str
+    size: int
+    # Полученные полуинтервалы байт [start, end)
+    ranges: list[list[int]]
+    created_at: float
+
+
+_UPLOAD_ID_RE = re.compile(r"[0-9a-f]{32}")
+_CONTENT_RANGE_RE = re.compile(r"bytes (\d+)-(\d+)/(\d+|\*)")
+
+
+def get_upload_dir() -> str:
+    return os.path.join(get_media_dir(), ".uploads")
+
+
+def _paths(upload_id: str) -> tuple[str, str]:
+    base = os.path.join(get_upload_dir(), upload_id)
+    return f"{base}.part", f"{base}.json"
+
+
+def merge_range(ranges: list[list[int]], start: int, end: int) -> list[list[int]]:
+    """
+    Добавление полуинтервала [start, end) к отсортированному списку
+    непересекающихся полуинтервалов
+    :param ranges: Полученные диапазоны
+    :param start: Начало нового диапазона
+    :param end: Конец нового диапазона (не включительно)
+    :return: Новый список диапазонов
+    """
+    merged: list[list[int]] = []
+    for range_start, range_end in sorted(ranges + [[start, end]]):
+        if merged and range_start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], range_end)
+        else:
+            merged.append([range_start, range_end])
+    return merged
+
+
+def parse_content_range(header: str | None, size: int) -> tuple[int, int]:
+    """
+    Разбор заголовка Content-Range части
+    :param header: Значение заголовка, например "bytes 0-1023/4096"
+    :param size: Размер файла, объявленный при создании сессии
+    :return: Полуинтервал (start, end) байт части
+    """
+    match = _CONTENT_RANGE_RE.fullmatch((header or "").strip())
+    if not match:
+        raise HTTPException(status_code=400, detail="Invalid Content-Range header")
+    start, last = int(match[1]), int(match[2])
+    total = match[3]
+    if start > last or last >= size or (total != "*" and int(total) != size):
+        raise HTTPException(status_code=416, detail="Range outside of upload size")
+    return start, last + 1
+
+
+def _read_meta(upload_id: str) -> UploadMeta | None:
+    _, meta_path = _paths(upload_id)
+    try:
+        with open(meta_path) as meta_file:
+            return json.load(meta_file)
+    except FileNotFoundError:
+        return None
+
+
+def _write_meta(meta: UploadMeta):
+    _, meta_path = _paths(meta["id"])
+    tmp_path = f"{meta_path}.tmp"
+    with open(tmp_path, "w") as meta_file:
+        json.dump(meta, meta_file)
+    # Атомарная замена: читатели видят либо старые, либо новые метаданные
+    os.replace(tmp_path, meta_path)
+
+
+def _create(user_id: int, filename: str, size: int) -> UploadMeta:
+    os.makedirs(get_upload_dir(), exist_ok=True)
+    meta: UploadMeta = {
+        "id": uuid.uuid4().hex,
+        "user_id": user_id,
+        "filename": filename,
+        "size": size,
+        "ranges": [],
+        "created_at": time.time(),
+    }
+    part_path, _ = _paths(meta["id"])
+    with open(part_path, "wb") as part_file:
+        if hasattr(os, "posix_fallocate"):
+            os.posix_fallocate(part_file.fileno(), 0, size)
+        else:  # pragma: no cover - не Linux
+            part_file.truncate(size)
+    _write_meta(meta)
+    return meta
+
+
+async def create_upload(user_id: int, filename: str, size: int) -> UploadMeta:
+    """
+    Создание сессии загрузки с заранее выделенным файлом
+    :param user_id: ID пользователя
+    :param filename: Имя файла у клиента
+    :param size: Размер файла в байтах
+    :return: Метаданные сессии
+    """
+    if size > UPLOAD_MAX_SIZE:
+        raise HTTPException(status_code=413, detail="File is too large")
+    return await asyncio.to_thread(_create, user_id, filename, size)
+
+
+async def get_upload(upload_id: str, user_id: int) -> UploadMeta:
+    """
+    Получение метаданных сессии загрузки пользователя
+    :param upload_id: ID сессии
+    :param user_id: ID пользователя
+    :return: Метаданные сессии
+    """
+    meta = None
+    if _UPLOAD_ID_RE.fullmatch(upload_id):
+        meta = await asyncio.to_thread(_read_meta, upload_id)
+    if meta is None or meta["user_id"] != user_id:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return meta
+
+
+def _record_range(upload_id: str, start: int, end: int) -> UploadMeta:
+    part_path, _ = _paths(upload_id)
+    with open(part_path, "rb") as part_file:
+        # Блокировка на .part: у файла метаданных меняется inode при замене
+        fcntl.flock(part_file, fcntl.LOCK_EX)
+        meta = _read_meta(upload_id)
+        if meta is None:
+            raise FileNotFoundError(upload_id)
+        meta["ranges"] = merge_range(meta["ranges"], start, end)
+        _write_meta(meta)
+    return meta
+
+
+async def write_chunk(
+    meta: UploadMeta, start: int, end: int, chunks: AsyncIterator[bytes]
+) -> UploadMeta:
+    """
+    Запись части файла по ее смещению
+    :param meta: Метаданные сессии
+    :param start: Начало части
+    :param end: Конец части (не включительно)
+    :param chunks: Асинхронный итератор байт тела запроса
+    :return: Обновленные метаданные сессии
+    """
+    part_path, _ = _paths(meta["id"])
+    try:
+        fd = os.open(part_path, os.O_WRONLY)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+
+    offset = start
+    buffer = bytearray()
+    try:
+        async for chunk in chunks:
+            if offset + len(buffer) + len(chunk) > end:
+                raise HTTPException(
+                    status_code=400, detail="Chunk is longer than Content-Range"
+                )
+            buffer += chunk
+            if len(buffer) >= UPLOAD_WRITE_BUFFER:
+                await asyncio.to_thread(os.pwrite, fd, bytes(buffer), offset)
+                offset += len(buffer)
+                buffer.clear()
+        if buffer:
+            await asyncio.to_thread(os.pwrite, fd, bytes(buffer), offset)
+            offset += len(buffer)
+    finally:
+        os.close(fd)
+
+    if offset != end:
+        raise HTTPException(
+            status_code=400, detail="Chunk is shorter than Content-Range"
+        )
+    try:
+        return await asyncio.to_thread(_record_range, meta["id"], start, end)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+
+
+def upload_status(meta: UploadMeta) -> dict:
+    return {
+        "upload_id": meta["id"],
+        "size": meta["size"],
+        "received": meta["ranges"],
+        "complete": meta["ranges"] == [[0, meta["size"]]],
+    }
+
+
+def _finish(upload_id: str) -> str:
+    part_path, _ = _paths(upload_id)
+    with open(part_path, "rb") as part_file:
+        fcntl.flock(part_file, fcntl.LOCK_EX)
+        meta = _read_meta(upload_id)
+        if meta is None:
+            raise FileNotFoundError(upload_id)
+        if meta["ranges"] != [[0, meta["size"]]]:
+            raise HTTPException(status_code=409, detail="Upload is incomplete")
+        media_filename = new_media_filename(meta["filename"])
+        os.replace(part_path, os.path.join(get_media_dir(), media_filename))
+    return media_filename
+
+
+def _unfinish(upload_id: str, media_filename: str):
+    part_path, _ = _paths(upload_id)
+    os.replace(os.path.join(get_media_dir(), media_filename), part_path)
+
+
+def _remove_meta(upload_id: str):
+    _, meta_path = _paths(upload_id)
+    try:
+        os.remove(meta_path)
+    except FileNotFoundError:
+        pass
+
+
+async def finish_upload(meta: UploadMeta, register: Callable[[str], Awaitable[T]]) -> T:
+    """
+    Перенос полностью полученного файла в директорию медиа и его регистрация.
+    Сессия удаляется только после успешной регистрации; при ошибке файл
+    возвращается в сессию, и клиент может повторить завершение
+    :param meta: Метаданные сессии
+    :param register: Регистрация файла по имени (например, запись в media)
+    :return: Результат register
+    """
+    try:
+        media_filename = await asyncio.to_thread(_finish, meta["id"])
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    try:
+        result = await register(media_filename)
+    except BaseException:
+        await asyncio.to_thread(_unfinish, meta["id"], media_filename)
+        raise
+    await asyncio.to_thread(_remove_meta, meta["id"])
+    return result
+
+
+def _remove_session(upload_id: str):
+    for path in _paths(upload_id):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+async def abort_upload(meta: UploadMeta):
+    await asyncio.to_thread(_remove_session, meta["id"])
+
+
+def _collect_stale(max_age: float) -> int:
+    upload_dir = get_upload_dir()
+    try:
+        names = os.listdir(upload_dir)
+    except FileNotFoundError:
+        return 0
+
+    deadline = time.time() - max_age
+    removed = 0
+    for upload_id in {os.path.splitext(name)[0] for name in names}:
+        if not _UPLOAD_ID_RE.fullmatch(upload_id):
+            continue
+        # Активность сессии — время последней записи любого из ее файлов
+        mtimes = []
+        for path in _paths(upload_id):
+            try:
+                mtimes.append(os.stat(path).st_mtime)
+            except FileNotFoundError:
+                pass
+        if mtimes and max(mtimes) < deadline:
+            _remove_session(upload_id)
+            removed += 1
+    return removed
+
+
+async def collect_stale_uploads(max_age: float = UPLOAD_SESSION_TTL) -> int:
+    """
+    Удаление заброшенных сессий загрузки
+    :param max_age: Время без активности в секундах
+    :return: Количество удаленных сессий
+    """
+    removed = await asyncio.to_thread(_collect_stale, max_age)
+    if removed:
+        logging.info("Удалено заброшенных загрузок: %s", removed)
+    return removed
+
+
+upload_collector = PeriodicTask("upload_gc", UPLOAD_GC_INTERVAL, collect_stale_uploads)
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Сравнение обычной и секционированной по HASH(tweet_id) таблицы likes на
+синтетических данных: запросы путей лайка (проверка лайка, лайки читателя
+на странице ленты, удаление лайков твита) и VACUUM после массового
+удаления — всей таблицы против одной секции, как его выполняет autovacuum.
+
+Данные создаются в схемах bench_heap и bench_part и удаляются по окончании.
+
+Запуск: python bench_partitioning.py [--tweets 1000000] [--likes 5000000]
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from sqlalchemy import text
+
+from app.database import engine
+
+SCHEMAS = ("bench_heap", "bench_part")
+FEED_PAGE_SIZE = 50
+
+
+async def create_schema(conn, schema: str, partitioned: bool, args):
+    await conn.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+    await conn.execute(text(f"CREATE SCHEMA {schema}"))
+    await conn.execute(text(f"SET search_path TO {schema}"))
+
+    if partitioned:
+        await conn.execute(
+            text(
+                "CREATE TABLE likes (id int NOT NULL, user_id int NOT NULL, "
+                "tweet_id int NOT NULL, PRIMARY KEY (id, tweet_id)) "
+                "PARTITION BY HASH (tweet_id)"
+            )
+        )
+        for remainder in range(args.partitions):
+            await conn.execute(
+                text(
+                    f"CREATE TABLE likes_p{remainder} PARTITION OF likes FOR VALUES "
+                    f"WITH (MODULUS {args.partitions}, REMAINDER {remainder})"
+                )
+            )
+    else:
+        await conn.execute(
+            text(
+                "CREATE TABLE likes (id int PRIMARY KEY, user_id int NOT NULL, "
+                "tweet_id int NOT NULL)"
+            )
+        )
+
+    await conn.execute(
+        text(
+            "INSERT INTO likes SELECT g, g % 10000, 1 + (g::bigint * 7919) % :tweets "
+            "FROM generate_series(1, :likes) g"
+        ),
+        {"tweets": args.tweets, "likes": args.likes},
+    )
+    await conn.execute(text("CREATE INDEX ON likes (tweet_id, user_id)"))
+    await conn.execute(text("CREATE INDEX ON likes (user_id, tweet_id)"))
+    await conn.execute(text("ANALYZE likes"))
+    await conn.commit()
+
+
+async def measure(conn, statement: str, params_factory, repeats: int) -> float:
+    timings = []
+    for _ in range(repeats):
+        params = params_factory()
+        started_at = time.perf_counter()
+        await conn.execute(text(statement), params)
+        timings.append((time.perf_counter() - started_at) * 1000)
+    return statistics.median(timings)
+
+
+async def bench_schema(conn, schema: str, args) -> dict:
+    await conn.execute(text(f"SET search_path TO {schema}"))
+    results = {
+        "like_check_ms": await measure(
+            conn,
+            "SELECT 1 FROM likes WHERE tweet_id = :tweet_id AND user_id = :user_id",
+            lambda: {
+                "tweet_id": random.randint(1, args.tweets),
+                "user_id": random.randint(0, 9999),
+            },
+            args.repeats,
+        ),
+        # Лайки читателя на странице ленты (hydrate_tweets)
+        "viewer_likes_ms": await measure(
+            conn,
+            "SELECT tweet_id FROM likes "
+            "WHERE tweet_id = ANY(:tweet_ids) AND user_id = :user_id",
+            lambda: {
+                "tweet_ids": random.sample(range(1, args.tweets), FEED_PAGE_SIZE),
+                "user_id": random.randint(0, 9999),
+            },
+            args.repeats,
+        ),
+        # Удаление твита (delete_tweet_from_db); транзакция затем откатывается
+        "delete_likes_ms": await measure(
+            conn,
+            "DELETE FROM likes WHERE tweet_id = :tweet_id",
+            lambda: {"tweet_id": random.randint(1, args.tweets)},
+            args.repeats,
+        ),
+    }
+    await conn.rollback()
+
+    # Лайки 5% твитов удаляются, затем vacuum; autovacuum обрабатывает
+    # секции по отдельности, поэтому для секционированной схемы — одна секция
+    await conn.execute(text(f"SET search_path TO {schema}"))
+    await conn.execute(text("DELETE FROM likes WHERE tweet_id % 20 = 0"))
+    await conn.commit()
+    target = "likes_p0" if schema == "bench_part" else "likes"
+    # VACUUM не выполняется внутри транзакции
+    async with engine.connect() as vacuum_conn:
+        vacuum_conn = await vacuum_conn.execution_options(isolation_level="AUTOCOMMIT")
+        started_at = time.perf_counter()
+        await vacuum_conn.execute(text(f"VACUUM {schema}.{target}"))
+        results["vacuum_ms"] = (time.perf_counter() - started_at) * 1000
+    return {name: round(value, 3) for name, value in results.items()}
+
+
+async def main(args):
+    # Журнал SQL исказил бы замеры
+    engine.sync_engine.echo = False
+    async with engine.connect() as conn:
+        for schema in SCHEMAS:
+            await create_schema(conn, schema, schema == "bench_part", args)
+        await conn.commit()
+        try:
+            for schema in SCHEMAS:
+                print(schema, await bench_schema(conn, schema, args))
+        finally:
+            for schema in SCHEMAS:
+                await conn.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+            await conn.commit()
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк секционирования likes")
+    parser.add_argument("--tweets", type=int, default=1_000_000)
+    parser.add_argument("--likes", type=int, default=5_000_000)
+    parser.add_argument("--partitions", type=int, default=8)
+    parser.add_argument("--repeats", type=int, default=200)
+    asyncio.run(main(parser.parse_args()))
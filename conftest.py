@@ -1,13 +1,17 @@
-import asyncio
-
-import pytest
+import sys
 
 TESTING = False
 
+# Приложение импортирует этот модуль ради флага TESTING; pytest (тяжелый импорт)
+# нужен только при запуске тестов, когда он уже загружен
+if "pytest" in sys.modules:
+    import asyncio
+
+    import pytest
 
-@pytest.fixture(scope="session")
-def event_loop():
-    """Create an event loop for the session scope."""
-    loop = asyncio.new_event_loop()
-    yield loop
-    loop.close()
+    @pytest.fixture(scope="session")
+    def event_loop():
+        """Create an event loop for the session scope."""
+        loop = asyncio.new_event_loop()
+        yield loop
+        loop.close()
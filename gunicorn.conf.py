@@ -0,0 +1,40 @@
+"""
+Конфигурация многопроцессного запуска: gunicorn с воркерами uvicorn.
+
+Запуск: gunicorn app.main:app -c gunicorn.conf.py
+"""
+
+import multiprocessing
+import os
+
+# Соединения с БД одного воркера: пул, его переполнение и слушатель шины
+# инвалидации (значения по умолчанию — как в app/database.py)
+CONNECTIONS_PER_WORKER = (
+    int(os.getenv("DB_POOL_SIZE", "5")) + int(os.getenv("DB_MAX_OVERFLOW", "10")) + 1
+)
+# max_connections Postgres (по умолчанию 100) за вычетом запаса на
+# администрирование, миграции и фоновые скрипты
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "100"))
+DB_RESERVED_CONNECTIONS = int(os.getenv("DB_RESERVED_CONNECTIONS", "10"))
+
+
+def default_workers() -> int:
+    # Число ядер, но не больше, чем помещается в max_connections
+    fits = (DB_MAX_CONNECTIONS - DB_RESERVED_CONNECTIONS) // CONNECTIONS_PER_WORKER
+    return max(1, min(multiprocessing.cpu_count(), fits))
+
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY") or default_workers())
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Приложение импортируется в каждом воркере отдельно: пул соединений и слушатель
+# шины инвалидации не должны разделяться между процессами после fork
+preload_app = False
+
+timeout = int(os.getenv("WORKER_TIMEOUT", "30"))
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("KEEPALIVE", "5"))
+# Периодический перезапуск воркеров ограничивает рост памяти
+max_requests = int(os.getenv("MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", "0"))
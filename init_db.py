@@ -1,25 +1,20 @@
 #!/usr/bin/env python3
 import logging
 
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
-from sqlalchemy.orm import sessionmaker
-
-from app.database import DATABASE_URL
+from app.database import SessionLocal, engine
 from app.models import Base, Tweet, User
-
-# Создание асинхронного движка и сессии
-engine = create_async_engine(DATABASE_URL, echo=True)
-SessionLocal = sessionmaker(
-    bind=engine,
-    class_=AsyncSession,
-    expire_on_commit=False,
-)
+from app.partitioning import is_partitioned
 
 logging.basicConfig(level=logging.INFO)
 
 
 async def init_db():
     async with engine.begin() as conn:
+        # После python -m app.partitioning migrate база рабочая: пересоздание
+        # таблиц вернуло бы несекционированную схему и удалило данные
+        if await is_partitioned(conn, "likes"):
+            logging.info("likes секционирована, инициализация БД пропущена")
+            return
         # Удаление существующих таблиц
         await conn.run_sync(Base.metadata.drop_all)
         # Создание новых таблиц
@@ -64,7 +59,12 @@ async def init_db():
             logging.info(f"Создан tweet для юзера {tweet.author_id} ")
 
 
+async def main():
+    await init_db()
+    await engine.dispose()
+
+
 if __name__ == "__main__":
     import asyncio
 
-    asyncio.run(init_db())
+    asyncio.run(main())